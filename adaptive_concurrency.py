@@ -0,0 +1,214 @@
+"""
+自適應（AIMD）併發控制
+
+依主機分別調整同時進行的請求數：延遲與錯誤率正常時逐步加一，
+遇到 429/5xx/逾時則減半。圖片下載與批次頁面爬取都可以共用。
+"""
+
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+from crawl_metrics import record_crawl_result, record_error
+
+# 視為「主機過載」而需要退讓的 HTTP 狀態碼
+BACKOFF_STATUSES = {429, 500, 502, 503, 504}
+
+
+def host_key(url):
+    """以主機名稱作為併發控制的單位"""
+    return urlparse(url).hostname or url
+
+
+class _HostState:
+    """單一主機的併發狀態與統計"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.successes_since_increase = 0
+        self.last_decrease = 0.0
+        # 依請求種類（例如探測與完整下載）分別追蹤基準延遲
+        self.latency_baselines = {}
+        self.stats = {
+            "requests": 0,
+            "successes": 0,
+            "backoffs": 0,
+            "increases": 0,
+            "decreases": 0,
+            "max_in_flight": 0,
+            "max_limit": limit,
+        }
+        self.decisions = []
+
+
+class _Slot:
+    """取得一個併發名額；離開時自動回報結果"""
+
+    def __init__(self, limiter, key, kind):
+        self.limiter = limiter
+        self.key = key
+        self.kind = kind
+        self.status = None
+        self.failure = None
+        self.failure_overloaded = False
+        self.start = None
+
+    def report_status(self, status):
+        """回報 HTTP 狀態碼（429/5xx 會觸發退讓）"""
+        self.status = status
+
+    def report_failure(self, reason, overloaded=True):
+        """回報沒有拋出例外的失敗（例如導覽逾時的 CrawlResult）；
+        overloaded=False 表示與主機負載無關（例如 404），不退讓也不算成功"""
+        self.failure = reason
+        self.failure_overloaded = overloaded
+
+    async def __aenter__(self):
+        state = self.limiter._state(self.key)
+        async with state.condition:
+            await state.condition.wait_for(lambda: state.in_flight < state.limit)
+            state.in_flight += 1
+            state.stats["requests"] += 1
+            state.stats["max_in_flight"] = max(state.stats["max_in_flight"], state.in_flight)
+        self.start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        latency = time.monotonic() - self.start
+        overloaded = (
+            exc_type is not None and issubclass(exc_type, (asyncio.TimeoutError, aiohttp.ClientError))
+        ) or self.status in BACKOFF_STATUSES or self.failure_overloaded
+
+        state = self.limiter._state(self.key)
+        async with state.condition:
+            state.in_flight -= 1
+            if overloaded:
+                if self.status in BACKOFF_STATUSES:
+                    reason = f"HTTP {self.status}"
+                elif exc_type is not None:
+                    reason = exc_type.__name__
+                else:
+                    reason = self.failure
+                self.limiter._on_backoff(state, reason)
+            elif exc_type is None and self.failure is None:
+                self.limiter._on_success(state, latency, self.kind)
+            state.condition.notify_all()
+        return False
+
+
+class AdaptiveConcurrencyLimiter:
+    """依主機分別進行加法增加、乘法減少的併發控制器"""
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=32,
+                 decrease_factor=0.5, latency_tolerance=3.0, cooldown=1.0):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.hosts = {}
+
+    def _state(self, key):
+        if key not in self.hosts:
+            self.hosts[key] = _HostState(self.initial_limit)
+        return self.hosts[key]
+
+    def slot(self, url, kind="default"):
+        """取得該 URL 所屬主機的併發名額：async with limiter.slot(url) as slot；
+        kind 區分延遲差異很大的請求（例如 "probe" 與 "download"），各自比較基準延遲"""
+        return _Slot(self, host_key(url), kind)
+
+    def _record(self, state, action, reason):
+        state.decisions.append({
+            "time": round(time.time(), 3),
+            "action": action,
+            "limit": state.limit,
+            "reason": reason,
+        })
+        # 只保留最近的決策紀錄
+        del state.decisions[:-100]
+
+    def _on_success(self, state, latency, kind="default"):
+        state.stats["successes"] += 1
+
+        # 以指數移動平均追蹤基準延遲，延遲明顯變長也視為壅塞；
+        # 基準一律更新，請求本身變慢時基準會跟上，不會一直退讓到最低
+        baseline = state.latency_baselines.get(kind)
+        state.latency_baselines[kind] = latency if baseline is None else 0.9 * baseline + 0.1 * latency
+        if baseline is not None and latency > baseline * self.latency_tolerance:
+            self._on_backoff(state, f"延遲 {latency:.2f}s")
+            return
+
+        # 每完成一個「視窗」（等於目前上限）的成功請求就加一
+        state.successes_since_increase += 1
+        if state.successes_since_increase >= state.limit and state.limit < self.max_limit:
+            state.limit += 1
+            state.successes_since_increase = 0
+            state.stats["increases"] += 1
+            state.stats["max_limit"] = max(state.stats["max_limit"], state.limit)
+            self._record(state, "increase", "healthy")
+
+    def _on_backoff(self, state, reason):
+        state.stats["backoffs"] += 1
+        now = time.monotonic()
+        # 同一波失敗只減一次，避免上限瞬間掉到最低
+        if now - state.last_decrease < self.cooldown:
+            return
+        new_limit = max(self.min_limit, int(state.limit * self.decrease_factor))
+        if new_limit < state.limit:
+            state.limit = new_limit
+            state.stats["decreases"] += 1
+            self._record(state, "decrease", reason)
+        state.last_decrease = now
+        state.successes_since_increase = 0
+
+    def snapshot(self):
+        """目前各主機的上限與統計"""
+        return {
+            key: dict(state.stats, limit=state.limit, in_flight=state.in_flight, decisions=list(state.decisions))
+            for key, state in self.hosts.items()
+        }
+
+    def print_report(self):
+        """顯示各主機的併發調整結果"""
+        print(f"\n🎚️ 自適應併發統計:")
+        for key, state in self.hosts.items():
+            s = state.stats
+            print(f"   🌐 {key}: 上限 {state.limit}（最高 {s['max_limit']}），最大同時 {s['max_in_flight']}")
+            print(f"       請求 {s['requests']}，成功 {s['successes']}，退讓 {s['backoffs']}，"
+                  f"加 {s['increases']} 次 / 減 {s['decreases']} 次")
+
+
+def _is_timeout_result(result):
+    """CrawlResult 是否因逾時而失敗"""
+    message = (getattr(result, 'error_message', '') or '').lower()
+    return "timeout" in message or "timed_out" in message
+
+
+async def crawl_many(crawler, urls, limiter, config=None, slimmer=None):
+    """在自適應併發控制下批次爬取頁面，回傳與 urls 同順序的結果（失敗為例外物件）；
+    傳入 slimmer 時每頁完成就精簡，完整的 CrawlResult 不會累積到整批結束"""
+
+    async def crawl_one(url):
+        async with limiter.slot(url) as slot:
+            start = time.perf_counter()
+            try:
+                result = await crawler.arun(url=url, config=config)
+            except Exception as e:
+                record_error(e)
+                raise
+            record_crawl_result(result, time.perf_counter() - start)
+            slot.report_status(getattr(result, 'status_code', None))
+            if not result.success:
+                # 導覽失敗時 arun 不拋出例外，回傳 success=False 且沒有狀態碼；
+                # 只有逾時代表主機過載，DNS 失敗、404 等永久性錯誤不退讓
+                timed_out = _is_timeout_result(result)
+                slot.report_failure("逾時" if timed_out else "爬取失敗", overloaded=timed_out)
+            return slimmer.slim(result) if slimmer is not None else result
+
+    return await asyncio.gather(*[crawl_one(url) for url in urls], return_exceptions=True)
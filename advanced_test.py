@@ -7,6 +7,7 @@ import asyncio
 import json
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
 from crawl4ai.extraction_strategy import CosineStrategy, LLMExtractionStrategy
+from screenshot_pipeline import ScreenshotPipeline
 
 async def structured_extraction_test():
     """結構化資料擷取測試"""
@@ -83,18 +84,23 @@ async def screenshot_test():
     """螢幕截圖測試"""
     print("\n📸 開始螢幕截圖測試...")
     
+    # 只截視窗範圍，由瀏覽器直接輸出 JPEG
+    screenshots = ScreenshotPipeline(mode="viewport", image_format="jpeg", quality=80)
+    
     async with AsyncWebCrawler() as crawler:
+        screenshots.attach(crawler)
         result = await crawler.arun(
             url="https://example.com",
             screenshot=True
         )
         
         print(f"✅ 螢幕截圖完成")
-        if result.screenshot:
-            # 儲存截圖
-            with open("screenshot.png", "wb") as f:
-                f.write(result.screenshot)
-            print(f"💾 截圖已儲存至: screenshot.png")
+        # result.screenshot 是 base64 字串，解碼與寫檔在執行緒池中進行
+        screenshot_path = await screenshots.save(result, "screenshot")
+        if screenshot_path:
+            print(f"💾 截圖已儲存至: {screenshot_path}")
+        screenshots.print_report()
+    screenshots.close()
 
 async def user_agent_test():
     """自訂 User Agent 測試"""
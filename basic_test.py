@@ -5,17 +5,28 @@ Crawl4AI 基本測試範例
 
 import asyncio
 from crawl4ai import AsyncWebCrawler
+from adaptive_concurrency import AdaptiveConcurrencyLimiter, crawl_many
+from slim_results import ResultSlimmer
+from crawl_deadline import CrawlDeadline, is_partial
+from browser_daemon import DaemonClient
+
+# 常駐瀏覽器（python browser_daemon.py start --detach）有在執行時直接連線，不必每次啟動 Chromium
+daemon = DaemonClient()
 
 async def basic_crawl_test():
     """基本網頁爬取測試"""
     print("🚀 開始基本爬取測試...")
     
-    async with AsyncWebCrawler() as crawler:
+    # 只用到標題、markdown 與連結，原始 HTML 寫到暫存檔，其餘大型欄位直接丟棄
+    slimmer = ResultSlimmer(fields=["metadata", "markdown", "links"], spill=["html"])
+    
+    async with AsyncWebCrawler(config=daemon.browser_config()) as crawler, slimmer:
+        daemon.attach(crawler)
         # 測試爬取新聞網站
         print("📰 爬取新聞網站...")
-        result = await crawler.arun(
+        result = slimmer.slim(await crawler.arun(
             url="https://www.nbcnews.com/business",
-        )
+        ))
         
         print(f"✅ 爬取成功！")
         print(f"📄 頁面標題: {result.metadata.get('title', 'N/A')}")
@@ -27,6 +38,10 @@ async def basic_crawl_test():
         if result.markdown:
             preview = result.markdown[:500] + "..." if len(result.markdown) > 500 else result.markdown
             print(f"\n📖 內容預覽:\n{preview}")
+        
+        if result.html is not None:
+            print(f"🗂️ 原始 HTML: {len(result.html)} bytes（{result.html.path}）")
+        slimmer.print_report()
 
 async def multiple_sites_test():
     """多個網站爬取測試"""
@@ -38,14 +53,30 @@ async def multiple_sites_test():
         "https://quotes.toscrape.com"
     ]
     
-    async with AsyncWebCrawler() as crawler:
-        for i, url in enumerate(urls, 1):
-            try:
-                print(f"📍 ({i}/{len(urls)}) 爬取: {url}")
-                result = await crawler.arun(url=url)
+    # 依主機自動調整併發數，同時爬取多個網站
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+    
+    # 只需要 markdown 長度與部分結果標記，每頁完成就丟棄 HTML、截圖與 media
+    slimmer = ResultSlimmer(fields=["markdown", "metadata"], spill=[])
+    # 每頁最多 15 秒，慢速頁面回傳已載入的部分內容
+    deadline = CrawlDeadline(seconds=15)
+    
+    async with AsyncWebCrawler(config=daemon.browser_config()) as crawler:
+        daemon.attach(crawler)
+        deadline.attach(crawler)
+        results = await crawl_many(crawler, urls, limiter, slimmer=slimmer)
+        for i, (url, result) in enumerate(zip(urls, results), 1):
+            print(f"📍 ({i}/{len(urls)}) 爬取: {url}")
+            if isinstance(result, Exception):
+                print(f"   ❌ 失敗: {str(result)}")
+            else:
                 print(f"   ✅ 成功 - 內容長度: {len(result.markdown)} 字元")
-            except Exception as e:
-                print(f"   ❌ 失敗: {str(e)}")
+                if is_partial(result):
+                    print(f"   ⏳ 部分結果（截斷階段: {', '.join(result.metadata['partial_phases'])}）")
+    
+    limiter.print_report()
+    deadline.print_report()
+    slimmer.print_report()
 
 async def main():
     """主函數"""
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+跨腳本共用的常駐瀏覽器
+
+run_tests.py 選單中的每個腳本都是新的 Python 行程，每次都要從頭啟動 Chromium；
+排程執行大量短時間爬取時，啟動時間比爬取本身還長。BrowserDaemon 在背景維持一個開啟遠端除錯埠的 Chromium，
+定期檢查 /json/version，瀏覽器當掉或沒有回應時自動重新啟動，並把 CDP 端點寫到 browser_daemon.json。
+腳本透過 DaemonClient 以 CDP 連線（Crawl4AI 的 cdp_url），每個用戶端使用自己的 browser context，
+結束時只關閉自己的 context 並中斷連線；常駐瀏覽器沒有啟動時自動退回原本自行啟動瀏覽器的方式。
+
+用法：
+    python browser_daemon.py start --detach   # 背景啟動
+    python browser_daemon.py status
+    python browser_daemon.py stop
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import aiohttp
+
+STATE_FILE = "browser_daemon.json"
+LOG_FILE = "browser_daemon.log"
+# 避開 Crawl4AI 受管瀏覽器預設的 9222
+DEFAULT_PORT = 9333
+
+
+def read_state(state_path=STATE_FILE):
+    """讀取常駐瀏覽器的狀態檔；不存在時回傳 None"""
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def daemon_endpoint(state_path=STATE_FILE, timeout=1.0):
+    """常駐瀏覽器正在執行且有回應時回傳 CDP 端點，否則回傳 None"""
+    state = read_state(state_path)
+    if not state:
+        return None
+    try:
+        with urllib.request.urlopen(f"{state['cdp_url']}/json/version", timeout=timeout) as response:
+            return state["cdp_url"] if response.status == 200 else None
+    except (OSError, ValueError):
+        return None
+
+
+class BrowserDaemon:
+    """啟動並看守常駐的 Chromium，當掉或沒有回應時重新啟動"""
+
+    def __init__(self, port=DEFAULT_PORT, host="127.0.0.1", headless=True, executable=None,
+                 state_path=STATE_FILE, log_path=LOG_FILE, check_interval=5.0, max_failures=3):
+        self.port = port
+        self.host = host
+        self.headless = headless
+        self.executable = executable
+        self.state_path = state_path
+        self.log_path = log_path
+        self.check_interval = check_interval
+        # 連續幾次健康檢查失敗才視為沒有回應（瀏覽器忙碌時偶爾會慢）
+        self.max_failures = max_failures
+        self.cdp_url = f"http://{host}:{port}"
+        self.process = None
+        self._profile_dir = None
+        self._stop = None
+        self.stats = {"started_at": None, "launches": 0, "restarts": 0, "checks": 0, "failed_checks": 0}
+
+    async def _executable_path(self):
+        if self.executable:
+            return self.executable
+        from playwright.async_api import async_playwright
+
+        async with async_playwright() as playwright:
+            return playwright.chromium.executable_path
+
+    async def _browser_args(self):
+        from crawl4ai import BrowserConfig
+        from crawl4ai.browser_manager import ManagedBrowser
+
+        args = [
+            await self._executable_path(),
+            f"--remote-debugging-port={self.port}",
+            f"--remote-debugging-address={self.host}",
+            f"--user-data-dir={self._profile_dir}",
+        ]
+        if self.headless:
+            args.append("--headless=new")
+        # 與 Crawl4AI 自行啟動瀏覽器時相同的參數
+        args.extend(ManagedBrowser.build_browser_flags(BrowserConfig(headless=self.headless)))
+        return args
+
+    async def _healthy(self, timeout=2.0):
+        try:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+                async with session.get(f"{self.cdp_url}/json/version") as response:
+                    return response.status == 200 and "webSocketDebuggerUrl" in await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return False
+
+    async def _launch(self, startup_timeout=15.0):
+        self._profile_dir = tempfile.mkdtemp(prefix="browser-daemon-")
+        args = await self._browser_args()
+        # 瀏覽器的輸出寫到記錄檔：長時間執行時不讀取的 PIPE 填滿後會讓瀏覽器卡住
+        with open(self.log_path, "ab") as log:
+            self.process = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        self.stats["launches"] += 1
+
+        deadline = time.monotonic() + startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                code = self.process.returncode
+                await self._terminate()
+                raise RuntimeError(f"瀏覽器啟動後立即結束（代碼 {code}），詳見 {self.log_path}")
+            if await self._healthy():
+                self._write_state()
+                return
+            await asyncio.sleep(0.2)
+        await self._terminate()
+        raise RuntimeError(f"瀏覽器在 {startup_timeout:.0f} 秒內沒有開啟除錯埠 {self.port}")
+
+    async def _terminate(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            for _ in range(50):
+                if self.process.poll() is not None:
+                    break
+                await asyncio.sleep(0.1)
+            else:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        if self._profile_dir:
+            shutil.rmtree(self._profile_dir, ignore_errors=True)
+            self._profile_dir = None
+
+    async def _restart(self, reason):
+        print(f"🔁 重新啟動瀏覽器: {reason}")
+        self.stats["restarts"] += 1
+        await self._terminate()
+        try:
+            await self._launch()
+        except RuntimeError as e:
+            # 啟動失敗時下次健康檢查再試，daemon 本身不結束
+            print(f"❌ {str(e)}")
+
+    def _write_state(self):
+        state = dict(
+            self.stats,
+            pid=os.getpid(),
+            browser_pid=self.process.pid if self.process else None,
+            cdp_url=self.cdp_url,
+            last_check=time.time(),
+        )
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
+    async def run(self):
+        """啟動瀏覽器並持續健康檢查，直到收到 SIGINT/SIGTERM"""
+        if daemon_endpoint(self.state_path):
+            print(f"ℹ️ 常駐瀏覽器已在執行: {read_state(self.state_path)['cdp_url']}")
+            return
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stop.set)
+
+        self.stats["started_at"] = time.time()
+        await self._launch()
+        print(f"🧭 常駐瀏覽器已啟動: {self.cdp_url}（PID {self.process.pid}）")
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.check_interval)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+                self.stats["checks"] += 1
+                if self.process is None or self.process.poll() is not None:
+                    code = self.process.returncode if self.process else None
+                    await self._restart(f"瀏覽器已結束（代碼 {code}）")
+                    failures = 0
+                elif await self._healthy():
+                    failures = 0
+                else:
+                    failures += 1
+                    self.stats["failed_checks"] += 1
+                    if failures >= self.max_failures:
+                        await self._restart(f"連續 {failures} 次健康檢查沒有回應")
+                        failures = 0
+                self._write_state()
+        finally:
+            await self._terminate()
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+            print(f"👋 常駐瀏覽器已停止（重新啟動 {self.stats['restarts']} 次）")
+
+
+class DaemonClient:
+    """以 CDP 連到常駐瀏覽器，每個用戶端使用獨立的 browser context"""
+
+    def __init__(self, state_path=STATE_FILE):
+        self.state_path = state_path
+        self.cdp_url = None
+        self._contexts = {}
+        self._lock = asyncio.Lock()
+        self.stats = {"contexts": 0, "pages": 0}
+
+    def browser_config(self, config=None):
+        """常駐瀏覽器有回應時回傳連線用的 BrowserConfig，否則回傳原本的設定（自行啟動瀏覽器）"""
+        from crawl4ai import BrowserConfig
+
+        config = config or BrowserConfig()
+        self.cdp_url = daemon_endpoint(self.state_path)
+        if self.cdp_url is None:
+            print("ℹ️ 常駐瀏覽器未啟動，改為自行啟動瀏覽器（python browser_daemon.py start --detach）")
+            return config
+        print(f"🧭 連線到常駐瀏覽器: {self.cdp_url}")
+        return config.clone(browser_mode="custom", cdp_url=self.cdp_url)
+
+    def attach(self, crawler):
+        """讓爬蟲在自己的 context 中開分頁，結束時只關閉自己的 context（未連到常駐瀏覽器時不做任何事）"""
+        strategy = crawler.crawler_strategy
+        if not strategy.browser_config.cdp_url:
+            return
+        manager = strategy.browser_manager
+        original_get_page = manager.get_page
+
+        async def get_page(crawlerRunConfig):
+            session_id = crawlerRunConfig.session_id
+            if session_id and session_id in manager.sessions:
+                return await original_get_page(crawlerRunConfig)
+            # Crawl4AI 連線到既有瀏覽器時會共用預設 context 的第一個分頁，這裡改成每次開新分頁
+            context = await self._context_for(manager, crawlerRunConfig)
+            page = await context.new_page()
+            self.stats["pages"] += 1
+            if session_id:
+                manager.sessions[session_id] = (context, page, time.time())
+            return page, context
+
+        async def close():
+            # Crawl4AI 在 cdp_url 模式下不做任何清理：關閉自己的 context 並中斷連線，瀏覽器繼續執行
+            for context in self._contexts.values():
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            self._contexts.clear()
+            manager.sessions.clear()
+            if manager.browser is not None:
+                await manager.browser.close()
+                manager.browser = None
+            if manager.playwright is not None:
+                await manager.playwright.stop()
+                manager.playwright = None
+
+        manager.get_page = get_page
+        manager.close = close
+
+    async def _context_for(self, manager, crawlerRunConfig):
+        # 與 Crawl4AI 自行啟動瀏覽器時相同：影響 context 的設定相同就共用同一個 context
+        signature = manager._make_config_signature(crawlerRunConfig)
+        async with self._lock:
+            if signature not in self._contexts:
+                context = await manager.create_browser_context(crawlerRunConfig)
+                await manager.setup_context(context, crawlerRunConfig)
+                self._contexts[signature] = context
+                self.stats["contexts"] += 1
+            return self._contexts[signature]
+
+
+def print_status(state_path=STATE_FILE):
+    """顯示常駐瀏覽器的狀態"""
+    state = read_state(state_path)
+    if not state:
+        print("⏹️ 常駐瀏覽器未啟動")
+        return
+    healthy = daemon_endpoint(state_path) is not None
+    uptime = time.time() - (state.get("started_at") or time.time())
+    print(f"{'✅' if healthy else '❌'} 常駐瀏覽器 {state['cdp_url']}（daemon PID {state['pid']}，"
+          f"瀏覽器 PID {state['browser_pid']}）")
+    print(f"   已執行 {uptime / 60:.0f} 分鐘，健康檢查 {state['checks']} 次（失敗 {state['failed_checks']}），"
+          f"重新啟動 {state['restarts']} 次")
+
+
+def stop_daemon(state_path=STATE_FILE, timeout=10.0):
+    """通知常駐瀏覽器結束並等待狀態檔移除"""
+    state = read_state(state_path)
+    if not state:
+        print("⏹️ 常駐瀏覽器未啟動")
+        return
+    try:
+        os.kill(state["pid"], signal.SIGTERM)
+    except ProcessLookupError:
+        # daemon 已經不在：清掉過期的狀態檔
+        os.remove(state_path)
+        print("🧹 已移除過期的狀態檔")
+        return
+    deadline = time.monotonic() + timeout
+    while os.path.exists(state_path) and time.monotonic() < deadline:
+        time.sleep(0.2)
+    print("👋 常駐瀏覽器已停止")
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description="跨腳本共用的常駐瀏覽器")
+    parser.add_argument("command", choices=["start", "status", "stop"])
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="遠端除錯埠")
+    parser.add_argument("--headful", action="store_true", help="顯示瀏覽器視窗")
+    parser.add_argument("--executable", help="Chromium 執行檔（預設使用 Playwright 安裝的版本）")
+    parser.add_argument("--check-interval", type=float, default=5.0, help="健康檢查間隔（秒）")
+    parser.add_argument("--detach", action="store_true", help="在背景執行，輸出寫到 browser_daemon.log")
+    options = parser.parse_args()
+
+    if options.command == "status":
+        print_status()
+    elif options.command == "stop":
+        stop_daemon()
+    elif options.detach:
+        if daemon_endpoint():
+            print_status()
+            return
+        args = [sys.executable, os.path.abspath(__file__)] + [a for a in sys.argv[1:] if a != "--detach"]
+        with open(LOG_FILE, "ab") as log:
+            subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                             start_new_session=True)
+        # 等到端點可以連線再回傳，之後執行的腳本就能直接使用
+        for _ in range(100):
+            if daemon_endpoint():
+                break
+            time.sleep(0.2)
+        print_status()
+    else:
+        daemon = BrowserDaemon(port=options.port, headless=not options.headful, executable=options.executable,
+                               check_interval=options.check_interval)
+        asyncio.run(daemon.run())
+
+
+if __name__ == "__main__":
+    main()
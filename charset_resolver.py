@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+依網域快取的網頁編碼判斷
+
+PTT 與部分 .gov.tw 網頁仍使用 Big5，或在 Content-Type 中標錯編碼。
+對整份回應執行統計偵測（charset-normalizer / chardet）很慢，這裡依序嘗試：
+BOM → HTTP 標頭 → <meta> 宣告 → 同網域上次的結果，每個候選都以嚴格解碼驗證；
+都不成立時才對第一個非 ASCII 位元組起的有限長度片段做偵測，結果依網域快取，
+之後解碼失敗就使快取失效重新偵測。
+
+掛到爬蟲上時只攔截主文件：宣告正確就原封不動放行，宣告缺漏或錯誤時才轉成 UTF-8 交給瀏覽器。
+
+基準測試：
+    python charset_resolver.py --benchmark
+"""
+
+import argparse
+import codecs
+import random
+import re
+import time
+from urllib.parse import urlparse
+
+from hook_utils import add_hook
+
+_CHARSET_PARAM = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.I)
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+_NON_ASCII = re.compile(rb'[\x80-\xff]')
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Python 不認得的常見網頁編碼標籤
+_ALIASES = {"x-big5": "big5", "big5-hkscs": "big5hkscs", "x-sjis": "shift_jis", "x-gbk": "gbk"}
+
+# 依 WHATWG 編碼標準，把標籤對應到實際使用的超集合（台灣的 Big5 網頁多含 cp950 擴充字）
+_SUPERSETS = {
+    "big5": "cp950",
+    "big5hkscs": "cp950",
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+    "latin-1": "cp1252",
+    "ascii": "cp1252",
+    "shift_jis": "cp932",
+    "euc_kr": "cp949",
+}
+
+
+def normalize_encoding(label):
+    """把標籤轉成 Python 編碼名稱；無法辨識時回傳 None"""
+    if not label:
+        return None
+    label = label.strip().lower()
+    try:
+        name = codecs.lookup(_ALIASES.get(label, label)).name
+    except LookupError:
+        return None
+    return _SUPERSETS.get(name.replace("iso8859-1", "latin-1"), name)
+
+
+def declared_charset(content_type):
+    """Content-Type 標頭中的 charset 參數"""
+    match = _CHARSET_PARAM.search(content_type or "")
+    return match.group(1) if match else None
+
+
+def meta_charset(body, limit=4096):
+    """文件開頭 <meta charset> 或 http-equiv 宣告的編碼"""
+    match = _META_CHARSET.search(body[:limit])
+    return match.group(1).decode("ascii", "ignore") if match else None
+
+
+def _detect(sample):
+    """對片段做統計偵測，優先使用 charset-normalizer"""
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        import chardet
+
+        return chardet.detect(sample).get("encoding")
+    best = from_bytes(sample).best()
+    return best.encoding if best else None
+
+
+def _strict_decode(body, encoding):
+    try:
+        return body.decode(encoding)
+    except (UnicodeDecodeError, LookupError):
+        return None
+
+
+class CharsetResolver:
+    """先信任宣告、片段偵測並依網域快取的編碼判斷"""
+
+    def __init__(self, detect_bytes=8 * 1024, meta_bytes=4096):
+        # 偵測只讀第一個非 ASCII 位元組之後的這麼多位元組
+        self.detect_bytes = detect_bytes
+        self.meta_bytes = meta_bytes
+        self.domain_cache = {}
+        self.stats = {"pages": 0, "bom": 0, "header": 0, "meta": 0, "ascii": 0, "cache": 0,
+                      "detected": 0, "lossy": 0, "invalidations": 0, "mislabelled": 0,
+                      "transcoded": 0, "detect_seconds": 0.0}
+
+    def _sample(self, body):
+        """從第一個非 ASCII 位元組開始取偵測片段（HTML 開頭的腳本與樣式沒有判斷價值）"""
+        match = _NON_ASCII.search(body)
+        if match is None:
+            return None
+        sample = body[match.start():match.start() + self.detect_bytes]
+        # 片段結尾可能切在多位元組字元中間，退回到最後一個標籤開頭（'<' 不會是 Big5 的第二個位元組）
+        end = sample.rfind(b"<")
+        return sample[:end] if end > 0 else sample
+
+    def resolve(self, url, body, content_type=None):
+        """回傳 (文字, 編碼, 來源)；來源為 bom/header/meta/ascii/cache/detected/lossy"""
+        self.stats["pages"] += 1
+        host = urlparse(url).hostname or ""
+
+        for bom, encoding in _BOMS:
+            if body.startswith(bom):
+                self.stats["bom"] += 1
+                return body.decode(encoding, "replace"), encoding, "bom"
+
+        declared = [("header", declared_charset(content_type)),
+                    ("meta", meta_charset(body, self.meta_bytes))]
+        for source, label in declared:
+            encoding = normalize_encoding(label)
+            if encoding is None:
+                continue
+            text = _strict_decode(body, encoding)
+            if text is not None:
+                self.stats[source] += 1
+                self.domain_cache[host] = encoding
+                return text, encoding, source
+            self.stats["mislabelled"] += 1
+
+        cached = self.domain_cache.get(host)
+        if cached is not None:
+            text = _strict_decode(body, cached)
+            if text is not None:
+                self.stats["cache"] += 1
+                return text, cached, "cache"
+            # 同網域的頁面換了編碼，重新偵測
+            self.stats["invalidations"] += 1
+            del self.domain_cache[host]
+
+        sample = self._sample(body)
+        if sample is None:
+            self.stats["ascii"] += 1
+            return body.decode("ascii"), "utf-8", "ascii"
+
+        started = time.perf_counter()
+        if _strict_decode(sample, "utf-8") is not None:
+            # 非 UTF-8 的中文內容幾乎不可能剛好是合法的 UTF-8，不必做統計偵測
+            encoding = "utf-8"
+        else:
+            encoding = normalize_encoding(_detect(sample)) or "utf-8"
+        self.stats["detect_seconds"] += time.perf_counter() - started
+        text = _strict_decode(body, encoding)
+        if text is None:
+            # 片段之後出現無法解碼的位元組：以替代字元解碼，不寫入快取
+            self.stats["lossy"] += 1
+            return body.decode(encoding, "replace"), encoding, "lossy"
+        self.stats["detected"] += 1
+        self.domain_cache[host] = encoding
+        return text, encoding, "detected"
+
+    def attach(self, crawler):
+        """攔截主文件；宣告缺漏或錯誤時轉成 UTF-8 再交給瀏覽器"""
+        add_hook(crawler, "on_page_context_created", self._on_page_context_created)
+
+    async def _on_page_context_created(self, page, context=None, **kwargs):
+        async def handle_route(route):
+            await self._handle_route(page, route)
+
+        await page.route("**/*", handle_route)
+        return page
+
+    async def _handle_route(self, page, route):
+        request = route.request
+        if request.resource_type != "document" or request.frame != page.main_frame:
+            await route.fallback()
+            return
+
+        # 轉址交給瀏覽器處理，新的位址會再經過這裡
+        response = await route.fetch(max_redirects=0)
+        content_type = response.headers.get("content-type", "")
+        if not 200 <= response.status < 300 or "html" not in content_type.lower():
+            await route.fulfill(response=response)
+            return
+
+        body = await response.body()
+        text, _, source = self.resolve(request.url, body, content_type)
+        trusted = source in ("bom", "header", "ascii") or (
+            source == "meta" and declared_charset(content_type) is None)
+        if trusted:
+            # 瀏覽器會得到相同的結果，原封不動放行（標頭的 charset 優先於 meta，標錯時仍要改寫）
+            await route.fulfill(response=response)
+            return
+
+        self.stats["transcoded"] += 1
+        headers = {k: v for k, v in response.headers.items()
+                   if k.lower() not in ("content-type", "content-length", "content-encoding")}
+        headers["content-type"] = "text/html; charset=utf-8"
+        await route.fulfill(status=response.status, headers=headers, body=text.encode("utf-8"))
+
+    def snapshot(self):
+        """各判斷來源的次數與偵測耗時"""
+        return dict(self.stats, detect_seconds=round(self.stats["detect_seconds"], 4),
+                    domains=dict(self.domain_cache))
+
+    def print_report(self):
+        """顯示編碼判斷的來源分布"""
+        s = self.stats
+        print(f"\n🔤 編碼判斷: {s['pages']} 頁（標頭 {s['header']}、meta {s['meta']}、BOM {s['bom']}、"
+              f"純 ASCII {s['ascii']}、網域快取 {s['cache']}、偵測 {s['detected']}）")
+        print(f"   偵測耗時 {s['detect_seconds'] * 1000:.1f} ms，宣告錯誤 {s['mislabelled']}，"
+              f"快取失效 {s['invalidations']}，轉為 UTF-8 {s['transcoded']}")
+        if s["lossy"]:
+            print(f"   ⚠️ 有 {s['lossy']} 頁無法完整解碼，已以替代字元處理")
+
+
+def _benchmark_fixtures(pages, seed=0):
+    """產生混合 Big5/UTF-8 的測試頁面：(url, 位元組, Content-Type, 實際編碼)"""
+    rng = random.Random(seed)
+    words = ["行政院", "立法院", "颱風", "停班停課", "公告", "臺北市", "高雄市", "補助", "申請",
+             "說明會", "裏", "碁", "銹", "恒", "批踢踢", "看板", "推文", "實業坊", "政府資料開放"]
+    # (網域, 實際編碼, 宣告方式)
+    sites = [
+        ("www.ptt.cc", "cp950", "none"),
+        ("www.example.gov.tw", "cp950", "meta"),
+        ("old.example.gov.tw", "cp950", "mislabelled"),
+        ("news.example.com.tw", "utf-8", "header"),
+        ("blog.example.tw", "utf-8", "none"),
+    ]
+    fixtures = []
+    for i in range(pages):
+        host, encoding, declaration = sites[i % len(sites)]
+        head = "<script>" + "var x = 1;" * rng.randint(200, 600) + "</script>"
+        meta = f'<meta charset="{"big5" if encoding == "cp950" else "utf-8"}">' if declaration == "meta" else ""
+        body = "".join(f"<p>{''.join(rng.choice(words) for _ in range(30))}</p>" for _ in range(rng.randint(100, 400)))
+        html = f"<html><head>{meta}<title>第 {i} 頁</title>{head}</head><body>{body}</body></html>"
+        content_type = "text/html"
+        if declaration == "header":
+            content_type = f"text/html; charset={encoding}"
+        elif declaration == "mislabelled":
+            content_type = "text/html; charset=utf-8"
+        fixtures.append((f"https://{host}/page/{i}", html.encode(encoding), content_type, encoding))
+    return fixtures
+
+
+def benchmark(pages=200):
+    """比較每頁整份偵測與 CharsetResolver 的耗時與正確率"""
+    fixtures = _benchmark_fixtures(pages)
+    total_kb = sum(len(body) for _, body, _, _ in fixtures) / 1024
+    print(f"🧪 {len(fixtures)} 頁混合 Big5/UTF-8 測試頁面，共 {total_kb:.0f} KB")
+
+    started = time.perf_counter()
+    correct = 0
+    for url, body, content_type, encoding in fixtures:
+        detected = normalize_encoding(_detect(body))
+        correct += _strict_decode(body, detected or "utf-8") == body.decode(encoding)
+    full_seconds = time.perf_counter() - started
+    print(f"   整份偵測: {full_seconds:.2f}s（每頁 {full_seconds / len(fixtures) * 1000:.1f} ms），"
+          f"正確 {correct}/{len(fixtures)}")
+
+    resolver = CharsetResolver()
+    started = time.perf_counter()
+    correct = 0
+    for url, body, content_type, encoding in fixtures:
+        text, _, _ = resolver.resolve(url, body, content_type)
+        correct += text == body.decode(encoding)
+    resolver_seconds = time.perf_counter() - started
+    print(f"   CharsetResolver: {resolver_seconds:.2f}s（每頁 {resolver_seconds / len(fixtures) * 1000:.1f} ms），"
+          f"正確 {correct}/{len(fixtures)}，快 {full_seconds / resolver_seconds:.0f} 倍")
+    resolver.print_report()
+
+
+def main():
+    """命令列基準測試"""
+    parser = argparse.ArgumentParser(description="網頁編碼判斷")
+    parser.add_argument("--benchmark", action="store_true", help="執行混合 Big5/UTF-8 基準測試")
+    parser.add_argument("--pages", type=int, default=200, help="基準測試頁數")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.pages)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,15 @@ echo "==============="
 # 清理測試產生的檔案
 echo "🗑️ 清理測試結果檔案..."
 rm -f *.json
-rm -f *.png
+rm -f *.png *.webp *.jpg
+rm -rf exports/
+rm -f incremental_state.sqlite
+rm -f discovery_state.sqlite
+rm -f browser_daemon.log
+rm -f crawl_jobs.sqlite crawl_jobs.sqlite-wal crawl_jobs.sqlite-shm
+rm -f search_index.sqlite search_index.sqlite-wal search_index.sqlite-shm
+rm -rf profiles/
+rm -rf synthetic_site/
 
 # 清理圖片資料夾
 echo "🖼️ 清理圖片資料夾..."
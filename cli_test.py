@@ -8,6 +8,7 @@ import json
 from crawl4ai import AsyncWebCrawler
 from crawl4ai.chunking_strategy import RegexChunking
 from crawl4ai.extraction_strategy import JsonCssExtractionStrategy
+from resource_blocking import ResourceBlocker
 
 async def json_extraction_test():
     """JSON 格式擷取測試"""
@@ -114,7 +115,11 @@ async def metadata_extraction_test():
     """元資料擷取測試"""
     print("\n📊 開始元資料擷取測試...")
     
+    # 元資料只來自 HTML，不需要下載圖片與字型
+    blocker = ResourceBlocker("text-only")
+    
     async with AsyncWebCrawler() as crawler:
+        blocker.attach(crawler)
         result = await crawler.arun(
             url="https://www.python.org"
         )
@@ -127,6 +132,8 @@ async def metadata_extraction_test():
                 if isinstance(value, str) and len(value) > 100:
                     value = value[:100] + "..."
                 print(f"   {key}: {value}")
+        
+        blocker.print_report()
 
 async def performance_test():
     """效能測試"""
@@ -0,0 +1,217 @@
+"""
+每次爬取的時間預算與部分結果
+
+慢速頁面原本要等到 page_timeout 或 wait_for_timeout 觸發才結束，而且結果不是全有就是全無。
+CrawlDeadline 給每次 arun 一個總時間預算，依比例分給各階段（導覽、js_code、wait_for、截圖、擷取），
+前面階段沒用完的時間會留給後面的階段。某個階段用完預算時不再等待，直接用目前已有的內容繼續：
+導覽逾時就取目前已載入的 DOM、截圖逾時就不附截圖、預算用完就略過擷取策略，
+並在 result.metadata 中標記 partial 與被截斷的階段。
+"""
+
+import asyncio
+import contextvars
+import functools
+import time
+
+from hook_utils import add_hook
+
+# 階段依 Crawl4AI 實際執行的順序排列，值為佔總預算的比例
+DEFAULT_SHARES = {
+    "navigation": 0.5,
+    "js_code": 0.1,
+    "wait_for": 0.2,
+    "screenshot": 0.1,
+    "extraction": 0.1,
+}
+
+_current_budget = contextvars.ContextVar("crawl_deadline_budget", default=None)
+
+
+class DeadlineBudget:
+    """單次爬取的預算：每個階段必須在「開始時間 + 累計比例 × 總預算」之前完成"""
+
+    def __init__(self, seconds, shares):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.partial_phases = []
+        self._phase_deadlines = {}
+        cumulative = 0.0
+        total = sum(shares.values())
+        for phase, share in shares.items():
+            cumulative += share / total
+            self._phase_deadlines[phase] = self.started + seconds * cumulative
+
+    def remaining(self, phase):
+        """這個階段還能使用的秒數"""
+        return max(0.0, self._phase_deadlines[phase] - time.monotonic())
+
+    def cut(self, phase):
+        if phase not in self.partial_phases:
+            self.partial_phases.append(phase)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+
+class CrawlDeadline:
+    """在預算內結束爬取，逾時的階段以部分結果取代"""
+
+    def __init__(self, seconds=20.0, shares=None):
+        self.seconds = seconds
+        self.shares = dict(shares or DEFAULT_SHARES)
+        unknown = set(self.shares) - set(DEFAULT_SHARES)
+        if unknown:
+            raise ValueError(f"未知的階段: {', '.join(sorted(unknown))}（可用: {', '.join(DEFAULT_SHARES)}）")
+        self.stats = {"crawls": 0, "partial": 0, "cut_by_phase": {}, "max_elapsed": 0.0}
+
+    def attach(self, crawler):
+        """包裝 arun 與各階段的方法"""
+        from crawl4ai import CrawlerRunConfig
+
+        strategy = crawler.crawler_strategy
+        add_hook(crawler, "before_goto", self._before_goto)
+        self._wrap_phase(strategy, "robust_execute_user_script", "js_code", self._skip_js)
+        self._wrap_phase(strategy, "take_screenshot", "screenshot", lambda *args, **kwargs: None)
+
+        original_smart_wait = strategy.smart_wait
+
+        @functools.wraps(original_smart_wait)
+        async def smart_wait(page, wait_for, timeout=30000):
+            budget = _current_budget.get()
+            if budget is None:
+                return await original_smart_wait(page, wait_for, timeout=timeout)
+            from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+            limit = min(timeout, budget.remaining("wait_for") * 1000)
+            if limit < 1:
+                # Playwright 的 timeout=0 代表不限時間：前面的階段已經用完預算，直接略過等待
+                budget.cut("wait_for")
+                return None
+            try:
+                result = await original_smart_wait(page, wait_for, timeout=limit)
+            except (TimeoutError, PlaywrightTimeoutError):
+                if limit >= timeout:
+                    raise
+                # 預算用完而不是條件本身失敗：不等了，用目前的 DOM 繼續
+                budget.cut("wait_for")
+                return None
+            # js: 條件逾時時回傳 False 而不是拋出例外
+            if result is False and limit < timeout:
+                budget.cut("wait_for")
+            return result
+
+        strategy.smart_wait = smart_wait
+
+        original_arun = crawler.arun
+
+        @functools.wraps(original_arun)
+        async def arun(url, config=None, **kwargs):
+            config = config or CrawlerRunConfig()
+            self._wrap_extraction(config)
+            budget = DeadlineBudget(self.seconds, self.shares)
+            token = _current_budget.set(budget)
+            try:
+                result = await original_arun(url, config=config, **kwargs)
+            finally:
+                _current_budget.reset(token)
+            self._record(budget, result)
+            return result
+
+        crawler.arun = arun
+
+    def _wrap_phase(self, owner, method_name, phase, fallback):
+        original = getattr(owner, method_name)
+
+        @functools.wraps(original)
+        async def limited(*args, **kwargs):
+            budget = _current_budget.get()
+            if budget is None:
+                return await original(*args, **kwargs)
+            try:
+                return await asyncio.wait_for(original(*args, **kwargs), budget.remaining(phase))
+            except asyncio.TimeoutError:
+                budget.cut(phase)
+                return fallback(*args, **kwargs)
+
+        setattr(owner, method_name, limited)
+
+    @staticmethod
+    def _skip_js(*args, **kwargs):
+        return {"success": False, "error": "超過時間預算，未完成 js_code", "results": []}
+
+    def _wrap_extraction(self, config):
+        # 擷取策略是同步執行的，無法中途停止：預算已用完時直接略過
+        strategy = config.extraction_strategy
+        if strategy is None or getattr(strategy.run, "_crawl_deadline", False):
+            return
+        original = strategy.run
+
+        @functools.wraps(original)
+        def run(*args, **kwargs):
+            budget = _current_budget.get()
+            if budget is not None and budget.remaining("extraction") <= 0:
+                budget.cut("extraction")
+                return []
+            return original(*args, **kwargs)
+
+        run._crawl_deadline = True
+        strategy.run = run
+
+    async def _before_goto(self, page, context=None, url=None, **kwargs):
+        if getattr(page.goto, "_crawl_deadline", False):
+            return page
+        original_goto = page.goto
+
+        async def goto(target, **goto_kwargs):
+            budget = _current_budget.get()
+            if budget is None:
+                return await original_goto(target, **goto_kwargs)
+            from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+            timeout = goto_kwargs.get("timeout") or 30000
+            limit = min(timeout, budget.remaining("navigation") * 1000)
+            goto_kwargs["timeout"] = max(limit, 1)
+            try:
+                return await original_goto(target, **goto_kwargs)
+            except PlaywrightTimeoutError:
+                if limit >= timeout:
+                    raise
+                # 頁面還沒載入完成，以目前已解析的 DOM 繼續（沒有 response，狀態碼視為 200）
+                budget.cut("navigation")
+                return None
+
+        goto._crawl_deadline = True
+        page.goto = goto
+        return page
+
+    def _record(self, budget, result):
+        elapsed = budget.elapsed
+        self.stats["crawls"] += 1
+        self.stats["max_elapsed"] = max(self.stats["max_elapsed"], elapsed)
+        if not budget.partial_phases:
+            return
+        self.stats["partial"] += 1
+        for phase in budget.partial_phases:
+            self.stats["cut_by_phase"][phase] = self.stats["cut_by_phase"].get(phase, 0) + 1
+        from crawl4ai.models import CrawlResultContainer
+
+        # 深度爬取會回傳多筆結果，逐筆標記
+        for item in (list(result) if isinstance(result, (list, CrawlResultContainer)) else [result]):
+            if getattr(item, "metadata", None) is None:
+                item.metadata = {}
+            item.metadata["partial"] = True
+            item.metadata["partial_phases"] = list(budget.partial_phases)
+            item.metadata["deadline_seconds"] = self.seconds
+
+    def print_report(self):
+        """顯示被截斷的爬取與各階段次數"""
+        s = self.stats
+        cut = "，".join(f"{phase} {count}" for phase, count in s["cut_by_phase"].items())
+        print(f"\n⏳ 時間預算 {self.seconds:.0f}s: 爬取 {s['crawls']} 次，部分結果 {s['partial']} 次"
+              f"{f'（{cut}）' if cut else ''}，最長 {s['max_elapsed']:.1f}s")
+
+
+def is_partial(result):
+    """結果是否因時間預算而不完整"""
+    return bool((getattr(result, "metadata", None) or {}).get("partial"))
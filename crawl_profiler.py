@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+任意測試腳本的效能分析
+
+以 cProfile 執行腳本，同時用背景執行緒每隔幾毫秒取樣主執行緒的呼叫堆疊與 asyncio 任務：
+事件迴圈停在 selector 上等待時算作「閒置等待」，並依等待中任務所在的模組
+歸類為瀏覽器（Playwright）、網路（aiohttp/httpx）、計時或其他；否則算作「阻塞」（Python 程式碼佔用迴圈）。
+
+輸出到 profiles/ 資料夾：
+    *.pstats            cProfile 結果（python -m pstats 或 snakeviz 開啟）
+    *.collapsed         主執行緒牆鐘時間堆疊（flamegraph.pl / speedscope 格式）
+    *.tasks.collapsed   asyncio 任務的 await 鏈與等待類別
+
+用法：
+    python crawl_profiler.py esports_test.py
+    python run_tests.py --profile
+"""
+
+import argparse
+import asyncio
+import cProfile
+import os
+import runpy
+import sys
+import threading
+import time
+from collections import Counter
+
+# 等待中任務依 await 鏈上的模組歸類
+WAIT_CATEGORIES = [
+    ("browser", ("playwright", "patchright")),
+    ("network", ("aiohttp", "httpx", "httpcore", "anyio", "aiohappyeyeballs")),
+    ("file", ("aiofiles",)),
+]
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _stack(frame):
+    """由外而內的堆疊標籤"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _user_frames(frame, depth=4):
+    """最內層幾個不屬於 asyncio 與本模組的堆疊標籤"""
+    labels = []
+    while frame is not None and len(labels) < depth:
+        filename = frame.f_code.co_filename
+        if f"{os.sep}asyncio{os.sep}" not in filename and filename != __file__:
+            labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return " ← ".join(labels)
+
+
+def _is_selector_wait(frame):
+    """主執行緒是否停在事件迴圈的 selector 上（沒有 Python 程式碼在跑）"""
+    code = frame.f_code
+    return code.co_name in ("select", "poll", "control") and code.co_filename.endswith("selectors.py")
+
+
+def _await_chain(task):
+    """任務目前的 await 鏈（由外而內的協程堆疊）與最內層等待的物件"""
+    labels = []
+    filenames = []
+    awaited = task.get_coro()
+    while awaited is not None:
+        frame = getattr(awaited, "cr_frame", None) or getattr(awaited, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame.f_code))
+        filenames.append(frame.f_code.co_filename)
+        awaited = getattr(awaited, "cr_await", None) or getattr(awaited, "gi_yieldfrom", None)
+    return labels, filenames, awaited
+
+
+def _wait_category(labels, filenames, awaited):
+    for category, modules in WAIT_CATEGORIES:
+        if any(module in filename for filename in filenames for module in modules):
+            return category
+    if labels and labels[-1] == "tasks.py:sleep":
+        return "timer"
+    if labels and labels[-1].startswith(("tasks.py:", "queues.py:", "locks.py:")):
+        # gather、Queue.get、Event.wait 等等待其他任務的情況，時間已算在被等待的任務上
+        return "children"
+    if type(awaited).__name__ in ("FutureIter", "Future", "_GatheringFuture", "Task"):
+        return "children"
+    return "other"
+
+
+class LoopSampler:
+    """背景執行緒取樣主執行緒堆疊與 asyncio 任務"""
+
+    def __init__(self, interval=0.005, block_threshold=0.05):
+        self.interval = interval
+        # 事件迴圈連續忙碌超過這個秒數就記為一次阻塞
+        self.block_threshold = block_threshold
+        self.stacks = Counter()
+        self.task_stacks = Counter()
+        self.states = Counter()
+        self.waits = Counter()
+        self.blocks = []
+        self._loops = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._main_id = threading.main_thread().ident
+        self._original_run_forever = None
+        self._busy_since = None
+        self._busy_stacks = Counter()
+
+    def _patch_loop(self):
+        # 記錄腳本中 asyncio.run 建立的事件迴圈，取樣時才知道要看哪些任務
+        sampler = self
+        original = asyncio.BaseEventLoop.run_forever
+        self._original_run_forever = original
+
+        def run_forever(loop):
+            sampler._loops.append(loop)
+            try:
+                return original(loop)
+            finally:
+                sampler._loops.remove(loop)
+
+        asyncio.BaseEventLoop.run_forever = run_forever
+
+    def start(self):
+        self._patch_loop()
+        self._thread = threading.Thread(target=self._run, name="loop-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._original_run_forever is not None:
+            asyncio.BaseEventLoop.run_forever = self._original_run_forever
+        self._end_block(time.perf_counter())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                # 取樣時任務集合可能正在變動，略過這次
+                pass
+
+    def _end_block(self, now):
+        if self._busy_since is not None and now - self._busy_since >= self.block_threshold:
+            # 以這段期間最常出現的堆疊代表這次阻塞
+            self.blocks.append((now - self._busy_since, self._busy_stacks.most_common(1)[0][0]))
+        self._busy_since = None
+        self._busy_stacks.clear()
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._main_id)
+        if frame is None:
+            return
+        now = time.perf_counter()
+        in_loop = bool(self._loops)
+        idle = in_loop and _is_selector_wait(frame)
+        if not in_loop:
+            state = "outside_loop"
+        else:
+            state = "idle" if idle else "blocking"
+        self.states[state] += 1
+        self.stacks[";".join([f"[{state}]"] + _stack(frame))] += 1
+
+        if state == "blocking":
+            if self._busy_since is None:
+                self._busy_since = now
+            self._busy_stacks[_user_frames(frame)] += 1
+        else:
+            self._end_block(now)
+
+        if not in_loop:
+            return
+        categories = Counter()
+        for task in list(asyncio.all_tasks(self._loops[-1])):
+            labels, filenames, awaited = _await_chain(task)
+            if not labels or awaited is None:
+                # 正在執行中的任務（就是佔用迴圈的那個）不算等待
+                continue
+            category = _wait_category(labels, filenames, awaited)
+            self.task_stacks[";".join([task.get_name()] + labels + [f"[{category}]"])] += 1
+            if category != "children":
+                categories[category] += 1
+        if idle and categories:
+            # 閒置的這一段時間平均分給所有等待中的任務類別
+            total = sum(categories.values())
+            for category, count in categories.items():
+                self.waits[category] += count / total
+        elif idle:
+            self.waits["other"] += 1
+
+    def write_collapsed(self, path, stacks):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def print_report(self, top=5):
+        """顯示阻塞與等待的時間分布"""
+        total = sum(self.states.values()) or 1
+        print(f"\n🔬 事件迴圈取樣（每 {self.interval * 1000:.0f} ms，共 {sum(self.states.values())} 次）:")
+        print(f"   阻塞（Python 程式碼佔用迴圈）: {self.states['blocking'] / total:.0%}"
+              f"，閒置等待: {self.states['idle'] / total:.0%}"
+              f"，事件迴圈外: {self.states['outside_loop'] / total:.0%}")
+        idle = sum(self.waits.values()) or 1
+        names = {"browser": "瀏覽器", "network": "網路", "file": "檔案", "timer": "計時", "other": "其他"}
+        detail = "，".join(f"{names.get(k, k)} {v / idle:.0%}" for k, v in self.waits.most_common())
+        if detail:
+            print(f"   等待時間分布: {detail}")
+        for duration, stack in sorted(self.blocks, key=lambda item: item[0], reverse=True)[:top]:
+            print(f"   🧱 阻塞 {duration * 1000:.0f} ms: {stack}")
+
+
+def profile_script(script, args=(), output_dir="profiles", interval=0.005, top=15):
+    """以 cProfile 與事件迴圈取樣執行腳本，回傳輸出檔案路徑"""
+    import pstats
+
+    os.makedirs(output_dir, exist_ok=True)
+    name = f"{os.path.splitext(os.path.basename(script))[0]}_{time.strftime('%Y%m%d_%H%M%S')}"
+    base = os.path.join(output_dir, name)
+
+    sys.argv = [script] + list(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    profiler = cProfile.Profile()
+    sampler = LoopSampler(interval=interval)
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+    finally:
+        profiler.disable()
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+
+        paths = {"pstats": f"{base}.pstats", "collapsed": f"{base}.collapsed",
+                 "tasks": f"{base}.tasks.collapsed"}
+        profiler.dump_stats(paths["pstats"])
+        sampler.write_collapsed(paths["collapsed"], sampler.stacks)
+        sampler.write_collapsed(paths["tasks"], sampler.task_stacks)
+
+        print(f"\n⏱️ {script} 共執行 {elapsed:.1f}s")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+        sampler.print_report()
+        print(f"\n📁 分析結果:")
+        for path in paths.values():
+            print(f"   {path}")
+    return paths
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description="以 cProfile 與事件迴圈取樣執行測試腳本")
+    parser.add_argument("script", help="要分析的腳本，例如 esports_test.py")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="傳給腳本的參數")
+    parser.add_argument("--output-dir", default="profiles", help="輸出資料夾")
+    parser.add_argument("--interval", type=float, default=0.005, help="取樣間隔（秒）")
+    parser.add_argument("--top", type=int, default=15, help="顯示累計時間最長的函數數量")
+    options = parser.parse_args()
+    profile_script(options.script, options.args, options.output_dir, options.interval, options.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+爬取追蹤（Chrome trace / OTLP JSON）
+
+選用的行程內追蹤：每次 arun 產生一個根 span，底下依序記錄導覽、JS 執行與其中每段 js_code 腳本、
+wait_for、HTML 清理、markdown 產生、擷取策略與截圖；圖片下載各自成為一個 span。
+span 帶有 URL、位元組數、狀態碼等屬性，結束時寫成 Chrome trace JSON
+（可直接用 chrome://tracing 或 Perfetto 開啟），也可輸出 OTLP JSON。
+
+啟用方式：設定環境變數 CRAWL_TRACE_FILE（例如 crawl_trace.json），或呼叫 enable_tracing()。
+未啟用時 span() 立即返回空的 span，instrument() 不會修改爬蟲。
+"""
+
+import contextvars
+import copy
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from hook_utils import add_hook
+
+_current_span = contextvars.ContextVar("crawl_trace_span", default=None)
+
+
+class Span:
+    """單一計時區段"""
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.span_id = tracer._next_id()
+        # 根 span 各自佔一條時間軸，子 span 沿用父層的時間軸
+        self.track = parent.track if parent else self.span_id
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.perf_counter_ns()
+            self.tracer._finish(self)
+
+
+class _NoopSpan:
+    """追蹤未啟用時使用的空 span"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def end(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """收集已結束的 span 並匯出成追蹤檔"""
+
+    def __init__(self, path="crawl_trace.json"):
+        self.path = path
+        self.spans = []
+        self._lock = threading.Lock()
+        self._ids = 0
+        # perf_counter 與 Unix 時間的差距，輸出 OTLP 時換算用
+        self._epoch_offset_ns = time.time_ns() - time.perf_counter_ns()
+        self._origin_ns = time.perf_counter_ns()
+
+    def _next_id(self):
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def _finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def start_span(self, name, parent=None, **attributes):
+        """開始一個不會成為目前 span 的區段（跨 hook 計時用），需自行呼叫 end()"""
+        return Span(self, name, parent, attributes)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """以目前 span 為父層記錄一個區段"""
+        current = Span(self, name, _current_span.get(), attributes)
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.set_attribute("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            current.end()
+
+    def to_chrome_trace(self):
+        """Chrome trace 事件格式（ph=X 的完整事件，時間單位為微秒）"""
+        events = []
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        for span in spans:
+            if span.parent is None:
+                events.append({
+                    "ph": "M", "name": "thread_name", "pid": os.getpid(), "tid": span.track,
+                    "args": {"name": f"{span.name} {span.attributes.get('url', '')}".strip()},
+                })
+            events.append({
+                "name": span.name,
+                "cat": "crawl",
+                "ph": "X",
+                "pid": os.getpid(),
+                "tid": span.track,
+                "ts": (span.start_ns - self._origin_ns) / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "args": span.attributes,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_otlp(self):
+        """OTLP/JSON（resourceSpans）格式"""
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        with self._lock:
+            spans = list(self.spans)
+        otlp_spans = []
+        for span in spans:
+            otlp_spans.append({
+                "traceId": f"{os.getpid():016x}{span.trace_id:016x}",
+                "spanId": f"{span.span_id:016x}",
+                "parentSpanId": f"{span.parent.span_id:016x}" if span.parent else "",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns + self._epoch_offset_ns),
+                "endTimeUnixNano": str(span.end_ns + self._epoch_offset_ns),
+                "attributes": [attribute(k, v) for k, v in span.attributes.items()],
+                "status": {"code": 2 if "error" in span.attributes else 1},
+            })
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", "crawl4ai-tests")]},
+            "scopeSpans": [{"scope": {"name": "crawl_tracing"}, "spans": otlp_spans}],
+        }]}
+
+    def write(self, path=None, format=None):
+        """寫出追蹤檔；副檔名為 .otlp.json 時輸出 OTLP，否則輸出 Chrome trace"""
+        path = path or self.path
+        format = format or ("otlp" if path.endswith(".otlp.json") else "chrome")
+        data = self.to_otlp() if format == "otlp" else self.to_chrome_trace()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        print(f"🧭 追蹤檔已儲存至: {path}（{len(self.spans)} 個 span）")
+        return path
+
+    def print_report(self, top=5):
+        """顯示各類 span 的總耗時與最慢的爬取"""
+        totals = {}
+        for span in self.spans:
+            total, count = totals.get(span.name, (0, 0))
+            totals[span.name] = (total + span.end_ns - span.start_ns, count + 1)
+        print(f"\n🧭 追蹤統計:")
+        for name, (total, count) in sorted(totals.items(), key=lambda item: -item[1][0]):
+            print(f"   {name}: {count} 次，共 {total / 1e9:.2f}s，平均 {total / count / 1e6:.0f}ms")
+        crawls = sorted((s for s in self.spans if s.name == "crawl"), key=lambda s: s.start_ns - s.end_ns)
+        for span in crawls[:top]:
+            print(f"   🐢 {(span.end_ns - span.start_ns) / 1e6:.0f}ms {span.attributes.get('url', '')}")
+
+
+_tracer = None
+
+
+def tracing_enabled():
+    return _tracer is not None
+
+
+def get_tracer():
+    """取得追蹤器；未啟用時回傳 None"""
+    return _tracer
+
+
+def enable_tracing(path="crawl_trace.json"):
+    """啟用追蹤，結束時以 write_trace() 寫出"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(path)
+        print(f"🧭 已啟用爬取追蹤，輸出: {path}")
+    return _tracer
+
+
+def enable_tracing_from_env():
+    """若設定了 CRAWL_TRACE_FILE 環境變數就啟用追蹤"""
+    path = os.environ.get("CRAWL_TRACE_FILE")
+    if path:
+        enable_tracing(path)
+
+
+def write_trace(show_report=True):
+    """程式結束前呼叫：寫出追蹤檔（未啟用時不做事）"""
+    if _tracer is None or not _tracer.spans:
+        return None
+    if show_report:
+        _tracer.print_report()
+    return _tracer.write()
+
+
+def span(name, **attributes):
+    """記錄一個區段；未啟用時回傳空的 context manager"""
+    if _tracer is None:
+        return _noop_span()
+    return _tracer.span(name, **attributes)
+
+
+@contextmanager
+def _noop_span():
+    yield _NOOP_SPAN
+
+
+def _wrap_async(owner, method_name, span_name, describe=None):
+    """把物件上的 async 方法包成 span（只包一次）"""
+    original = getattr(owner, method_name, None)
+    if original is None or getattr(original, "_crawl_traced", False):
+        return
+
+    @functools.wraps(original)
+    async def traced(*args, **kwargs):
+        with span(span_name) as current:
+            result = await original(*args, **kwargs)
+            if describe:
+                describe(current, result, args, kwargs)
+            return result
+
+    traced._crawl_traced = True
+    setattr(owner, method_name, traced)
+
+
+def _wrap_sync(owner, method_name, span_name, describe=None):
+    """把物件上的一般方法包成 span（只包一次）"""
+    original = getattr(owner, method_name, None)
+    if original is None or getattr(original, "_crawl_traced", False):
+        return
+
+    @functools.wraps(original)
+    def traced(*args, **kwargs):
+        with span(span_name) as current:
+            result = original(*args, **kwargs)
+            if describe:
+                describe(current, result, args, kwargs)
+            return result
+
+    traced._crawl_traced = True
+    setattr(owner, method_name, traced)
+
+
+def _describe_crawl(current, result, args, kwargs):
+    current.set_attribute("success", bool(getattr(result, "success", False)))
+    current.set_attribute("status", getattr(result, "status_code", None))
+    current.set_attribute("bytes", len(getattr(result, "html", "") or ""))
+
+
+def _describe_js(current, result, args, kwargs):
+    scripts = args[1] if len(args) > 1 else kwargs.get("js_code")
+    current.set_attribute("scripts", 1 if isinstance(scripts, str) else len(scripts or []))
+    current.set_attribute("success", bool((result or {}).get("success")))
+
+
+def _describe_script(current, result, args, kwargs):
+    # 腳本內拋出的例外會被包成 {success: false, error: ...} 回傳
+    failed = isinstance(result, dict) and result.get("success") is False
+    current.set_attribute("success", not failed)
+    if failed:
+        current.set_attribute("error", str(result.get("error", "")))
+
+
+def _wrap_script_evaluate(adapter):
+    """js_execution 期間的每次 evaluate 就是一段 js_code 腳本，各自記錄成 span"""
+    original = getattr(adapter, "evaluate", None)
+    if original is None or getattr(original, "_crawl_traced", False):
+        return
+
+    @functools.wraps(original)
+    async def traced(*args, **kwargs):
+        parent = _current_span.get()
+        if getattr(parent, "name", None) != "js_execution":
+            return await original(*args, **kwargs)
+        index = parent.attributes.get("scripts_run", 0)
+        parent.set_attribute("scripts_run", index + 1)
+        with span("js_code", index=index) as current:
+            result = await original(*args, **kwargs)
+            _describe_script(current, result, args, kwargs)
+            return result
+
+    traced._crawl_traced = True
+    adapter.evaluate = traced
+
+
+def _describe_screenshot(current, result, args, kwargs):
+    current.set_attribute("bytes", len(result or ""))
+
+
+def _describe_markdown(current, result, args, kwargs):
+    current.set_attribute("bytes", len(getattr(result, "raw_markdown", "") or ""))
+
+
+def instrument_config(config):
+    """回傳包裝了清理、markdown 與擷取策略的設定副本
+
+    CrawlerRunConfig 預設的 markdown 產生器是所有設定共用的同一個物件，
+    因此設定與策略物件都先淺複製再包裝，不修改呼叫端與 Crawl4AI 的共用物件。
+    """
+    if _tracer is None or config is None:
+        return config
+    config = copy.copy(config)
+    config.scraping_strategy = copy.copy(config.scraping_strategy)
+    _wrap_sync(config.scraping_strategy, "scrap", "html_cleaning")
+    if config.markdown_generator is not None:
+        config.markdown_generator = copy.copy(config.markdown_generator)
+        _wrap_sync(config.markdown_generator, "generate_markdown", "markdown", _describe_markdown)
+    if config.extraction_strategy is not None:
+        config.extraction_strategy = copy.copy(config.extraction_strategy)
+        _wrap_sync(config.extraction_strategy, "run", "extraction")
+    return config
+
+
+def instrument(crawler):
+    """在爬蟲實例上加入追蹤；追蹤未啟用時不做任何修改"""
+    if _tracer is None:
+        return
+    from crawl4ai import CrawlerRunConfig
+
+    strategy = crawler.crawler_strategy
+    navigations = {}
+
+    async def before_goto(page, context=None, url=None, **kwargs):
+        navigations[id(page)] = _tracer.start_span("navigation", _current_span.get(), url=url)
+        return page
+
+    async def after_goto(page, context=None, url=None, response=None, **kwargs):
+        started = navigations.pop(id(page), None)
+        if started is not None:
+            if response is not None:
+                started.set_attribute("status", response.status)
+            started.end()
+        return page
+
+    add_hook(crawler, "before_goto", before_goto)
+    add_hook(crawler, "after_goto", after_goto)
+    # 整段 JS 執行（含載入等待）為 js_execution，其中每段腳本各是一個 js_code span
+    _wrap_async(strategy, "robust_execute_user_script", "js_execution", _describe_js)
+    _wrap_script_evaluate(strategy.adapter)
+    _wrap_async(strategy, "smart_wait", "wait_for")
+    _wrap_async(strategy, "take_screenshot", "screenshot", _describe_screenshot)
+    _wrap_async(crawler, "aprocess_html", "process_html")
+
+    original_arun = crawler.arun
+    if getattr(original_arun, "_crawl_traced", False):
+        return
+
+    @functools.wraps(original_arun)
+    async def traced_arun(url, config=None, **kwargs):
+        # 沒有傳入設定時先建立預設設定，才能包裝其中的策略物件
+        config = instrument_config(config or CrawlerRunConfig())
+        with span("crawl", url=url) as current:
+            result = await original_arun(url, config=config, **kwargs)
+            _describe_crawl(current, result, (), {})
+            return result
+
+    traced_arun._crawl_traced = True
+    crawler.arun = traced_arun
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+多行程爬取工作者
+
+協調者把 URL 放進本機 SQLite 工作佇列，啟動 N 個工作者行程，
+每個行程有自己的 AsyncWebCrawler 與事件迴圈，租用工作、定期送出心跳，
+並把結果寫到共用的匯出資料夾。工作者意外結束時，協調者會把它租用的工作放回佇列。
+工作者的 SQLite 操作都在專用的執行緒中進行，等待資料庫鎖時不會卡住事件迴圈。
+
+用法：
+    python crawl_workers.py urls.txt --workers 4
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import crawl_metrics
+from result_export import ResultExporter
+
+
+class JobQueue:
+    """以 SQLite 實作、可跨行程使用的工作佇列（租約制）"""
+
+    def __init__(self, path="crawl_jobs.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        # WAL 模式讓多個行程可以同時讀寫
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                lease_expires REAL,
+                error TEXT,
+                finished_at REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                pid INTEGER,
+                last_heartbeat REAL
+            )
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def enqueue(self, urls):
+        """加入工作（重複的 URL 會被略過），回傳新增數量"""
+        before = self.conn.total_changes
+        self.conn.executemany("INSERT OR IGNORE INTO jobs (url) VALUES (?)", [(u,) for u in urls])
+        return self.conn.total_changes - before
+
+    def lease(self, worker_id, count=1, lease_seconds=120):
+        """原子地租用最多 count 個待處理或租約已過期的工作"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute("""
+                SELECT id, url FROM jobs
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT ?
+            """, (now, count)).fetchall()
+            self.conn.executemany("""
+                UPDATE jobs SET status = 'leased', worker_id = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE id = ?
+            """, [(worker_id, now + lease_seconds, job_id) for job_id, _ in rows])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def heartbeat(self, worker_id, lease_seconds=120):
+        """延長此工作者所有租約並更新存活時間"""
+        now = time.time()
+        self.conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE worker_id = ? AND status = 'leased'",
+            (now + lease_seconds, worker_id),
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO workers (worker_id, pid, last_heartbeat) VALUES (?, ?, ?)",
+            (worker_id, os.getpid(), now),
+        )
+
+    def complete(self, job_id):
+        self.conn.execute(
+            "UPDATE jobs SET status = 'done', lease_expires = NULL, error = NULL, finished_at = ? WHERE id = ?",
+            (time.time(), job_id),
+        )
+
+    def fail(self, job_id, error, max_attempts=3):
+        """記錄失敗；未超過嘗試上限時放回佇列"""
+        self.conn.execute("""
+            UPDATE jobs SET
+                status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                worker_id = NULL, lease_expires = NULL, error = ?, finished_at = ?
+            WHERE id = ?
+        """, (max_attempts, error[:500], time.time(), job_id))
+
+    def requeue_worker(self, worker_id, max_attempts=3):
+        """把已結束工作者租用中的工作放回佇列並清除其心跳紀錄，回傳放回數量"""
+        cursor = self.conn.execute("""
+            UPDATE jobs SET
+                status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                worker_id = NULL, lease_expires = NULL, error = 'worker died'
+            WHERE worker_id = ? AND status = 'leased'
+        """, (max_attempts, worker_id))
+        # 編號會給補上的工作者沿用，舊的心跳不能讓新行程被判定逾時
+        self.conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+        return cursor.rowcount
+
+    def prune_stale_workers(self, max_age, max_attempts=3):
+        """放回所有已沒有心跳的工作者的工作並刪除其紀錄（例如上次執行留下的），回傳放回數量"""
+        return sum(self.requeue_worker(worker_id, max_attempts) for worker_id in self.stale_workers(max_age))
+
+    def stale_workers(self, max_age):
+        """超過 max_age 秒沒有心跳的工作者"""
+        rows = self.conn.execute(
+            "SELECT worker_id FROM workers WHERE last_heartbeat < ?", (time.time() - max_age,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self):
+        """各狀態的工作數量"""
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+
+async def _worker_loop(worker_id, queue_path, output_dir, concurrency, lease_seconds, max_attempts):
+    from crawl4ai import AsyncWebCrawler, BrowserConfig
+
+    # 每個工作者行程在 CRAWL_METRICS_PORT + 編號 提供自己的指標
+    base_port = os.environ.get("CRAWL_METRICS_PORT")
+    if base_port:
+        crawl_metrics.enable_metrics(int(base_port) + int(worker_id[1:]))
+
+    # sqlite3 連線只能在建立它的執行緒使用，所有操作交給同一個執行緒依序執行
+    db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"jobs-{worker_id}")
+    loop = asyncio.get_running_loop()
+
+    async def run_db(function, *args):
+        return await loop.run_in_executor(db_thread, function, *args)
+
+    queue = await run_db(JobQueue, queue_path)
+    await run_db(queue.heartbeat, worker_id, lease_seconds)
+
+    async def send_heartbeats():
+        while True:
+            await asyncio.sleep(lease_seconds / 4)
+            await run_db(queue.heartbeat, worker_id, lease_seconds)
+
+    heartbeat_task = asyncio.create_task(send_heartbeats())
+    processed = 0
+
+    try:
+        async with AsyncWebCrawler(config=BrowserConfig(headless=True, verbose=False)) as crawler, \
+                ResultExporter(output_dir, f"worker_{worker_id}") as exporter:
+            crawl_metrics.PhaseTimer().attach(crawler)
+
+            async def crawl_lane():
+                # 每條通道完成一頁就立刻租下一個工作，不等待同批其他頁面
+                nonlocal processed
+                while True:
+                    jobs = await run_db(queue.lease, worker_id, 1, lease_seconds)
+                    if not jobs:
+                        return
+                    job_id, url = jobs[0]
+                    try:
+                        start = time.perf_counter()
+                        result = await crawler.arun(url=url)
+                        crawl_metrics.record_crawl_result(result, time.perf_counter() - start)
+                        if result.success:
+                            exporter.write_result(result, include_markdown=True)
+                            await run_db(queue.complete, job_id)
+                        else:
+                            await run_db(queue.fail, job_id, result.error_message or "crawl failed", max_attempts)
+                    except Exception as e:
+                        crawl_metrics.record_error(e)
+                        await run_db(queue.fail, job_id, str(e), max_attempts)
+                    processed += 1
+
+            await asyncio.gather(*[crawl_lane() for _ in range(concurrency)])
+    finally:
+        heartbeat_task.cancel()
+        await run_db(queue.close)
+        db_thread.shutdown(wait=False)
+
+    print(f"   👷 工作者 {worker_id} 結束，處理 {processed} 個工作")
+
+
+def worker_main(worker_id, queue_path, output_dir, concurrency=2, lease_seconds=120, max_attempts=3):
+    """工作者行程進入點"""
+    asyncio.run(_worker_loop(worker_id, queue_path, output_dir, concurrency, lease_seconds, max_attempts))
+
+
+def run_coordinator(urls, workers=None, queue_path="crawl_jobs.sqlite", output_dir="exports",
+                    concurrency=2, lease_seconds=120, max_attempts=3, poll_interval=2.0,
+                    max_restarts=5, restart_backoff=2.0, stable_seconds=60.0):
+    """建立佇列、啟動工作者並監控，直到所有工作完成"""
+    workers = workers or os.cpu_count() or 1
+    crawl_metrics.enable_metrics_from_env()
+    queue = JobQueue(queue_path)
+    added = queue.enqueue(urls)
+    print(f"📥 新增 {added} 個工作（佇列: {queue_path}）")
+    # 上次執行中斷時留下的工作者紀錄，其租用的工作直接放回佇列
+    requeued = queue.prune_stale_workers(lease_seconds, max_attempts)
+    if requeued:
+        print(f"   🧹 放回上次執行留下的 {requeued} 個工作")
+
+    # 使用 spawn 避免子行程繼承父行程的事件迴圈與瀏覽器狀態
+    context = multiprocessing.get_context("spawn")
+
+    # 補上的工作者沿用原本的編號，CRAWL_METRICS_PORT + 編號 的抓取目標保持不變
+    worker_ids = [f"w{n:02d}" for n in range(1, workers + 1)]
+    processes = {}
+    started_at = {}
+    # 每個編號連續異常結束的次數，以及排定重啟的時間
+    crashes = dict.fromkeys(worker_ids, 0)
+    restart_at = {}
+
+    def start_worker(worker_id):
+        process = context.Process(
+            target=worker_main,
+            args=(worker_id, queue_path, output_dir, concurrency, lease_seconds, max_attempts),
+            name=f"crawl-worker-{worker_id}",
+        )
+        process.start()
+        processes[worker_id] = process
+        started_at[worker_id] = time.time()
+
+    for worker_id in worker_ids:
+        start_worker(worker_id)
+    print(f"🚀 啟動 {len(processes)} 個工作者行程")
+
+    start_time = time.time()
+    aborted = False
+    try:
+        while True:
+            time.sleep(poll_interval)
+            counts = queue.counts()
+
+            # 行程還在但心跳停止（例如卡住），直接結束它，下面會把工作放回佇列
+            for worker_id in queue.stale_workers(lease_seconds):
+                process = processes.get(worker_id)
+                if process is not None and process.is_alive():
+                    print(f"   ⏱️ 工作者 {worker_id} 心跳逾時，強制結束")
+                    process.terminate()
+                    process.join(timeout=10)
+                elif process is None:
+                    # 不屬於目前任何行程的紀錄（已結束或等待重啟），直接清除
+                    queue.requeue_worker(worker_id, max_attempts)
+
+            for worker_id, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                requeued = queue.requeue_worker(worker_id, max_attempts)
+                del processes[worker_id]
+                if process.exitcode == 0:
+                    # 正常結束表示已經租不到工作，不再補上
+                    continue
+                print(f"   💥 工作者 {worker_id} 異常結束（exit {process.exitcode}），放回 {requeued} 個工作")
+                if time.time() - started_at[worker_id] >= stable_seconds:
+                    crashes[worker_id] = 0
+                crashes[worker_id] += 1
+                if crashes[worker_id] > max_restarts:
+                    # 例如沒有安裝瀏覽器：啟動就失敗的工作者不會增加工作的嘗試次數，重啟也沒有用
+                    print(f"   🛑 工作者 {worker_id} 連續異常結束 {crashes[worker_id]} 次，停止爬取")
+                    aborted = True
+                    break
+                if queue.counts()["pending"] > 0:
+                    delay = restart_backoff * 2 ** (crashes[worker_id] - 1)
+                    restart_at[worker_id] = time.time() + delay
+                    print(f"   🔁 {delay:.1f}s 後重新啟動工作者 {worker_id}")
+            if aborted:
+                break
+
+            for worker_id, when in list(restart_at.items()):
+                if time.time() >= when:
+                    del restart_at[worker_id]
+                    start_worker(worker_id)
+
+            counts = queue.counts()
+            crawl_metrics.set_queue_depth(counts["pending"], queue="jobs")
+            crawl_metrics.set_browser_count(sum(1 for p in processes.values() if p.is_alive()))
+            elapsed = time.time() - start_time
+            rate = counts["done"] / elapsed if elapsed else 0.0
+            print(f"   📊 待處理 {counts['pending']}，處理中 {counts['leased']}，完成 {counts['done']}，"
+                  f"失敗 {counts['failed']}（{rate:.2f} 頁/秒）")
+
+            if not (processes or restart_at) or counts["pending"] + counts["leased"] == 0:
+                break
+    finally:
+        for process in processes.values():
+            if aborted:
+                process.terminate()
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        for worker_id in processes:
+            queue.requeue_worker(worker_id, max_attempts)
+
+    counts = queue.counts()
+    queue.close()
+    elapsed = time.time() - start_time
+    print(f"\n🎉 完成 {counts['done']} 頁，失敗 {counts['failed']} 頁，耗時 {elapsed:.1f}s")
+    return counts
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="多行程 Crawl4AI 工作者")
+    parser.add_argument("url_file", help="每行一個 URL 的文字檔")
+    parser.add_argument("--workers", type=int, default=None, help="工作者行程數（預設為 CPU 核心數）")
+    parser.add_argument("--concurrency", type=int, default=2, help="每個行程同時爬取的頁數")
+    parser.add_argument("--queue", default="crawl_jobs.sqlite", help="SQLite 佇列檔案")
+    parser.add_argument("--output", default="exports", help="結果匯出資料夾")
+    args = parser.parse_args()
+
+    with open(args.url_file, "r", encoding="utf-8") as f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    print("=" * 60)
+    print("🏭 Crawl4AI 多行程爬取")
+    print("=" * 60)
+    run_coordinator(urls, workers=args.workers, queue_path=args.queue,
+                    output_dir=args.output, concurrency=args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@
 import asyncio
 import json
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, BrowserConfig
+from js_results import JsResultChannel, first_js_result
 
 async def debug_image_extraction():
     """詳細的圖片擷取除錯測試"""
@@ -134,12 +135,15 @@ async def debug_image_extraction():
     return result;
     """
     
+    # 限制第一次回傳的大小，all_images 等大型陣列改以分頁取回，每個陣列最多取回 500 項
+    js_channel = JsResultChannel(max_bytes=128 * 1024, max_string=1000, max_items=500)
+    
     crawler_config = CrawlerRunConfig(
         word_count_threshold=1,  # 降低閾值
         excluded_tags=[],  # 不排除任何標籤
         excluded_selector="",  # 不排除任何選擇器
         exclude_external_links=False,
-        js_code=debug_js,
+        js_code=js_channel.wrap(debug_js),
         wait_for="css:img",  # 等待圖片載入
         delay_before_return_html=3.0  # 載入後等待3秒
     )
@@ -150,6 +154,7 @@ async def debug_image_extraction():
     )
     
     async with AsyncWebCrawler(config=browser_config) as crawler:
+        js_channel.attach(crawler)
         print(f"🔗 開始爬取: {url}")
         result = await crawler.arun(url=url, config=crawler_config)
         
@@ -157,7 +162,9 @@ async def debug_image_extraction():
         print(f"📄 頁面標題: {result.metadata.get('title', 'N/A')}")
         
         if result.js_execution_result:
-            js_result = result.js_execution_result
+            # 腳本回傳值在 Crawl4AI 的 results 清單中
+            js_result = first_js_result(result.js_execution_result)
+            js_channel.print_report()
             
             print(f"\n📊 圖片統計:")
             print(f"   🖼️ IMG 元素總數: {js_result.get('total_img_elements', 0)}")
@@ -7,29 +7,95 @@ import asyncio
 import json
 import re
 import os
-import aiohttp
 import aiofiles
-import ssl
 from datetime import datetime
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, BrowserConfig
+from resource_blocking import ResourceBlocker
+from result_export import ResultExporter
+from image_dedup import close_dedup_pool, dedupe_images
+from image_probe import check_image_content, probe_image
+from adaptive_concurrency import AdaptiveConcurrencyLimiter, BACKOFF_STATUSES
+from resilience import HostResilience, TransientError
+from http_session import get_shared_session, get_session_manager, close_shared_sessions
+from incremental_crawl import FingerprintStore, IncrementalCrawler, is_unchanged
+from crawl_metrics import enable_metrics_from_env, record_download, record_error
+from crawl_tracing import enable_tracing_from_env, instrument, span, write_trace
+from page_pool import PagePool
+from js_results import JsResultChannel, first_js_result
+from scroll_harvest import ScrollHarvester
+from search_index import SearchIndex
+from screenshot_pipeline import ScreenshotPipeline
 
-async def download_image(session, url, file_path, semaphore):
-    """下載單張圖片"""
-    async with semaphore:
-        try:
+async def fetch_image(session, url, limiter):
+    """取得圖片內容，回傳 (狀態碼, 內容)；429/5xx 拋出 TransientError 交給重試"""
+    async with limiter.slot(url, kind="download") as slot:
+        manager = get_session_manager()
+        if manager.http2:
+            status, content = await manager.fetch_http2(url)
+        else:
             async with session.get(url) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    async with aiofiles.open(file_path, 'wb') as f:
-                        await f.write(content)
-                    return {"url": url, "file_path": file_path, "status": "success", "size": len(content)}
-                else:
-                    return {"url": url, "file_path": file_path, "status": "failed", "error": f"HTTP {response.status}"}
+                status = response.status
+                content = await response.read() if status == 200 else None
+        slot.report_status(status)
+        if status in BACKOFF_STATUSES:
+            raise TransientError(f"HTTP {status}")
+        return status, content
+
+def prefetch_images(batch, prefetched, limiter, resilience):
+    """捲動途中一發現圖片就開始下載，內容先留在記憶體，之後由 download_images_batch 寫入檔案"""
+    session = get_shared_session()
+    for img in batch:
+        url = img.get('src', '')
+        if url and url not in prefetched:
+            prefetched[url] = asyncio.create_task(
+                resilience.call(url, lambda url=url: fetch_image(session, url, limiter))
+            )
+
+async def check_prefetched(url, task, min_bytes):
+    """等待預先下載完成，以與探測相同的規則檢查內容；下載失敗時留給之後的下載流程回報"""
+    try:
+        status, content = await task
+    except Exception as e:
+        return {'url': url, 'accepted': True, 'format': None, 'reason': str(e)}
+    if content is None:
+        return {'url': url, 'accepted': True, 'format': None, 'reason': f"HTTP {status}"}
+    return check_image_content(url, content, min_bytes=min_bytes)
+
+def cancel_prefetched(prefetched):
+    """取消沒有用到的預先下載"""
+    for task in prefetched.values():
+        task.cancel()
+    prefetched.clear()
+
+async def download_image(session, url, file_path, limiter, resilience, prefetched=None):
+    """下載單張圖片（暫時性錯誤會重試，主機持續失敗時由斷路器直接略過）"""
+    with span("image_download", url=url) as trace:
+        try:
+            if prefetched is not None:
+                # 捲動時已經開始下載，直接等待結果
+                status, content = await prefetched
+            else:
+                status, content = await resilience.call(url, lambda: fetch_image(session, url, limiter))
+            trace.set_attribute("status", status)
+            if content is not None:
+                async with aiofiles.open(file_path, 'wb') as f:
+                    await f.write(content)
+                record_download(True, len(content))
+                trace.set_attribute("bytes", len(content))
+                return {"url": url, "file_path": file_path, "status": "success", "size": len(content)}
+            else:
+                record_download(False)
+                return {"url": url, "file_path": file_path, "status": "failed", "error": f"HTTP {status}"}
         except Exception as e:
+            record_download(False)
+            record_error(e)
+            trace.set_attribute("error", str(e))
             return {"url": url, "file_path": file_path, "status": "failed", "error": str(e)}
 
-async def download_images_batch(images, base_folder, test_name):
-    """批量下載圖片"""
+async def download_images_batch(images, base_folder, test_name, dedupe=False, similarity_threshold=0.9,
+                                probe=False, min_bytes=1024, limiter=None, resilience=None, prefetched=None):
+    """批量下載圖片（probe=True 時先探測並略過追蹤像素，dedupe=True 時移除近似重複的圖片並產生縮圖；
+    prefetched 為 prefetch_images 已開始的下載，這些圖片不再探測也不重複下載）"""
     # 建立資料夾名稱：測試名稱+image+執行時間
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     folder_name = f"{test_name}_images_{timestamp}"
@@ -39,85 +105,118 @@ async def download_images_batch(images, base_folder, test_name):
     os.makedirs(images_folder, exist_ok=True)
     print(f"📁 建立圖片資料夾: {folder_name}")
     
-    # 建立 HTTP session 和 semaphore（限制併發）
-    semaphore = asyncio.Semaphore(5)  # 最多同時下載5張圖片
+    # 依主機自動調整併發數（延遲正常時逐步增加，遇到 429/5xx/逾時則減半）
+    if limiter is None:
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=5)
+    if resilience is None:
+        resilience = HostResilience()
     
-    # 建立 SSL 配置（跳過證書驗證）
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
+    download_results = []
+    skipped_images = []
+    prefetched = prefetched if prefetched is not None else {}
     
-    connector = aiohttp.TCPConnector(limit=10, ssl=ssl_context)
-    timeout = aiohttp.ClientTimeout(total=30)
+    # 使用全程式共用的 session：DNS 快取與 keep-alive 連線可跨批次重用
+    session = get_shared_session()
+    tasks = []
     
-    download_results = []
+    candidates = [
+        (i, img.get('src', ''), img)
+        for i, img in enumerate(images, 1)
+        if img.get('src', '') and not img.get('src', '').startswith('data:')
+    ]
+    
+    # 下載前探測：只讀檔頭，排除追蹤像素與非圖片內容；捲動時已下載的圖片直接檢查內容
+    probed_formats = {}
+    if probe:
+        print(f"🔎 探測 {len(candidates)} 張圖片（{sum(1 for c in candidates if c[1] in prefetched)} 張已預先下載）...")
+        probes = await asyncio.gather(*[
+            check_prefetched(img_url, prefetched[img_url], min_bytes) if img_url in prefetched
+            else probe_image(session, img_url, limiter, min_bytes=min_bytes)
+            for _, img_url, _ in candidates
+        ])
+        accepted = []
+        for candidate, probe_result in zip(candidates, probes):
+            if probe_result['accepted']:
+                probed_formats[candidate[1]] = probe_result['format']
+                accepted.append(candidate)
+            else:
+                skipped_images.append({'url': candidate[1], 'reason': probe_result['reason']})
+        print(f"   ⏭️ 略過 {len(skipped_images)} 張，保留 {len(accepted)} 張")
+        candidates = accepted
     
-    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-        tasks = []
+    for i, img_url, img in candidates:
+        # 優先使用探測到的實際格式，否則從 URL 獲取檔案副檔名
+        try:
+            file_extension = probed_formats.get(img_url) or img_url.split('.')[-1].split('?')[0].lower()
+            if file_extension not in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'svg', 'avif']:
+                file_extension = 'jpg'  # 預設為 jpg
+        except:
+            file_extension = 'jpg'
         
-        for i, img in enumerate(images, 1):
-            img_url = img.get('src', '')
-            if not img_url or img_url.startswith('data:'):
-                continue
-            
-            # 從 URL 獲取檔案副檔名
-            try:
-                file_extension = img_url.split('.')[-1].split('?')[0].lower()
-                if file_extension not in ['jpg', 'jpeg', 'png', 'gif', 'webp', 'svg']:
-                    file_extension = 'jpg'  # 預設為 jpg
-            except:
-                file_extension = 'jpg'
-            
-            # 建立檔案名稱
-            img_alt = img.get('alt', '').replace('/', '_').replace('\\', '_')[:50]  # 限制長度並移除特殊字元
-            filename = f"img_{i:03d}_{img_alt}_{timestamp}.{file_extension}"
-            filename = "".join(c for c in filename if c.isalnum() or c in '._-')  # 只保留安全字元
-            
-            file_path = os.path.join(images_folder, filename)
-            
-            # 建立下載任務
-            task = download_image(session, img_url, file_path, semaphore)
-            tasks.append((task, img_url, filename, img))
+        # 建立檔案名稱
+        img_alt = img.get('alt', '').replace('/', '_').replace('\\', '_')[:50]  # 限制長度並移除特殊字元
+        filename = f"img_{i:03d}_{img_alt}_{timestamp}.{file_extension}"
+        filename = "".join(c for c in filename if c.isalnum() or c in '._-')  # 只保留安全字元
         
-        print(f"🚀 開始下載 {len(tasks)} 張圖片...")
+        file_path = os.path.join(images_folder, filename)
         
-        # 執行所有下載任務
-        for i, (task, url, filename, img_info) in enumerate(tasks, 1):
-            try:
-                result = await task
-                download_results.append({
-                    'index': i,
-                    'filename': filename,
-                    'url': url,
-                    'alt': img_info.get('alt', ''),
-                    'success': result['status'] == 'success',
-                    'error': result.get('error', ''),
-                    'size': result.get('size', 0)
-                })
+        # 建立下載任務（立即排程，實際併發由 limiter 控制）
+        task = asyncio.create_task(
+            download_image(session, img_url, file_path, limiter, resilience, prefetched.pop(img_url, None))
+        )
+        tasks.append((task, img_url, filename, img))
+    
+    # 捲動時預先下載、但最後沒有列入清單的圖片不再需要
+    cancel_prefetched(prefetched)
+    
+    print(f"🚀 開始下載 {len(tasks)} 張圖片...")
+    
+    # 執行所有下載任務
+    for i, (task, url, filename, img_info) in enumerate(tasks, 1):
+        try:
+            result = await task
+            download_results.append({
+                'index': i,
+                'filename': filename,
+                'url': url,
+                'alt': img_info.get('alt', ''),
+                'success': result['status'] == 'success',
+                'error': result.get('error', ''),
+                'size': result.get('size', 0)
+            })
+            
+            if result['status'] == 'success':
+                print(f"   ✅ ({i}/{len(tasks)}) {filename} - {result.get('size', 0)} bytes")
+            else:
+                print(f"   ❌ ({i}/{len(tasks)}) {filename} - {result.get('error', '')}")
                 
-                if result['status'] == 'success':
-                    print(f"   ✅ ({i}/{len(tasks)}) {filename} - {result.get('size', 0)} bytes")
-                else:
-                    print(f"   ❌ ({i}/{len(tasks)}) {filename} - {result.get('error', '')}")
-                    
-            except Exception as e:
-                print(f"   💥 ({i}/{len(tasks)}) {filename} - 下載異常: {str(e)}")
-                download_results.append({
-                    'index': i,
-                    'filename': filename,
-                    'url': url,
-                    'alt': img_info.get('alt', ''),
-                    'success': False,
-                    'error': str(e),
-                    'size': 0
-                })
+        except Exception as e:
+            print(f"   💥 ({i}/{len(tasks)}) {filename} - 下載異常: {str(e)}")
+            download_results.append({
+                'index': i,
+                'filename': filename,
+                'url': url,
+                'alt': img_info.get('alt', ''),
+                'success': False,
+                'error': str(e),
+                'size': 0
+            })
     
     # 統計結果
     successful_downloads = sum(1 for r in download_results if r['success'])
     print(f"\n📊 下載完成統計:")
     print(f"   ✅ 成功: {successful_downloads} 張")
     print(f"   ❌ 失敗: {len(download_results) - successful_downloads} 張")
+    if probe:
+        print(f"   ⏭️ 探測略過: {len(skipped_images)} 張")
     print(f"   📁 儲存位置: {images_folder}")
+    limiter.print_report()
+    resilience.print_report()
+    
+    # 近似重複過濾（在行程池中解碼，不阻塞事件迴圈）
+    dedupe_report = None
+    if dedupe:
+        dedupe_report = await dedupe_images(download_results, images_folder, similarity_threshold)
     
     # 儲存下載報告（使用相對路徑）
     report_path = os.path.join(images_folder, "download_report.json")
@@ -133,7 +232,12 @@ async def download_images_batch(images, base_folder, test_name):
             'total_images': len(download_results),
             'successful_downloads': successful_downloads,
             'failed_downloads': len(download_results) - successful_downloads,
-            'download_results': download_results
+            'download_results': download_results,
+            'skipped_images': skipped_images,
+            'concurrency': limiter.snapshot(),
+            'resilience': resilience.snapshot(),
+            'http_session': get_session_manager().snapshot(),
+            'dedupe': dedupe_report
         }, indent=2, ensure_ascii=False))
     
     print(f"   📄 下載報告: {relative_report_path}")
@@ -165,13 +269,41 @@ async def esports_news_test():
         headless=True
     )
     
+    # 文章內容與上次相同時，略過截圖、圖片下載與匯出
+    incremental = IncrementalCrawler(FingerprintStore())
+    
+    # 延遲載入的圖片：逐步捲動收集，發現一批就先開始下載
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=5)
+    resilience = HostResilience()
+    prefetched = {}
+    # 爬過的頁面等指紋比對確認有變更後才捲動，未變更時不捲動也不下載
+    harvester = ScrollHarvester(on_images=lambda batch: prefetch_images(batch, prefetched, limiter, resilience),
+                                incremental=incremental)
+    # 整頁截圖最多 8000px，在執行緒池中轉成 WebP
+    screenshots = ScreenshotPipeline(max_height=8000, image_format="webp", quality=80)
+    
     async with AsyncWebCrawler(config=browser_config) as crawler:
+        incremental.attach(crawler)
+        harvester.attach(crawler)
+        screenshots.attach(crawler)
+        instrument(crawler)
         print(f"📰 正在爬取電競新聞: {url}")
         
-        result = await crawler.arun(
-            url=url,
-            config=crawler_config
-        )
+        result = await incremental.arun(crawler, url, crawler_config)
+        
+        harvester.print_report()
+        
+        if is_unchanged(result):
+            cancel_prefetched(prefetched)
+            previous = incremental.previous_artefacts(url)
+            print(f"♻️ 文章內容未變更（指紋 {result.metadata.get('fingerprint')}），沿用上次結果")
+            print(f"📄 頁面標題: {result.metadata.get('title', 'N/A')}")
+            print(f"📝 內容長度: {len(result.markdown)} 字元")
+            print(f"📁 圖片資料夾: {previous.get('images_folder', 'N/A')}")
+            print(f"📸 頁面截圖: {previous.get('screenshot_path', 'N/A')}")
+            incremental.store.close()
+            screenshots.close()
+            return
         
         print(f"✅ 爬取完成！")
         print(f"📄 頁面標題: {result.metadata.get('title', 'N/A')}")
@@ -192,6 +324,13 @@ async def esports_news_test():
             images = result.media['images']
             print(f"   找到 {len(images)} 張圖片")
             
+            # 加入捲動時才出現、但不在 media 中的圖片
+            known_sources = {img.get('src') for img in images}
+            lazy_images = [img for img in harvester.images if img['src'] not in known_sources]
+            if lazy_images:
+                print(f"   🖱️ 捲動另外找到 {len(lazy_images)} 張延遲載入的圖片")
+                images = images + lazy_images
+            
             # 顯示前10張圖片資訊
             for i, img in enumerate(images[:10], 1):
                 print(f"   📷 圖片 {i}: {img.get('src', 'N/A')}")
@@ -204,8 +343,14 @@ async def esports_news_test():
             images_folder, download_results = await download_images_batch(
                 images, 
                 ".", 
-                "esports_news"
+                "esports_news",
+                dedupe=True,
+                probe=True,
+                limiter=limiter,
+                resilience=resilience,
+                prefetched=prefetched
             )
+            incremental.record_artefacts(url, images_folder=os.path.relpath(images_folder))
             
         else:
             print(f"   ❌ 內建圖片擷取未找到圖片")
@@ -249,19 +394,12 @@ async def esports_news_test():
                 print()
         
         # 儲存截圖
-        if result.screenshot:
-            screenshot_path = "esports_screenshot.png"
-            if isinstance(result.screenshot, str):
-                # 如果是 base64 字串，需要解碼
-                import base64
-                screenshot_data = base64.b64decode(result.screenshot)
-            else:
-                # 如果已經是 bytes
-                screenshot_data = result.screenshot
-                
-            with open(screenshot_path, "wb") as f:
-                f.write(screenshot_data)
-            print(f"📸 頁面截圖已儲存至: esports_screenshot.png")
+        # 解碼與寫檔在執行緒池中進行，副檔名依實際格式決定
+        screenshot_path = await screenshots.save(result, "esports_screenshot")
+        if screenshot_path:
+            print(f"📸 頁面截圖已儲存至: {screenshot_path}")
+            incremental.record_artefacts(url, screenshot_path=screenshot_path)
+        screenshots.print_report()
         
         # 分析連結
         if result.links:
@@ -293,6 +431,19 @@ async def esports_news_test():
             json.dump(result_data, f, indent=2, ensure_ascii=False)
         
         print(f"\n💾 完整結果已儲存至: esports_result.json")
+        
+        # 同時附加到壓縮 JSONL，累積多次執行的結果
+        with ResultExporter("exports", "esports_news") as exporter:
+            exporter.write_result(result, include_markdown=True)
+        exporter.print_summary()
+        
+        # 加入本機全文索引，與台灣網站的結果一起查詢
+        with SearchIndex() as index:
+            index.add_result(result)
+            index.print_summary()
+        cancel_prefetched(prefetched)
+        incremental.store.close()
+        screenshots.close()
 
 async def esports_with_css_selector_test():
     """使用 CSS 選擇器專門擷取文章內容"""
@@ -318,7 +469,16 @@ async def esports_with_css_selector_test():
     
     browser_config = BrowserConfig(headless=True)
     
+    # 這裡只比較 markdown 內容，圖片、字型與廣告請求直接中止
+    blocker = ResourceBlocker("text-only")
+    
     async with AsyncWebCrawler(config=browser_config) as crawler:
+        blocker.attach(crawler)
+        instrument(crawler)
+        # 每個選擇器都爬同一頁，重用同一個預熱分頁而不是每次開新分頁
+        pool = PagePool(size=1)
+        pool.attach(crawler)
+        await pool.warm(crawler_config)
         for i, selector in enumerate(css_selectors, 1):
             try:
                 print(f"🔍 測試選擇器 {i}: {selector}")
@@ -348,6 +508,9 @@ async def esports_with_css_selector_test():
             except Exception as e:
                 print(f"   ❌ 選擇器失敗: {str(e)}")
                 print()
+        
+        blocker.print_report()
+        pool.print_report()
 
 async def esports_images_extraction_test():
     """專門擷取圖片的測試"""
@@ -366,8 +529,7 @@ async def esports_images_extraction_test():
         }
     });
     
-    // 等待額外的時間讓動態內容載入
-    await new Promise(resolve => setTimeout(resolve, 2000));
+    // 延遲載入的圖片已在執行前由 ScrollHarvester 捲動載入，不再固定等待
     
     // 獲取所有圖片，包括 srcset 中的圖片
     const images = [];
@@ -440,18 +602,30 @@ async def esports_images_extraction_test():
     return result;
     """
     
+    # 圖片清單可能很大：第一次只回傳 256 KB 以內，其餘以游標分頁取回，每個陣列最多 1000 項
+    js_channel = JsResultChannel(max_items=1000)
+    
+    # 執行 JS 之前先逐步捲動，讓 loading="lazy" 的圖片載入，並提早開始下載
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=5)
+    resilience = HostResilience()
+    prefetched = {}
+    harvester = ScrollHarvester(on_images=lambda batch: prefetch_images(batch, prefetched, limiter, resilience))
+    
     crawler_config = CrawlerRunConfig(
         word_count_threshold=10,
         excluded_tags=["script", "footer", "link"],  # 移除 iframe，因為可能包含圖片
         excluded_selector="[class^='_mentions'],[class='container__bannerZone'],[class^='_topBanner'],[class^='_wallpaperBanner'],[id^='lsadvert'],[class^='_newsSection']",
         exclude_external_links=False,
-        js_code=js_code,
+        js_code=js_channel.wrap(js_code),
         wait_for="css:img"  # 等待圖片元素載入
     )
     
     browser_config = BrowserConfig(headless=True)
     
     async with AsyncWebCrawler(config=browser_config) as crawler:
+        instrument(crawler)
+        harvester.attach(crawler)
+        js_channel.attach(crawler)
         result = await crawler.arun(
             url=url,
             config=crawler_config
@@ -460,13 +634,10 @@ async def esports_images_extraction_test():
         print(f"✅ JavaScript 圖片擷取完成")
         
         if result.js_execution_result:
-            js_result = result.js_execution_result
-            
             # 處理 Crawl4AI 的結果格式
-            if isinstance(js_result, dict) and 'results' in js_result and js_result['results']:
-                actual_result = js_result['results'][0]
-            else:
-                actual_result = js_result
+            actual_result = first_js_result(result.js_execution_result)
+            js_channel.print_report()
+            harvester.print_report()
             
             print(f"🖼️ 找到 {actual_result.get('total_images', 0)} 張圖片")
             print(f"🎨 找到 {actual_result.get('total_background_images', 0)} 張背景圖片")
@@ -489,7 +660,12 @@ async def esports_images_extraction_test():
                 js_images_folder, js_download_results = await download_images_batch(
                     images, 
                     ".", 
-                    "esports_js"
+                    "esports_js",
+                    dedupe=True,
+                    probe=True,
+                    limiter=limiter,
+                    resilience=resilience,
+                    prefetched=prefetched
                 )
             
             # 顯示背景圖片
@@ -506,6 +682,8 @@ async def esports_images_extraction_test():
         else:
             print(f"❌ JavaScript 執行失敗或無結果")
             print(f"執行結果: {result.js_execution_result}")
+        
+        cancel_prefetched(prefetched)
 
 async def main():
     """主函數"""
@@ -513,6 +691,11 @@ async def main():
     print("🎮 電競新聞網站專門測試")
     print("=" * 60)
     
+    # 設定 CRAWL_METRICS_PORT 時提供 Prometheus 指標端點
+    enable_metrics_from_env()
+    # 設定 CRAWL_TRACE_FILE 時記錄每次爬取的 span 並寫成追蹤檔
+    enable_tracing_from_env()
+    
     try:
         await esports_news_test()
         await esports_with_css_selector_test()
@@ -524,13 +707,17 @@ async def main():
         print("\n📁 生成的檔案:")
         print("   📄 esports_result.json - 完整結果資料")
         print("   🖼️ esports_images.json - 圖片資訊")
-        print("   📸 esports_screenshot.png - 頁面截圖")
+        print("   📸 esports_screenshot.webp - 頁面截圖")
         print("   📁 images/ - 圖片資料夾")
         
     except Exception as e:
         print(f"❌ 測試過程中發生錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
+    finally:
+        await close_shared_sessions()
+        await close_dedup_pool()
+        write_trace()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+以 sitemap 與 RSS/Atom 探索新文章
+
+新聞與科技網站的首頁只是用來找出新文章，卻要用完整的瀏覽器渲染。
+FeedDiscovery 直接以 HTTP 讀取 robots.txt 列出的 sitemap（或指定的 RSS/Atom 來源），
+邊下載邊用 lxml 的增量解析器處理（支援 sitemap index 與 .xml.gz），
+只保留 lastmod 比上次執行更新的 URL，可以一邊解析一邊送進爬取佇列。
+每個網站看過的最新時間記在 SQLite 中，下次只取之後的文章；
+爬取失敗的 URL 由使用端以 retry_later() 記下，下次執行時優先重新產生。
+
+用法：
+    python feed_discovery.py https://technews.tw --feed https://technews.tw/feed/
+"""
+
+import argparse
+import asyncio
+import contextlib
+import sqlite3
+import zlib
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+from lxml import etree
+
+from http_session import close_shared_sessions, get_shared_session
+
+# robots.txt 沒有列出 sitemap 時嘗試的路徑
+FALLBACK_PATHS = ("/sitemap.xml",)
+
+
+def parse_feed_date(text):
+    """解析 sitemap（W3C 日期時間）與 RSS（RFC 822）的日期，統一轉成 UTC；無法解析時回傳 None"""
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(text)
+        except (TypeError, ValueError):
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _local_name(elem):
+    return etree.QName(elem).localname if isinstance(elem.tag, str) else None
+
+
+def _child_text(elem, *names):
+    """第一個名稱符合的子孫元素文字（忽略命名空間）"""
+    for child in elem.iter():
+        if child is not elem and _local_name(child) in names and child.text:
+            return child.text.strip()
+    return None
+
+
+def _atom_link(entry):
+    for child in entry:
+        if _local_name(child) == "link" and child.get("rel", "alternate") == "alternate":
+            return child.get("href")
+    return None
+
+
+def _parse_entry(elem):
+    """把一個 sitemap/RSS/Atom 項目轉成 (種類, URL, 日期)；不是項目時回傳 None"""
+    name = _local_name(elem)
+    if name == "url":
+        # Google News sitemap 的 publication_date 比 lastmod 更精確
+        date = _child_text(elem, "publication_date") or _child_text(elem, "lastmod")
+        return "page", _child_text(elem, "loc"), parse_feed_date(date)
+    if name == "sitemap":
+        return "sitemap", _child_text(elem, "loc"), parse_feed_date(_child_text(elem, "lastmod"))
+    if name == "item":
+        date = _child_text(elem, "pubDate", "date", "updated")
+        return "page", _child_text(elem, "link"), parse_feed_date(date)
+    if name == "entry":
+        date = _child_text(elem, "updated", "published")
+        return "page", _atom_link(elem), parse_feed_date(date)
+    return None
+
+
+class DiscoveryState:
+    """以 SQLite 記錄每個網站看過的最新文章時間，以及尚未讀完時已產生過的 URL"""
+
+    def __init__(self, path="discovery_state.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sites (
+                site TEXT PRIMARY KEY,
+                watermark TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_urls (
+                site TEXT NOT NULL,
+                url TEXT NOT NULL,
+                date TEXT NOT NULL,
+                PRIMARY KEY (site, url)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS retry_urls (
+                site TEXT NOT NULL,
+                url TEXT NOT NULL,
+                date TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                PRIMARY KEY (site, url)
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, site):
+        row = self.conn.execute("SELECT watermark FROM sites WHERE site = ?", (site,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def save(self, site, watermark):
+        """來源全部讀完時前進起點；比起點舊的已產生 URL 不必再記"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sites (site, watermark, updated_at) VALUES (?, ?, ?)",
+            (site, watermark.isoformat(), datetime.now(timezone.utc).isoformat(timespec="seconds")),
+        )
+        self.prune_seen(site, watermark)
+
+    def seen(self, site):
+        """起點之後已經產生過的 URL"""
+        rows = self.conn.execute("SELECT url FROM seen_urls WHERE site = ?", (site,)).fetchall()
+        return {row[0] for row in rows}
+
+    def add_seen(self, site, entries):
+        """記錄這次產生的 (URL, 日期)，起點不前進時下次略過它們"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO seen_urls (site, url, date) VALUES (?, ?, ?)",
+            [(site, url, date.isoformat()) for url, date in entries],
+        )
+        self.conn.commit()
+
+    def prune_seen(self, site, cutoff):
+        # 日期都以 UTC ISO 格式儲存，可以直接比較字串
+        self.conn.execute("DELETE FROM seen_urls WHERE site = ? AND date <= ?", (site, cutoff.isoformat()))
+        self.conn.commit()
+
+    def retries(self, site):
+        """上次爬取失敗、等待重試的 (URL, 日期, 已失敗次數)"""
+        rows = self.conn.execute(
+            "SELECT url, date, attempts FROM retry_urls WHERE site = ? ORDER BY date DESC", (site,)
+        ).fetchall()
+        return [(url, datetime.fromisoformat(date), attempts) for url, date, attempts in rows]
+
+    def add_retry(self, site, url, date, attempts):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO retry_urls (site, url, date, attempts) VALUES (?, ?, ?, ?)",
+            (site, url, date.isoformat(), attempts),
+        )
+        self.conn.commit()
+
+    def remove_retry(self, site, url):
+        self.conn.execute("DELETE FROM retry_urls WHERE site = ? AND url = ?", (site, url))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class FeedDiscovery:
+    """串流解析 sitemap 與 RSS/Atom，只產生上次執行後的新 URL"""
+
+    def __init__(self, state=None, max_urls=20, max_sources=10, first_run_hours=24, chunk_size=64 * 1024,
+                 max_retries=3):
+        self.state = state
+        # 每個網站最多產生幾個 URL、最多讀幾個 sitemap/feed
+        self.max_urls = max_urls
+        self.max_sources = max_sources
+        # 第一次執行（沒有紀錄）時只取這段時間內的文章
+        self.first_run_hours = first_run_hours
+        self.chunk_size = chunk_size
+        # 同一個 URL 最多重新產生幾次，之後放棄
+        self.max_retries = max_retries
+        self.sites = {}
+        # 這次產生過的 URL → (網站, 日期, 已失敗次數)，retry_later() 用
+        self._produced = {}
+        self.stats = {"sources": 0, "failed_sources": 0, "bytes": 0, "entries": 0,
+                      "new": 0, "old": 0, "undated": 0, "skipped_sitemaps": 0,
+                      "retried": 0, "retry_later": 0, "abandoned": 0}
+
+    async def find_sources(self, site_url):
+        """從 robots.txt 找出 sitemap；沒有列出時使用常見路徑"""
+        robots_url = urljoin(site_url, "/robots.txt")
+        sitemaps = []
+        try:
+            async with get_shared_session().get(robots_url) as response:
+                if response.status == 200:
+                    for line in (await response.text(errors="replace")).splitlines():
+                        key, _, value = line.partition(":")
+                        if key.strip().lower() == "sitemap" and value.strip():
+                            # 有些網站列出相對路徑
+                            sitemaps.append(urljoin(robots_url, value.strip()))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        return sitemaps or [urljoin(site_url, path) for path in FALLBACK_PATHS]
+
+    async def _stream_entries(self, source_url):
+        """邊下載邊解析，逐一產生 (種類, URL, 日期)"""
+        async with get_shared_session().get(source_url) as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status, message=response.reason
+                )
+            parser = etree.XMLPullParser(events=("end",), resolve_entities=False, no_network=True)
+            decompressor = None
+            first = True
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                self.stats["bytes"] += len(chunk)
+                if first:
+                    # .xml.gz 通常以 application/gzip 傳送，aiohttp 不會自動解壓縮
+                    if chunk[:2] == b"\x1f\x8b":
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    first = False
+                parser.feed(decompressor.decompress(chunk) if decompressor else chunk)
+                for entry in self._read_events(parser):
+                    yield entry
+            parser.close()
+            for entry in self._read_events(parser):
+                yield entry
+
+    def _read_events(self, parser):
+        for _, elem in parser.read_events():
+            entry = _parse_entry(elem)
+            if entry is None:
+                continue
+            # 處理完的項目立即釋放，大型 sitemap 也只佔用固定的記憶體
+            elem.clear()
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+            if entry[1]:
+                self.stats["entries"] += 1
+                yield entry
+
+    async def iter_new_urls(self, site_url, feeds=None):
+        """依序產生 (URL, 日期)；所有來源都讀完後才把最新的日期記為下次的起點"""
+        site = urlparse(site_url).hostname
+        since = self.state.get(site) if self.state is not None else None
+        cutoff = since or datetime.now(timezone.utc) - timedelta(hours=self.first_run_hours)
+        site_stats = self.sites.setdefault(site, {"sources": 0, "failed": 0, "new": 0})
+        if self.state is not None:
+            self.state.prune_seen(site, cutoff)
+        # 上次因為達到上限而沒有前進起點時，已經產生過的 URL
+        already = self.state.seen(site) if self.state is not None else set()
+
+        # 上次爬取失敗的 URL 先重新產生（不佔 max_urls 名額），再次失敗時由使用端再記一次
+        retried = set()
+        for url, date, attempts in (self.state.retries(site) if self.state is not None else []):
+            self.state.remove_retry(site, url)
+            if attempts >= self.max_retries:
+                self.stats["abandoned"] += 1
+                continue
+            retried.add(url)
+            self._produced[url] = (site, date, attempts)
+            self.stats["retried"] += 1
+            yield url, date
+
+        sources = deque(feeds or await self.find_sources(site_url))
+        newest = since
+        seen = {}
+        read = 0
+        # 有來源沒讀完（達到上限或讀取失敗）時，起點之後還可能有沒取到的文章
+        complete = True
+        while sources and read < self.max_sources and len(seen) < self.max_urls:
+            source = sources.popleft()
+            read += 1
+            try:
+                # 提前結束時立即關閉回應，不等垃圾回收
+                async with contextlib.aclosing(self._stream_entries(source)) as entries:
+                    async for kind, url, date in entries:
+                        if kind == "sitemap":
+                            # sitemap index 中沒有更新過的子 sitemap 不必下載
+                            if date is not None and date <= cutoff:
+                                self.stats["skipped_sitemaps"] += 1
+                            else:
+                                sources.append(urljoin(source, url))
+                            continue
+                        if date is None:
+                            self.stats["undated"] += 1
+                            continue
+                        url = urljoin(source, url)
+                        if date <= cutoff or url in seen or url in retried:
+                            self.stats["old"] += 1
+                            continue
+                        if url in already:
+                            # 上次已經產生過，但讀完時起點仍要前進到它的日期
+                            newest = max(newest, date) if newest else date
+                            self.stats["old"] += 1
+                            continue
+                        seen[url] = date
+                        self._produced[url] = (site, date, 0)
+                        newest = max(newest, date) if newest else date
+                        site_stats["new"] += 1
+                        self.stats["new"] += 1
+                        yield url, date
+                        if len(seen) >= self.max_urls:
+                            complete = False
+                            break
+                site_stats["sources"] += 1
+                self.stats["sources"] += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError, etree.XMLSyntaxError, zlib.error) as e:
+                # zlib.error：損毀或被截斷的 .xml.gz
+                complete = False
+                site_stats["failed"] += 1
+                self.stats["failed_sources"] += 1
+                print(f"   ⚠️ 無法讀取 {source}: {type(e).__name__}")
+        if sources:
+            complete = False
+
+        if self.state is None:
+            return
+        if complete:
+            if newest is not None and newest != since:
+                self.state.save(site, newest)
+        elif seen:
+            # 起點維持不變，下次從同樣的位置讀取並略過這次已產生的 URL
+            self.state.add_seen(site, seen.items())
+
+    def retry_later(self, url):
+        """使用端爬取失敗時呼叫：下次執行時重新產生這個 URL（起點照常前進）"""
+        produced = self._produced.get(url)
+        if produced is None or self.state is None:
+            return
+        site, date, attempts = produced
+        self.state.add_retry(site, url, date, attempts + 1)
+        self.stats["retry_later"] += 1
+
+    async def fill_queue(self, site_url, queue, feeds=None):
+        """把新 URL 邊解析邊放進 asyncio.Queue，結束時放入 None"""
+        try:
+            async for url, _ in self.iter_new_urls(site_url, feeds):
+                await queue.put(url)
+        finally:
+            await queue.put(None)
+
+    def found_sources(self, site_url):
+        """這個網站是否至少成功讀取一個 sitemap/feed"""
+        return self.sites.get(urlparse(site_url).hostname, {}).get("sources", 0) > 0
+
+    def snapshot(self):
+        """探索統計"""
+        return dict(self.stats, sites={site: dict(s) for site, s in self.sites.items()})
+
+    def print_report(self):
+        """顯示讀取的來源與新文章數"""
+        s = self.stats
+        print(f"\n🗺️ sitemap/RSS 探索: 讀取 {s['sources']} 個來源（失敗 {s['failed_sources']}），"
+              f"{s['bytes'] / 1024:.0f} KB，{s['entries']} 個項目")
+        print(f"   新文章 {s['new']}，較舊 {s['old']}，無日期 {s['undated']}，"
+              f"略過未更新的子 sitemap {s['skipped_sitemaps']}")
+        if s["retried"] or s["retry_later"] or s["abandoned"]:
+            print(f"   🔁 重新產生上次失敗的 {s['retried']} 篇，這次失敗待重試 {s['retry_later']} 篇，"
+                  f"放棄 {s['abandoned']} 篇")
+
+
+async def main():
+    """命令列入口：列出網站的新文章"""
+    parser = argparse.ArgumentParser(description="從 sitemap/RSS 探索網站的新文章")
+    parser.add_argument("site", help="網站首頁，例如 https://technews.tw")
+    parser.add_argument("--feed", action="append", help="指定 sitemap 或 RSS/Atom 網址（可重複）")
+    parser.add_argument("--max-urls", type=int, default=20, help="最多列出幾個 URL")
+    parser.add_argument("--hours", type=int, default=24, help="沒有紀錄時只取這幾小時內的文章")
+    parser.add_argument("--no-state", action="store_true", help="不讀寫上次執行的紀錄")
+    options = parser.parse_args()
+
+    state = None if options.no_state else DiscoveryState()
+    discovery = FeedDiscovery(state, max_urls=options.max_urls, first_run_hours=options.hours)
+    try:
+        async for url, date in discovery.iter_new_urls(options.site, options.feed):
+            print(f"   {date:%Y-%m-%d %H:%M}  {url}")
+        discovery.print_report()
+    finally:
+        if state is not None:
+            state.close()
+        await close_shared_sessions(show_report=False)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,34 @@
+"""
+Crawl4AI 掛鉤（hook）工具
+
+Crawl4AI 的每種 hook 只能設定一個函數，這裡提供串接方式，
+讓多個功能（資源封鎖、追蹤等）可以同時掛在同一個爬蟲上。
+"""
+
+import asyncio
+
+
+async def _call_hook(hook, *args, **kwargs):
+    """呼叫同步或非同步的 hook 函數"""
+    if asyncio.iscoroutinefunction(hook):
+        return await hook(*args, **kwargs)
+    return hook(*args, **kwargs)
+
+
+def add_hook(crawler, hook_type, hook):
+    """在既有 hook 之後串接新的 hook，不覆蓋先前設定的函數"""
+    strategy = crawler.crawler_strategy
+    previous = strategy.hooks.get(hook_type)
+
+    if previous is None:
+        strategy.set_hook(hook_type, hook)
+        return
+
+    async def chained(*args, **kwargs):
+        result = await _call_hook(previous, *args, **kwargs)
+        # 前一個 hook 可能回傳替換後的物件（例如 page），沿用給下一個 hook
+        if result is not None and args:
+            args = (result,) + args[1:]
+        return await _call_hook(hook, *args, **kwargs)
+
+    strategy.set_hook(hook_type, chained)
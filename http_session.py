@@ -0,0 +1,195 @@
+"""
+全程式共用的 HTTP session 管理
+
+所有圖片下載與 HTTP 快速路徑共用同一個 aiohttp session：
+DNS 查詢結果依 TTL 快取、連線依主機保持 keep-alive，避免每批次重新握手。
+設定 CRAWL_HTTP2=1 時圖片下載改用 httpx 的 HTTP/2 用戶端（同一主機的請求共用一條多工連線），
+結束時統一優雅關閉並顯示連線重用統計。
+
+session 綁定建立它的事件迴圈，每個 asyncio.run() 結束前都要呼叫 close_shared_sessions()。
+換了迴圈時，舊迴圈若仍在其他執行緒運作，舊連線會交回該迴圈關閉；舊迴圈已經結束時無法再 await close()，
+舊的 session 只能捨棄（連線要等行程結束才釋放），並顯示警告。
+"""
+
+import asyncio
+import os
+import ssl
+
+import aiohttp
+
+
+def _insecure_ssl_context():
+    """跳過證書驗證（與原本圖片下載的相容性設定相同）"""
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+class SessionManager:
+    """延遲建立、可重用的 HTTP session 與連線統計"""
+
+    def __init__(self, limit=100, limit_per_host=32, dns_ttl=300, keepalive_timeout=60, total_timeout=30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.total_timeout = total_timeout
+        # 圖片下載是否改用 HTTP/2 用戶端
+        self.http2 = os.environ.get("CRAWL_HTTP2") == "1"
+        self._session = None
+        self._http2_client = None
+        self._loop = None
+        self.stats = {
+            "requests": 0,
+            "new_connections": 0,
+            "reused_connections": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+            "http2_requests": 0,
+        }
+
+    def _trace_config(self):
+        trace_config = aiohttp.TraceConfig()
+
+        def counter(name):
+            async def handler(session, context, params):
+                self.stats[name] += 1
+            return handler
+
+        trace_config.on_request_start.append(counter("requests"))
+        trace_config.on_connection_create_end.append(counter("new_connections"))
+        trace_config.on_connection_reuseconn.append(counter("reused_connections"))
+        trace_config.on_dns_cache_hit.append(counter("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(counter("dns_cache_misses"))
+        return trace_config
+
+    def _check_loop(self):
+        # session 綁定建立時的事件迴圈，換了迴圈（例如再次 asyncio.run）就要重建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._release_stale_clients()
+            self._session = None
+            self._http2_client = None
+            self._loop = loop
+
+    def _release_stale_clients(self):
+        """換了事件迴圈：舊迴圈仍在運作時交回它關閉，已結束時只能捨棄"""
+        session, client = self._session, self._http2_client
+        if session is not None and session.closed:
+            session = None
+        if client is not None and client.is_closed:
+            client = None
+        if session is None and client is None:
+            return
+        old_loop = self._loop
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._close_clients(session, client), old_loop)
+        else:
+            print("⚠️ 上一個事件迴圈結束前沒有呼叫 close_shared_sessions()，舊連線無法優雅關閉")
+
+    def get_session(self):
+        """取得共用的 aiohttp session"""
+        self._check_loop()
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout,
+                ssl=_insecure_ssl_context(),
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.total_timeout),
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    def get_http2_client(self):
+        """取得共用的 httpx 用戶端（支援 HTTP/2 的主機會自動使用 h2）"""
+        import httpx
+
+        self._check_loop()
+        if self._http2_client is None or self._http2_client.is_closed:
+            async def count_request(request):
+                self.stats["http2_requests"] += 1
+
+            self._http2_client = httpx.AsyncClient(
+                http2=True,
+                verify=False,
+                # 與 aiohttp 一致：自動跟隨圖片 CDN 的轉址
+                follow_redirects=True,
+                timeout=self.total_timeout,
+                limits=httpx.Limits(
+                    max_connections=self.limit,
+                    max_keepalive_connections=self.limit_per_host,
+                    keepalive_expiry=self.keepalive_timeout,
+                ),
+                event_hooks={"request": [count_request]},
+            )
+        return self._http2_client
+
+    async def fetch_http2(self, url):
+        """以 HTTP/2 用戶端取得 (狀態碼, 內容)，非 200 時內容為 None；
+        連線錯誤轉成與 aiohttp 相同的例外，重試與併發退讓照常運作"""
+        import httpx
+
+        try:
+            response = await self.get_http2_client().get(url)
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e)) from e
+        except httpx.TransportError as e:
+            raise aiohttp.ClientConnectionError(str(e)) from e
+        return response.status_code, response.content if response.status_code == 200 else None
+
+    async def _close_clients(self, session, client):
+        if session is not None and not session.closed:
+            await session.close()
+            # 讓 SSL 連線有時間完成關閉握手
+            await asyncio.sleep(0.25)
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    async def close(self):
+        """優雅關閉所有連線"""
+        session, client = self._session, self._http2_client
+        self._session = None
+        self._http2_client = None
+        await self._close_clients(session, client)
+
+    def snapshot(self):
+        """連線重用統計"""
+        connections = self.stats["new_connections"] + self.stats["reused_connections"]
+        reuse_ratio = self.stats["reused_connections"] / connections if connections else 0.0
+        return dict(self.stats, reuse_ratio=round(reuse_ratio, 3))
+
+    def print_report(self):
+        """顯示連線重用統計"""
+        s = self.snapshot()
+        print(f"\n🔌 HTTP 連線統計:")
+        print(f"   請求 {s['requests']}，新連線 {s['new_connections']}，重用 {s['reused_connections']}"
+              f"（重用率 {s['reuse_ratio']:.0%}）")
+        print(f"   DNS 快取命中 {s['dns_cache_hits']} / 未命中 {s['dns_cache_misses']}")
+        if s["http2_requests"]:
+            print(f"   HTTP/2 用戶端請求 {s['http2_requests']}")
+
+
+_manager = SessionManager()
+
+
+def get_session_manager():
+    """取得全程式共用的 SessionManager"""
+    return _manager
+
+
+def get_shared_session():
+    """取得全程式共用的 aiohttp session"""
+    return _manager.get_session()
+
+
+async def close_shared_sessions(show_report=True):
+    """程式（每個 asyncio.run）結束前呼叫：顯示統計並在目前的迴圈上關閉共用連線"""
+    if show_report and _manager.stats["requests"] + _manager.stats["http2_requests"]:
+        _manager.print_report()
+    await _manager.close()
@@ -0,0 +1,180 @@
+"""
+下載後的圖片近似重複過濾與縮圖
+
+同一張照片常以不同 URL 或尺寸出現。這裡在行程池中用 Pillow 計算感知雜湊（dHash）
+並產生縮圖，相似度超過門檻的圖片視為重複，解碼等 CPU 密集工作不佔用事件迴圈。
+行程池在模組層級共用，多次去重不必重新啟動子行程；程式結束前呼叫 close_dedup_pool() 關閉。
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+HASH_SIZE = 8  # 8x8 = 64 位元雜湊
+HASH_BITS = HASH_SIZE * HASH_SIZE
+
+# 共用的行程池，第一次去重時建立
+_pool = None
+
+
+def _get_pool(max_workers=None):
+    """取得共用行程池；max_workers 只在第一次建立時生效"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=max_workers)
+    return _pool
+
+
+async def close_dedup_pool():
+    """程式結束前呼叫：在背景執行緒等待子行程結束，不阻塞事件迴圈"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await asyncio.to_thread(pool.shutdown)
+
+
+def _difference_hash(image):
+    """計算 dHash：比較相鄰像素的亮度差"""
+    from PIL import Image
+
+    resample = getattr(Image, "Resampling", Image).LANCZOS
+    gray = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), resample)
+    pixels = list(gray.getdata())
+
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hash_and_thumbnail(file_path, thumbnail_dir, thumbnail_size=(256, 256)):
+    """在子行程中解碼圖片、計算雜湊並輸出縮圖"""
+    from PIL import Image
+
+    try:
+        with Image.open(file_path) as image:
+            image.load()
+            width, height = image.size
+            image_hash = _difference_hash(image)
+
+            thumbnail_path = None
+            if thumbnail_dir:
+                thumbnail = image.convert("RGB")
+                thumbnail.thumbnail(thumbnail_size)
+                base_name = os.path.splitext(os.path.basename(file_path))[0]
+                thumbnail_path = os.path.join(thumbnail_dir, f"{base_name}_thumb.jpg")
+                thumbnail.save(thumbnail_path, "JPEG", quality=80, optimize=True)
+
+        return {
+            "file_path": file_path,
+            "hash": f"{image_hash:016x}",
+            "width": width,
+            "height": height,
+            "pixels": width * height,
+            "thumbnail_path": thumbnail_path,
+            "error": "",
+        }
+    except Exception as e:
+        # SVG 或損毀的檔案無法由 Pillow 解碼
+        return {"file_path": file_path, "hash": None, "error": str(e)}
+
+
+def hamming_distance(hash_a, hash_b):
+    """兩個十六進位雜湊之間不同的位元數"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def _remove_files(paths, thumbnails):
+    """刪除重複圖片與其縮圖，回傳實際刪除的圖片數"""
+    removed = 0
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            if thumbnails.get(path) and os.path.exists(thumbnails[path]):
+                os.remove(thumbnails[path])
+            removed += 1
+    return removed
+
+
+def cluster_by_similarity(hashed_images, similarity_threshold=0.9):
+    """依相似度分群，每群以解析度最高的圖片作為代表"""
+    max_distance = int(HASH_BITS * (1 - similarity_threshold))
+    clusters = []
+
+    for item in sorted(hashed_images, key=lambda x: x["pixels"], reverse=True):
+        for cluster in clusters:
+            if hamming_distance(cluster["hash"], item["hash"]) <= max_distance:
+                cluster["duplicates"].append(item["file_path"])
+                break
+        else:
+            clusters.append({"keep": item["file_path"], "hash": item["hash"], "duplicates": []})
+
+    return clusters
+
+
+async def dedupe_images(download_results, images_folder, similarity_threshold=0.9,
+                        remove_duplicates=True, make_thumbnails=True, max_workers=None):
+    """對下載成功的圖片做近似重複過濾，回傳分群結果"""
+    file_paths = [
+        os.path.join(images_folder, r['filename'])
+        for r in download_results
+        if r['success']
+    ]
+    if not file_paths:
+        return {"similarity_threshold": similarity_threshold, "clusters": [],
+                "duplicates_removed": 0, "unhashable": []}
+
+    thumbnail_dir = None
+    if make_thumbnails:
+        thumbnail_dir = os.path.join(images_folder, "thumbnails")
+        os.makedirs(thumbnail_dir, exist_ok=True)
+
+    print(f"🧮 計算 {len(file_paths)} 張圖片的感知雜湊...")
+    loop = asyncio.get_running_loop()
+    pool = _get_pool(max_workers)
+    hashed = await asyncio.gather(*[
+        loop.run_in_executor(pool, hash_and_thumbnail, path, thumbnail_dir)
+        for path in file_paths
+    ])
+
+    hashable = [h for h in hashed if h["hash"]]
+    unhashable = [h["file_path"] for h in hashed if not h["hash"]]
+    clusters = cluster_by_similarity(hashable, similarity_threshold)
+
+    duplicates_removed = 0
+    if remove_duplicates:
+        thumbnails = {h["file_path"]: h.get("thumbnail_path") for h in hashable}
+        duplicates = [d for cluster in clusters for d in cluster["duplicates"]]
+        # 檔案刪除在執行緒中進行，不佔用事件迴圈
+        duplicates_removed = await asyncio.to_thread(_remove_files, duplicates, thumbnails)
+
+    # 在下載結果中標記重複項目
+    duplicate_of = {}
+    for cluster in clusters:
+        for duplicate in cluster["duplicates"]:
+            duplicate_of[os.path.basename(duplicate)] = os.path.basename(cluster["keep"])
+    for r in download_results:
+        if r['filename'] in duplicate_of:
+            r['duplicate_of'] = duplicate_of[r['filename']]
+
+    print(f"   🧩 分群: {len(clusters)} 群，重複圖片: {sum(len(c['duplicates']) for c in clusters)} 張")
+    if unhashable:
+        print(f"   ⚠️ 無法解碼: {len(unhashable)} 張（例如 SVG）")
+
+    return {
+        "similarity_threshold": similarity_threshold,
+        "clusters": [
+            {
+                "keep": os.path.basename(c["keep"]),
+                "hash": c["hash"],
+                "duplicates": [os.path.basename(d) for d in c["duplicates"]],
+                "size": 1 + len(c["duplicates"]),
+            }
+            for c in clusters
+        ],
+        "duplicates_removed": duplicates_removed,
+        "unhashable": [os.path.basename(p) for p in unhashable],
+    }
@@ -0,0 +1,155 @@
+"""
+圖片下載前探測
+
+用一個小範圍的 Range 請求讀取 Content-Type、檔案大小與檔頭魔術位元組，
+在完整下載前排除追蹤像素、SVG 圖示與類型錯誤的檔案，並以實際格式命名。
+"""
+
+import asyncio
+import struct
+
+import aiohttp
+
+from adaptive_concurrency import BACKOFF_STATUSES
+
+PROBE_BYTES = 64
+
+# 伺服器忙碌或不支援 Range 時無法判斷，仍交給一般下載（由重試與斷路器處理）
+INCONCLUSIVE_STATUSES = BACKOFF_STATUSES | {416}
+
+DEFAULT_ALLOWED_FORMATS = {"jpg", "png", "gif", "webp", "avif"}
+
+
+def sniff_image_format(head):
+    """依檔頭魔術位元組判斷圖片格式，無法判斷時回傳 None"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:12] in (b"ftypavif", b"ftypavis"):
+        return "avif"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head.startswith(b"\x00\x00\x01\x00"):
+        return "ico"
+    text = head.lstrip().lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in text):
+        return "svg"
+    return None
+
+
+def sniff_dimensions(head, image_format):
+    """從檔頭讀取 PNG/GIF 的寬高（其他格式需要更多位元組，回傳 None）"""
+    try:
+        if image_format == "png" and len(head) >= 24:
+            return struct.unpack(">II", head[16:24])
+        if image_format == "gif" and len(head) >= 10:
+            return struct.unpack("<HH", head[6:10])
+    except struct.error:
+        pass
+    return None
+
+
+def _total_length(response):
+    """從 Content-Range 或 Content-Length 取得完整檔案大小"""
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[-1]
+        if total.isdigit():
+            return int(total)
+    if response.status == 200 and response.headers.get("Content-Length", "").isdigit():
+        return int(response.headers["Content-Length"])
+    return None
+
+
+async def _read_head(response):
+    """讀到 PROBE_BYTES 個位元組或內容結束（單次 read 可能只回傳部分資料）"""
+    head = b""
+    while len(head) < PROBE_BYTES:
+        chunk = await response.content.read(PROBE_BYTES - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+def _inconclusive(probe, reason):
+    # 探測沒有得到明確答案：不排除，照常下載
+    probe["accepted"] = True
+    probe["reason"] = f"無法探測，仍下載（{reason}）"
+    return probe
+
+
+async def probe_image(session, url, limiter, min_bytes=1024, min_pixels=4,
+                      allowed_formats=DEFAULT_ALLOWED_FORMATS):
+    """探測單張圖片，回傳是否值得下載及原因；只有明確的回應才會排除圖片"""
+    probe = {
+        "url": url,
+        "accepted": False,
+        "format": None,
+        "content_type": "",
+        "content_length": None,
+        "reason": "",
+    }
+
+    try:
+        async with limiter.slot(url, kind="probe") as slot:
+            headers = {"Range": f"bytes=0-{PROBE_BYTES - 1}"}
+            async with session.get(url, headers=headers) as response:
+                slot.report_status(response.status)
+                if response.status in INCONCLUSIVE_STATUSES:
+                    return _inconclusive(probe, f"HTTP {response.status}")
+                if response.status not in (200, 206):
+                    probe["reason"] = f"HTTP {response.status}"
+                    return probe
+                probe["content_type"] = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+                probe["content_length"] = _total_length(response)
+                # 伺服器忽略 Range 時也只讀前幾個位元組就釋放連線
+                head = await _read_head(response)
+    except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+        return _inconclusive(probe, type(e).__name__)
+    except Exception as e:
+        probe["reason"] = str(e)
+        return probe
+
+    return _judge_head(probe, head, min_bytes, min_pixels, allowed_formats)
+
+
+def _judge_head(probe, head, min_bytes, min_pixels, allowed_formats):
+    image_format = sniff_image_format(head)
+    probe["format"] = image_format
+
+    if probe["content_length"] is not None and probe["content_length"] < min_bytes:
+        probe["reason"] = f"檔案過小 ({probe['content_length']} bytes)"
+        return probe
+    if image_format is None:
+        probe["reason"] = f"非圖片內容 ({probe['content_type'] or '未知類型'})"
+        return probe
+    if image_format not in allowed_formats:
+        probe["reason"] = f"略過格式: {image_format}"
+        return probe
+
+    dimensions = sniff_dimensions(head, image_format)
+    if dimensions and dimensions[0] * dimensions[1] < min_pixels:
+        probe["reason"] = f"追蹤像素 ({dimensions[0]}x{dimensions[1]})"
+        return probe
+
+    probe["accepted"] = True
+    return probe
+
+
+def check_image_content(url, content, min_bytes=1024, min_pixels=4, allowed_formats=DEFAULT_ALLOWED_FORMATS):
+    """對已經下載的內容套用與探測相同的判斷（捲動時預先下載的圖片不再另外探測）"""
+    probe = {
+        "url": url,
+        "accepted": False,
+        "format": None,
+        "content_type": "",
+        "content_length": len(content),
+        "reason": "",
+    }
+    return _judge_head(probe, content[:PROBE_BYTES], min_bytes, min_pixels, allowed_formats)
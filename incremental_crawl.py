@@ -0,0 +1,231 @@
+"""
+增量重爬：以內容指紋略過未變更的頁面
+
+每個 URL 儲存正規化後 HTML 的 xxhash 指紋。頁面載入後若指紋與上次相同，
+就標記該頁並關閉這次爬取的截圖、PDF 與擷取策略，再把交給 Crawl4AI 後續處理的 HTML
+換成極小的空白頁，讓 HTML 清理與 markdown 產生幾乎不花時間；爬取本身仍算成功
+（不會記錄錯誤，也不會讓並行數退讓），最後直接回傳上次的結果，並在 metadata 中標記為 unchanged。
+"""
+
+import functools
+import json
+import re
+import sqlite3
+from datetime import datetime
+
+import xxhash
+from crawl4ai import CrawlerRunConfig
+from crawl4ai.cache_context import CacheContext, CacheMode
+from crawl4ai.models import CrawlResult, MarkdownGenerationResult
+
+from hook_utils import add_hook
+
+_STRIP_BLOCKS = re.compile(r'<(script|style|noscript|template|svg)\b.*?</\1\s*>', re.S | re.I)
+_COMMENTS = re.compile(r'<!--.*?-->', re.S)
+_TAGS = re.compile(r'<(/?[a-zA-Z][\w:-]*)([^>]*)>')
+_KEPT_ATTRIBUTES = re.compile(r'\b(href|src)\s*=\s*["\']([^"\']*)["\']', re.I)
+_WHITESPACE = re.compile(r'\s+')
+
+# 未變更頁面交給 Crawl4AI 後續處理的替代 HTML
+UNCHANGED_HTML = "<html><head></head><body></body></html>"
+
+
+def normalize_html(html):
+    """移除腳本、樣式、註解與易變屬性，只保留結構、文字與連結/圖片位址"""
+    html = _STRIP_BLOCKS.sub('', html or '')
+    html = _COMMENTS.sub('', html)
+
+    def keep_stable_attributes(match):
+        attributes = ' '.join(f'{k.lower()}="{v}"' for k, v in _KEPT_ATTRIBUTES.findall(match.group(2)))
+        return f'<{match.group(1).lower()}{" " + attributes if attributes else ""}>'
+
+    html = _TAGS.sub(keep_stable_attributes, html)
+    return _WHITESPACE.sub(' ', html).strip()
+
+
+def content_fingerprint(html):
+    """正規化 HTML 的 64 位元 xxhash 指紋"""
+    return xxhash.xxh3_64_hexdigest(normalize_html(html).encode('utf-8'))
+
+
+def is_unchanged(result):
+    """結果是否為沿用上次內容的未變更頁面"""
+    return (getattr(result, 'metadata', None) or {}).get('incremental_status') == 'unchanged'
+
+
+class FingerprintStore:
+    """以 SQLite 儲存每個 URL 的指紋與衍生結果"""
+
+    def __init__(self, path="incremental_state.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                crawled_at TEXT NOT NULL,
+                artefacts TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, url):
+        """取得 (指紋, 衍生結果)；沒有紀錄時回傳 None"""
+        row = self.conn.execute(
+            "SELECT fingerprint, artefacts FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def save(self, url, fingerprint, artefacts):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (url, fingerprint, crawled_at, artefacts) VALUES (?, ?, ?, ?)",
+            (url, fingerprint, datetime.now().isoformat(timespec='seconds'),
+             json.dumps(artefacts, ensure_ascii=False)),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class IncrementalCrawler:
+    """在爬蟲上加入指紋比對，未變更的頁面直接回傳上次的結果"""
+
+    def __init__(self, store, force=False):
+        self.store = store
+        self.force = force
+        self.stats = {"new": 0, "changed": 0, "unchanged": 0}
+        self._page_urls = {}
+        self._fingerprints = {}
+        self._unchanged_urls = set()
+
+    def attach(self, crawler):
+        """在頁面取得 HTML 後、截圖與內容處理前比對指紋"""
+        add_hook(crawler, "before_goto", self._before_goto)
+        add_hook(crawler, "before_return_html", self._before_return_html)
+
+        strategy = crawler.crawler_strategy
+        original = strategy.crawl
+        if getattr(original, "_incremental_wrapped", False):
+            return
+
+        @functools.wraps(original)
+        async def crawl(url, config=None, **kwargs):
+            response = await original(url, config=config, **kwargs)
+            # 只替換 arun() 建立的設定副本，且不寫入快取，以免空白頁被快取成這個 URL 的內容
+            if (url in self._unchanged_urls and getattr(config, "_incremental_run", False)
+                    and not CacheContext(url, config.cache_mode or CacheMode.ENABLED, False).should_write()):
+                response.html = UNCHANGED_HTML
+            return response
+
+        crawl._incremental_wrapped = True
+        strategy.crawl = crawl
+
+    async def _before_goto(self, page, context=None, url=None, **kwargs):
+        self._page_urls[id(page)] = url
+        return page
+
+    async def _before_return_html(self, page=None, html=None, config=None, **kwargs):
+        url = self._page_urls.get(id(page))
+        if url is None:
+            return page
+
+        fingerprint = content_fingerprint(html)
+        self._fingerprints[url] = fingerprint
+        previous = self.store.get(url)
+        if previous and previous[0] == fingerprint and not self.force:
+            self._unchanged_urls.add(url)
+            if getattr(config, "_incremental_run", False):
+                # 設定是 arun() 的副本，可以直接關閉之後用不到的輸出
+                config.screenshot = False
+                config.pdf = False
+                config.capture_mhtml = False
+                config.extraction_strategy = None
+        return page
+
+    async def arun(self, crawler, url, config=None):
+        """爬取單頁；未變更時回傳以上次結果組成的 CrawlResult"""
+        # 使用設定副本，判定未變更時才能關閉截圖與擷取而不影響呼叫端的設定
+        config = (config or CrawlerRunConfig()).clone()
+        config._incremental_run = True
+        result = await crawler.arun(url=url, config=config)
+        fingerprint = self._fingerprints.pop(url, None)
+
+        if url in self._unchanged_urls:
+            self._unchanged_urls.discard(url)
+            self.stats["unchanged"] += 1
+            return self._previous_result(url)
+
+        if result.success and fingerprint:
+            previous = self.store.get(url)
+            status = "changed" if previous else "new"
+            self.stats[status] += 1
+            artefacts = self._artefacts_from_result(result, fingerprint)
+            artefacts["metadata"]["incremental_status"] = status
+            self.store.save(url, fingerprint, artefacts)
+            if result.metadata is not None:
+                result.metadata["incremental_status"] = status
+        return result
+
+    def _artefacts_from_result(self, result, fingerprint):
+        return {
+            "fingerprint": fingerprint,
+            "status_code": result.status_code,
+            "metadata": dict(result.metadata or {}),
+            "markdown": str(result.markdown or ""),
+            "extracted_content": result.extracted_content,
+            "links": result.links or {},
+            "media": result.media or {},
+            "extra": {},
+        }
+
+    def _previous_result(self, url):
+        fingerprint, artefacts = self.store.get(url)
+        metadata = dict(artefacts.get("metadata") or {})
+        metadata["incremental_status"] = "unchanged"
+        metadata["fingerprint"] = fingerprint
+        markdown = artefacts.get("markdown", "")
+        return CrawlResult(
+            url=url,
+            html="",
+            success=True,
+            status_code=artefacts.get("status_code"),
+            metadata=metadata,
+            links=artefacts.get("links") or {},
+            media=artefacts.get("media") or {},
+            extracted_content=artefacts.get("extracted_content"),
+            markdown=MarkdownGenerationResult(
+                raw_markdown=markdown,
+                markdown_with_citations=markdown,
+                references_markdown="",
+            ),
+        )
+
+    def has_record(self, url):
+        """這個 URL 是否爬過（可能在指紋比對後判定為未變更）"""
+        return not self.force and self.store.get(url) is not None
+
+    def page_unchanged(self, url):
+        """目前這次爬取是否已判定頁面未變更"""
+        return url in self._unchanged_urls
+
+    def previous_artefacts(self, url):
+        """上次為此 URL 記錄的額外產物（例如圖片資料夾、截圖路徑）"""
+        record = self.store.get(url)
+        return record[1].get("extra", {}) if record else {}
+
+    def record_artefacts(self, url, **extra):
+        """記錄腳本自行產生的產物，下次未變更時可直接沿用"""
+        record = self.store.get(url)
+        if record is None:
+            return
+        fingerprint, artefacts = record
+        artefacts.setdefault("extra", {}).update(extra)
+        self.store.save(url, fingerprint, artefacts)
+
+    def print_report(self):
+        """顯示增量爬取統計"""
+        s = self.stats
+        print(f"\n♻️ 增量爬取: 新頁面 {s['new']}，已變更 {s['changed']}，未變更（略過處理）{s['unchanged']}")
@@ -0,0 +1,180 @@
+"""
+有大小上限、可分頁的 JS 執行結果
+
+大量 DOM 擷取（所有圖片、背景圖片、HTML 片段）一次從頁面回傳時，
+單一 devtools 訊息可能達數 MB。JsResultChannel 把使用者腳本的回傳值留在頁面中，
+第一次只回傳上限內的內容：過長的字串截斷，大型陣列只回傳第一頁並附上游標；
+其餘項目在 on_execution_ended hook 中以固定大小分頁取回（或交給回呼函數串流處理），
+並記錄每頁的傳輸大小。
+
+注意：上限只針對單一訊息。預設（max_items=None 且沒有 on_items）仍會把所有項目分頁取回並
+累積在 js_execution_result 中，總傳輸量與記憶體用量不受限制；處理不受控的頁面時應設定
+max_items，或以 on_items 把每頁項目串流寫出。
+"""
+
+import json
+
+from hook_utils import add_hook
+
+# 頁面端的結果暫存與分頁函數（重複注入不會覆蓋既有資料）
+_PAGE_CHANNEL_JS = """
+window.__crawlJsResults = window.__crawlJsResults || {
+    stored: {},
+    size(value) {
+        return JSON.stringify(value === undefined ? null : value).length;
+    },
+    take(items, cursor, maxBytes, allowEmpty) {
+        const page = [];
+        let used = 0;
+        while (cursor < items.length) {
+            const itemSize = this.size(items[cursor]);
+            if ((page.length > 0 || allowEmpty) && used + itemSize > maxBytes) break;
+            page.push(items[cursor]);
+            used += itemSize;
+            cursor += 1;
+        }
+        return { items: page, next_cursor: cursor < items.length ? cursor : null, bytes: used };
+    },
+    store(key, value, maxBytes, maxString) {
+        if (value === null || typeof value !== 'object' || Array.isArray(value)) {
+            value = { value: value };
+        }
+        const arrays = {};
+        // 所有陣列共用第一次回傳的大小上限
+        let budget = maxBytes;
+        const summary = { __key__: key, __paged__: {}, __truncated__: {} };
+        for (const [field, fieldValue] of Object.entries(value)) {
+            if (Array.isArray(fieldValue)) {
+                arrays[field] = fieldValue;
+                const first = this.take(fieldValue, 0, budget, true);
+                budget = Math.max(0, budget - first.bytes);
+                summary[field] = first.items;
+                summary.__paged__[field] = {
+                    total: fieldValue.length,
+                    returned: first.items.length,
+                    next_cursor: first.next_cursor,
+                };
+            } else if (typeof fieldValue === 'string' && fieldValue.length > maxString) {
+                summary[field] = fieldValue.substring(0, maxString);
+                summary.__truncated__[field] = fieldValue.length;
+            } else {
+                summary[field] = fieldValue;
+            }
+        }
+        this.stored[key] = arrays;
+        return summary;
+    },
+    page(key, field, cursor, maxBytes) {
+        const arrays = this.stored[key];
+        if (!arrays || !arrays[field]) return null;
+        return this.take(arrays[field], cursor, maxBytes, false);
+    },
+    drop(key) {
+        delete this.stored[key];
+    },
+};
+"""
+
+
+def _payload_bytes(value):
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def first_js_result(js_execution_result):
+    """取出 Crawl4AI 包在 results 清單中的第一個腳本回傳值"""
+    if isinstance(js_execution_result, dict) and js_execution_result.get("results"):
+        return js_execution_result["results"][0]
+    return js_execution_result
+
+
+class JsResultChannel:
+    """把每則訊息限制在固定大小內，大型陣列改以游標分頁取回（總量需另設 max_items 或 on_items）"""
+
+    def __init__(self, max_bytes=256 * 1024, page_bytes=256 * 1024, max_string=2000,
+                 max_items=None, on_items=None):
+        self.max_bytes = max_bytes
+        self.page_bytes = page_bytes
+        self.max_string = max_string
+        # 每個陣列最多取回的項目數（None 表示全部取回）
+        self.max_items = max_items
+        # on_items(field, items) 會收到每一頁的項目；設定後項目不再累積在結果中
+        self.on_items = on_items
+        self.stats = {"first_payload_bytes": 0, "paged_bytes": 0, "pages": 0,
+                      "truncated_strings": 0, "dropped_items": 0}
+
+    def wrap(self, script, key="result"):
+        """包裝使用者腳本：腳本的 return 值改由頁面端暫存並回傳有上限的摘要"""
+        options = json.dumps([key, self.max_bytes, self.max_string])
+        return (
+            f"{_PAGE_CHANNEL_JS}\n"
+            f"const __crawlValue = await (async () => {{\n{script}\n}})();\n"
+            f"const [__key, __maxBytes, __maxString] = {options};\n"
+            f"return window.__crawlJsResults.store(__key, __crawlValue, __maxBytes, __maxString);\n"
+        )
+
+    def attach(self, crawler):
+        """腳本執行完畢後，在取得 HTML 之前分頁取回其餘項目"""
+        add_hook(crawler, "on_execution_ended", self._on_execution_ended)
+
+    async def _on_execution_ended(self, page, context=None, result=None, **kwargs):
+        for summary in (result or {}).get("results", []):
+            if isinstance(summary, dict) and "__paged__" in summary:
+                await self.collect(page, summary)
+        return page
+
+    async def collect(self, page, summary):
+        """依游標取回各陣列剩下的項目，完成後清除頁面端暫存"""
+        key = summary.get("__key__", "result")
+        self.stats["first_payload_bytes"] += _payload_bytes(summary)
+        self.stats["truncated_strings"] += len(summary.get("__truncated__", {}))
+
+        for field, info in summary["__paged__"].items():
+            items = summary[field]
+            if self.on_items is not None:
+                self.on_items(field, list(items))
+                items.clear()
+
+            fetched = info["returned"]
+            cursor = info["next_cursor"]
+            while cursor is not None:
+                if self.max_items is not None and fetched >= self.max_items:
+                    self.stats["dropped_items"] += info["total"] - fetched
+                    break
+                try:
+                    chunk = await page.evaluate(
+                        "([key, field, cursor, maxBytes]) => "
+                        "window.__crawlJsResults.page(key, field, cursor, maxBytes)",
+                        [key, field, cursor, self.page_bytes],
+                    )
+                except Exception:
+                    # 腳本觸發了換頁等情況，暫存已不存在
+                    chunk = None
+                if chunk is None:
+                    info["incomplete"] = True
+                    break
+
+                self.stats["pages"] += 1
+                self.stats["paged_bytes"] += chunk["bytes"]
+                if self.on_items is not None:
+                    self.on_items(field, chunk["items"])
+                else:
+                    items.extend(chunk["items"])
+                fetched += len(chunk["items"])
+                cursor = chunk["next_cursor"]
+
+            info["returned"] = fetched
+            info["next_cursor"] = cursor
+
+        try:
+            await page.evaluate("(key) => window.__crawlJsResults && window.__crawlJsResults.drop(key)", key)
+        except Exception:
+            pass
+        return summary
+
+    def print_report(self):
+        """顯示 JS 結果的傳輸大小"""
+        s = self.stats
+        print(f"\n📦 JS 結果傳輸: 首次回傳 {s['first_payload_bytes'] / 1024:.1f} KB，"
+              f"分頁 {s['pages']} 次共 {s['paged_bytes'] / 1024:.1f} KB")
+        if s["truncated_strings"] or s["dropped_items"]:
+            print(f"   ✂️ 截斷字串 {s['truncated_strings']} 個，超過上限未取回 {s['dropped_items']} 項")
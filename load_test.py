@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+離線壓力測試
+
+以 synthetic_site.py 產生的本機網站測試批次爬取、深度爬取與圖片批次下載，
+不必對真實網站發出大量請求。伺服器可注入延遲與錯誤率，觀察併發控制與重試的行為。
+
+用法：
+    python load_test.py --pages 2000 --latency 20-200 --error-rate 0.02
+    python load_test.py --tests images --pages 5000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
+from crawl4ai.deep_crawling import BFSDeepCrawlStrategy
+
+from adaptive_concurrency import AdaptiveConcurrencyLimiter, crawl_many
+from crawl_deadline import CrawlDeadline, is_partial
+from esports_test import download_images_batch
+from http_session import close_shared_sessions
+from priority_scheduler import PriorityScheduler
+from slim_results import ResultSlimmer
+from synthetic_site import SyntheticSiteServer, generate_site, load_manifest, parse_range
+
+
+def _rate(count, elapsed):
+    return count / elapsed if elapsed else 0.0
+
+
+async def batch_crawl_load_test(server, pages, deadline_seconds=None):
+    """以 crawl_many 批次爬取所有頁面（可設定每頁的時間預算）"""
+    print(f"\n📦 批次爬取 {pages} 頁...")
+    urls = server.page_urls(pages)
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=16)
+    # 只需要統計數字，每頁完成就丟棄 HTML
+    slimmer = ResultSlimmer(fields=["markdown", "metadata"], spill=[])
+    deadline = CrawlDeadline(seconds=deadline_seconds) if deadline_seconds else None
+
+    start = time.perf_counter()
+    async with AsyncWebCrawler() as crawler:
+        if deadline is not None:
+            deadline.attach(crawler)
+        results = await crawl_many(crawler, urls, limiter, slimmer=slimmer)
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(1 for r in results if not isinstance(r, Exception) and r.success)
+    partial = sum(1 for r in results if not isinstance(r, Exception) and is_partial(r))
+    print(f"   ✅ 成功 {succeeded}/{len(urls)} 頁（部分結果 {partial} 頁），{elapsed:.1f}s"
+          f"（{_rate(len(urls), elapsed):.1f} 頁/秒）")
+    limiter.print_report()
+    slimmer.print_report()
+    if deadline is not None:
+        deadline.print_report()
+
+
+async def deep_crawl_load_test(server, pages, max_depth=3):
+    """從首頁以 BFS 深度爬取"""
+    print(f"\n🕸️ 深度爬取（深度 {max_depth}，最多 {pages} 頁）...")
+    config = CrawlerRunConfig(
+        deep_crawl_strategy=BFSDeepCrawlStrategy(max_depth=max_depth, max_pages=pages),
+    )
+
+    start = time.perf_counter()
+    async with AsyncWebCrawler() as crawler:
+        results = await crawler.arun(server.base_url + "/", config=config)
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(1 for r in results if r.success)
+    depths = {}
+    for r in results:
+        depth = (r.metadata or {}).get("depth", 0)
+        depths[depth] = depths.get(depth, 0) + 1
+    print(f"   ✅ 成功 {succeeded}/{len(results)} 頁，{elapsed:.1f}s（{_rate(len(results), elapsed):.1f} 頁/秒）")
+    print(f"   📊 各深度頁數: {dict(sorted(depths.items()))}")
+
+
+async def priority_load_test(server, pages, interactive=20, slots=8):
+    """批次爬取進行中穿插互動式單頁爬取，比較兩個通道的等待時間"""
+    print(f"\n🚦 優先排程：批次 {pages} 頁 + 互動式 {interactive} 頁...")
+    urls = server.page_urls(pages)
+    scheduler = PriorityScheduler(slots=slots)
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=slots, max_limit=slots * 2)
+    slimmer = ResultSlimmer(fields=["markdown"], spill=[])
+
+    async def interactive_crawls(crawler):
+        # 每 0.5 秒送出一個互動式爬取，記錄從送出到完成的時間
+        latencies = []
+        for url in urls[::max(1, len(urls) // interactive)][:interactive]:
+            await asyncio.sleep(0.5)
+            start = time.perf_counter()
+            await crawler.arun(url, lane="interactive")
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    async with AsyncWebCrawler() as crawler:
+        scheduler.attach(crawler)
+        with scheduler.lane("bulk"):
+            bulk = asyncio.create_task(crawl_many(crawler, urls, limiter, slimmer=slimmer))
+        latencies = await interactive_crawls(crawler)
+        await bulk
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"   ✅ {elapsed:.1f}s，互動式爬取 中位數 {latencies[len(latencies) // 2]:.2f}s"
+          f" / 最長 {latencies[-1]:.2f}s")
+    scheduler.print_report()
+
+
+async def image_download_load_test(server, images=None):
+    """以 download_images_batch 下載所有頁面引用的圖片"""
+    image_list = server.image_list(images)
+    print(f"\n🖼️ 下載 {len(image_list)} 張圖片...")
+
+    start = time.perf_counter()
+    images_folder, download_results = await download_images_batch(
+        image_list, ".", "load_test", dedupe=True, probe=True
+    )
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(1 for r in download_results if r["success"])
+    total_mb = sum(r["size"] for r in download_results) / 1024 / 1024
+    print(f"   ✅ 成功 {succeeded} 張（{total_mb:.1f} MB），{elapsed:.1f}s"
+          f"（{_rate(len(image_list), elapsed):.1f} 張/秒）")
+
+
+async def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="以本機合成網站做離線壓力測試")
+    parser.add_argument("--root", default="synthetic_site", help="合成網站資料夾")
+    parser.add_argument("--pages", type=int, default=1000, help="網站頁數")
+    parser.add_argument("--images", type=int, default=300, help="網站圖片數")
+    parser.add_argument("--tests", default="batch,deep,images", help="要執行的測試（batch、deep、images、priority）")
+    parser.add_argument("--latency", default="0", help="每個請求的延遲毫秒數，例如 20-200")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="以 503 回應的比例")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="30 秒後才回應的比例")
+    parser.add_argument("--deadline", type=float, default=None, help="批次爬取每頁的時間預算（秒）")
+    options = parser.parse_args()
+
+    print("=" * 60)
+    print("🏋️ 離線壓力測試")
+    print("=" * 60)
+
+    # 網站不存在或規模不同時重新產生
+    manifest_path = os.path.join(options.root, "manifest.json")
+    if not os.path.exists(manifest_path) or len(load_manifest(options.root)["pages"]) != options.pages:
+        generate_site(options.root, pages=options.pages, images=options.images)
+
+    tests = set(options.tests.split(","))
+    server = SyntheticSiteServer(options.root, latency_ms=parse_range(options.latency),
+                                 error_rate=options.error_rate, hang_rate=options.hang_rate)
+    try:
+        async with server:
+            if "batch" in tests:
+                await batch_crawl_load_test(server, options.pages, options.deadline)
+            if "deep" in tests:
+                await deep_crawl_load_test(server, options.pages)
+            if "priority" in tests:
+                await priority_load_test(server, options.pages)
+            if "images" in tests:
+                await image_download_load_test(server)
+            server.print_report()
+    finally:
+        await close_shared_sessions()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
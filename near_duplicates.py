@@ -0,0 +1,155 @@
+"""
+跨來源的近似重複頁面偵測
+
+不同新聞網站常轉載同一則通訊社稿件。這裡把 markdown 切成詞項後取連續 3 個詞項為 shingle，
+以單次雜湊的 MinHash（one-permutation hashing：每個 shingle 只算一次 xxhash，
+依低位元分到各個 bin 並保留最小值）產生簽章。短文章會留下空 bin，
+因此以旋轉補值（rotation densification）向右借用最近的非空 bin，讓每個 LSH 分段都能放入桶中。
+新頁面只和同桶的候選比較，每頁的成本與已處理頁數無關，能跟上爬取速度。
+"""
+
+import xxhash
+
+from search_index import tokenize
+
+
+def shingle_hashes(text, shingle_size=3):
+    """連續 shingle_size 個詞項組成的 shingle 雜湊集合"""
+    tokens = tokenize(text)
+    if len(tokens) < shingle_size:
+        return {xxhash.xxh3_64_intdigest(" ".join(tokens))} if tokens else set()
+    return {
+        xxhash.xxh3_64_intdigest(" ".join(tokens[i:i + shingle_size]))
+        for i in range(len(tokens) - shingle_size + 1)
+    }
+
+
+def minhash_signature(hashes, num_bins=128):
+    """one-permutation MinHash：低位元決定 bin，其餘位元取最小值，空 bin 以旋轉補值填滿"""
+    shift = num_bins.bit_length() - 1
+    mask = num_bins - 1
+    signature = [None] * num_bins
+    for value in hashes:
+        bucket = value & mask
+        rest = value >> shift
+        current = signature[bucket]
+        if current is None or rest < current:
+            signature[bucket] = rest
+    return densify(signature, 1 << (64 - shift))
+
+
+def densify(signature, offset):
+    """空 bin 借用右方（循環）最近的非空 bin，加上 距離 × offset 以區分借來的值；全空時不變"""
+    size = len(signature)
+    densified = list(signature)
+    nearest, distance = None, 0
+    # 從右往左掃兩輪，第一輪只用來找出繞回開頭時的最近值
+    for i in reversed(range(2 * size)):
+        value = signature[i % size]
+        if value is not None:
+            nearest, distance = value, 0
+            continue
+        distance += 1
+        if i < size and nearest is not None:
+            densified[i] = nearest + distance * offset
+    return densified
+
+
+def estimate_similarity(signature_a, signature_b):
+    """以簽章估計 Jaccard 相似度（兩邊都是空 bin 的不列入計算，只會發生在空集合）"""
+    same = total = 0
+    for a, b in zip(signature_a, signature_b):
+        if a is None and b is None:
+            continue
+        total += 1
+        if a == b:
+            same += 1
+    return same / total if total else 0.0
+
+
+def is_near_duplicate(result):
+    """結果是否被標記為其他頁面的近似重複"""
+    return bool((getattr(result, "metadata", None) or {}).get("near_duplicate_of"))
+
+
+class NearDuplicateDetector:
+    """以 MinHash + LSH 找出內容近似的頁面並分群"""
+
+    def __init__(self, threshold=0.7, num_bins=128, bands=32, shingle_size=3, min_shingles=20):
+        if num_bins & (num_bins - 1) or num_bins % bands:
+            raise ValueError("num_bins 必須是 2 的次方且能被 bands 整除")
+        self.threshold = threshold
+        self.num_bins = num_bins
+        self.bands = bands
+        self.rows = num_bins // bands
+        self.shingle_size = shingle_size
+        # shingle 太少的頁面（錯誤頁、空白頁）不參與比對
+        self.min_shingles = min_shingles
+        self._buckets = {}
+        self._signatures = {}
+        self.clusters = {}
+        self.stats = {"checked": 0, "duplicates": 0, "skipped": 0, "comparisons": 0}
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            if None not in rows:
+                yield band, tuple(rows)
+
+    def check(self, url, text):
+        """回傳 (代表頁面 URL, 相似度)；不是重複時回傳 (None, 0.0)，並把頁面加入索引"""
+        self.stats["checked"] += 1
+        hashes = shingle_hashes(text, self.shingle_size)
+        if len(hashes) < self.min_shingles:
+            self.stats["skipped"] += 1
+            return None, 0.0
+        signature = minhash_signature(hashes, self.num_bins)
+        keys = list(self._band_keys(signature))
+
+        # 同一桶中的候選再以完整簽章確認
+        candidates = set()
+        for key in keys:
+            candidates.update(self._buckets.get(key, ()))
+        candidates.discard(url)
+        best_url, best_similarity = None, 0.0
+        for candidate in candidates:
+            self.stats["comparisons"] += 1
+            similarity = estimate_similarity(signature, self._signatures[candidate])
+            if similarity > best_similarity:
+                best_url, best_similarity = candidate, similarity
+
+        if best_url is not None and best_similarity >= self.threshold:
+            self.stats["duplicates"] += 1
+            self.clusters.setdefault(best_url, []).append(url)
+            return best_url, best_similarity
+
+        # 只有代表頁面放入桶中，重複頁面都歸到第一次出現的版本
+        self._signatures[url] = signature
+        for key in keys:
+            self._buckets.setdefault(key, []).append(url)
+        return None, 0.0
+
+    def check_result(self, result):
+        """檢查 CrawlResult，重複時在 metadata 標記 near_duplicate_of 與相似度並回傳代表 URL"""
+        if not getattr(result, "success", False):
+            return None
+        original, similarity = self.check(result.url, str(getattr(result, "markdown", "") or ""))
+        if original is not None and result.metadata is not None:
+            result.metadata["near_duplicate_of"] = original
+            result.metadata["near_duplicate_similarity"] = round(similarity, 3)
+        return original
+
+    def cluster_sizes(self):
+        """每個代表頁面所在群組的大小（含代表頁面本身）"""
+        return {url: 1 + len(duplicates) for url, duplicates in self.clusters.items()}
+
+    def print_report(self, top=5):
+        """顯示重複頁面數量與最大的幾個群組"""
+        s = self.stats
+        print(f"\n🪞 近似重複偵測: 檢查 {s['checked']} 頁，重複 {s['duplicates']} 頁，"
+              f"候選比較 {s['comparisons']} 次（門檻 {self.threshold}）")
+        largest = sorted(self.clusters.items(), key=lambda item: len(item[1]), reverse=True)[:top]
+        for url, duplicates in largest:
+            print(f"   🧩 {1 + len(duplicates)} 頁: {url}")
+            for duplicate in duplicates:
+                print(f"       ↳ {duplicate}")
@@ -0,0 +1,165 @@
+"""
+預熱的頁面池
+
+Crawl4AI 每次 arun 都會開新分頁、結束後關閉。頁面池預先在瀏覽器 context 中建立分頁，
+arun 時直接借用，結束後清除路由、儲存空間與 cookie 並導回 about:blank 放回池中；
+同一分頁導覽超過 max_uses 次就關閉換新，避免記憶體累積。
+
+使用 session_id、擷取網路請求/主控台訊息或接受下載的設定會在頁面上留下監聽器，
+這些爬取不經過頁面池，維持 Crawl4AI 原本的行為。
+"""
+
+import contextvars
+import functools
+
+_checked_out = contextvars.ContextVar("page_pool_checked_out", default=None)
+
+# 會影響瀏覽器 context 建立方式的設定；其餘設定（css_selector、js_code 等）可共用同一批分頁
+CONTEXT_FIELDS = ["locale", "timezone_id", "geolocation", "proxy_config",
+                  "override_navigator", "simulate_user", "magic"]
+
+
+def context_key(config):
+    """依會影響 context 的設定分組"""
+    return repr([getattr(config, field, None) for field in CONTEXT_FIELDS])
+
+
+class PagePool:
+    """依 context 設定分組、可重複使用的分頁池"""
+
+    def __init__(self, size=4, max_uses=20):
+        self.size = size
+        self.max_uses = max_uses
+        self.stats = {"created": 0, "reused": 0, "recycled": 0, "bypassed": 0}
+        self._idle = {}
+        self._uses = {}
+        self._in_use = {}
+        self._manager = None
+        self._original_get_page = None
+
+    def attach(self, crawler):
+        """接管爬蟲的頁面建立與關閉"""
+        strategy = crawler.crawler_strategy
+        self._manager = strategy.browser_manager
+        self._browser_config = strategy.browser_config
+        self._original_get_page = self._manager.get_page
+        self._manager.get_page = self._get_page
+
+        original_crawl_web = strategy._crawl_web
+
+        @functools.wraps(original_crawl_web)
+        async def crawl_web(url, config):
+            token = _checked_out.set(None)
+            try:
+                return await original_crawl_web(url, config)
+            finally:
+                # 不論成功或失敗都把這次借出的分頁放回池中
+                checked_out = _checked_out.get()
+                _checked_out.reset(token)
+                if checked_out is not None:
+                    await self.release(*checked_out)
+
+        strategy._crawl_web = crawl_web
+
+    def _poolable(self, config):
+        if config.session_id or self._browser_config.use_managed_browser:
+            return False
+        if config.capture_network_requests or config.capture_console_messages:
+            return False
+        return not self._browser_config.accept_downloads
+
+    async def _new_page(self, config):
+        page, context = await self._original_get_page(config)
+        self.stats["created"] += 1
+        self._uses[id(page)] = 0
+        # Crawl4AI 結束時會呼叫 page.close()，池中的分頁改由 release() 決定是否真的關閉
+        page._pool_close = page.close
+
+        async def close(*args, **kwargs):
+            pass
+
+        page.close = close
+        return page, context
+
+    async def _get_page(self, crawlerRunConfig):
+        config = crawlerRunConfig
+        if not self._poolable(config):
+            self.stats["bypassed"] += 1
+            return await self._original_get_page(config)
+
+        key = context_key(config)
+        idle = self._idle.setdefault(key, [])
+        while idle:
+            page, context = idle.pop()
+            if not page.is_closed():
+                self.stats["reused"] += 1
+                break
+        else:
+            page, context = await self._new_page(config)
+
+        self._in_use[id(page)] = key
+        _checked_out.set((page, context))
+        return page, context
+
+    async def warm(self, config=None, count=None):
+        """預先建立分頁，讓小批次爬取完全不需要開新分頁"""
+        from crawl4ai import CrawlerRunConfig
+
+        config = config or CrawlerRunConfig()
+        key = context_key(config)
+        idle = self._idle.setdefault(key, [])
+        for _ in range((count or self.size) - len(idle)):
+            page, context = await self._new_page(config)
+            await page.goto("about:blank")
+            idle.append((page, context))
+        print(f"🔥 頁面池預熱完成：{len(idle)} 個分頁")
+
+    async def _reset(self, page, context, key):
+        """清除上一次爬取留下的狀態"""
+        await page.unroute_all(behavior="ignoreErrors")
+        try:
+            await page.evaluate("() => { try { localStorage.clear(); sessionStorage.clear(); } catch (e) {} }")
+        except Exception:
+            pass
+        await page.goto("about:blank")
+        await page.set_viewport_size({
+            "width": self._browser_config.viewport_width,
+            "height": self._browser_config.viewport_height,
+        })
+        # cookie 屬於整個 context，只在沒有其他分頁使用時清除
+        if key not in self._in_use.values():
+            await context.clear_cookies()
+
+    async def release(self, page, context):
+        """歸還分頁：超過使用次數、池已滿或重設失敗時關閉"""
+        key = self._in_use.pop(id(page), None)
+        if key is None or page.is_closed():
+            self._uses.pop(id(page), None)
+            return
+        self._uses[id(page)] += 1
+        idle = self._idle.setdefault(key, [])
+
+        if self._uses[id(page)] < self.max_uses and len(idle) < self.size:
+            try:
+                await self._reset(page, context, key)
+                idle.append((page, context))
+                return
+            except Exception:
+                pass
+
+        self.stats["recycled"] += 1
+        self._uses.pop(id(page), None)
+        await page._pool_close()
+
+    async def close(self):
+        """關閉池中所有閒置分頁"""
+        for idle in self._idle.values():
+            for page, _ in idle:
+                if not page.is_closed():
+                    await page._pool_close()
+        self._idle.clear()
+
+    def print_report(self):
+        """顯示分頁建立與重用統計"""
+        s = self.stats
+        print(f"\n🏊 頁面池: 新建 {s['created']}，重用 {s['reused']}，回收 {s['recycled']}，未經頁面池 {s['bypassed']}")
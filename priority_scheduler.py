@@ -0,0 +1,208 @@
+"""
+依優先順序分配瀏覽器名額的排程器
+
+同一個行程中混合互動式的單頁爬取（例如 esports_news_test）與大量批次爬取（例如台灣網站掃描）時，
+原本誰先送出誰先拿到瀏覽器。PriorityScheduler 把等待中的爬取分到加權的通道（lane）：
+名額空出時以 stride 排程挑選通道，權重高的通道會插到排隊中的批次工作前面；
+任何通道最久的等待超過 max_wait 秒時優先放行，避免批次工作被餓死。
+各通道的佇列深度與等待時間都會記錄下來。
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import time
+from collections import deque
+
+import crawl_metrics
+
+# 通道名稱與權重：兩個通道都有排隊時，interactive 每 9 個名額拿到 8 個
+DEFAULT_LANES = {"interactive": 8, "bulk": 1}
+
+_current_lane = contextvars.ContextVar("priority_scheduler_lane", default=None)
+_holding_slot = contextvars.ContextVar("priority_scheduler_holding", default=False)
+
+
+class _Lane:
+    """單一通道的等待佇列與統計"""
+
+    def __init__(self, name, weight):
+        self.name = name
+        self.weight = weight
+        self.waiters = deque()
+        # stride 排程的進度：每拿到一個名額前進 1 / weight
+        self.pass_value = 0.0
+        self.recent_waits = deque(maxlen=1000)
+        self.stats = {
+            "granted": 0,
+            "queued": 0,
+            "promoted": 0,
+            "max_depth": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0,
+        }
+
+
+class _Slot:
+    """取得一個瀏覽器名額；離開時自動歸還"""
+
+    def __init__(self, scheduler, lane):
+        self.scheduler = scheduler
+        self.lane = lane
+
+    async def __aenter__(self):
+        await self.scheduler.acquire(self.lane)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.scheduler.release()
+        return False
+
+
+class PriorityScheduler:
+    """加權優先通道加上防餓死保護的名額排程器"""
+
+    def __init__(self, slots=4, lanes=None, max_wait=30.0, default_lane="bulk"):
+        self.slots = slots
+        self.max_wait = max_wait
+        self.lanes = {name: _Lane(name, weight) for name, weight in (lanes or DEFAULT_LANES).items()}
+        if default_lane not in self.lanes:
+            raise ValueError(f"未知的通道: {default_lane}（可用: {', '.join(self.lanes)}）")
+        self.default_lane = default_lane
+        self.in_use = 0
+        self.max_in_use = 0
+        self._virtual_time = 0.0
+
+    def _lane(self, name):
+        name = name or _current_lane.get() or self.default_lane
+        if name not in self.lanes:
+            raise ValueError(f"未知的通道: {name}（可用: {', '.join(self.lanes)}）")
+        return self.lanes[name]
+
+    def slot(self, lane=None):
+        """取得指定通道的名額：async with scheduler.slot("interactive")"""
+        return _Slot(self, lane)
+
+    @contextlib.contextmanager
+    def lane(self, name):
+        """區塊內（包含其中建立的任務）的爬取預設使用這個通道"""
+        self._lane(name)
+        token = _current_lane.set(name)
+        try:
+            yield
+        finally:
+            _current_lane.reset(token)
+
+    async def acquire(self, lane=None):
+        """等待並取得一個名額"""
+        lane = self._lane(lane)
+        lane.stats["queued"] += 1
+        if self.in_use < self.slots and not any(l.waiters for l in self.lanes.values()):
+            self._grant(lane, 0.0)
+            return
+
+        if not lane.waiters:
+            # 閒置一段時間的通道不能累積額度，從目前的虛擬時間開始排
+            lane.pass_value = max(lane.pass_value, self._virtual_time)
+        waiter = (asyncio.get_running_loop().create_future(), time.monotonic())
+        lane.waiters.append(waiter)
+        self._update_depth(lane)
+        try:
+            await waiter[0]
+        except asyncio.CancelledError:
+            if waiter[0].done() and not waiter[0].cancelled():
+                # 名額剛分到就被取消：還回去給下一個
+                self.release()
+            elif waiter in lane.waiters:
+                lane.waiters.remove(waiter)
+                self._update_depth(lane)
+            raise
+
+    def release(self):
+        """歸還名額並放行下一個等待者"""
+        self.in_use -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_use < self.slots:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            future, enqueued = lane.waiters.popleft()
+            self._update_depth(lane)
+            if future.done():
+                continue
+            self._grant(lane, time.monotonic() - enqueued)
+            future.set_result(None)
+
+    def _next_lane(self):
+        waiting = [lane for lane in self.lanes.values() if lane.waiters]
+        if not waiting:
+            return None
+        # 防餓死：等待超過 max_wait 的請求不論權重先放行（最久的優先）
+        now = time.monotonic()
+        starved = [lane for lane in waiting if now - lane.waiters[0][1] >= self.max_wait]
+        if starved:
+            lane = min(starved, key=lambda l: l.waiters[0][1])
+            lane.stats["promoted"] += 1
+            return lane
+        return min(waiting, key=lambda l: (l.pass_value, -l.weight))
+
+    def _grant(self, lane, waited):
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        self._virtual_time = max(self._virtual_time, lane.pass_value)
+        lane.pass_value += 1.0 / lane.weight
+        lane.stats["granted"] += 1
+        lane.stats["total_wait"] += waited
+        lane.stats["max_wait"] = max(lane.stats["max_wait"], waited)
+        lane.recent_waits.append(waited)
+        crawl_metrics.observe_queue_wait(lane.name, waited)
+
+    def _update_depth(self, lane):
+        depth = len(lane.waiters)
+        lane.stats["max_depth"] = max(lane.stats["max_depth"], depth)
+        crawl_metrics.set_queue_depth(depth, queue=lane.name)
+
+    def attach(self, crawler):
+        """讓 crawler.arun 先取得名額；可用 lane="interactive" 參數或 scheduler.lane() 指定通道"""
+        original_arun = crawler.arun
+
+        @functools.wraps(original_arun)
+        async def arun(url, config=None, lane=None, **kwargs):
+            if _holding_slot.get():
+                # 深度爬取等巢狀呼叫沿用外層的名額，避免自己等自己
+                return await original_arun(url, config=config, **kwargs)
+            async with self.slot(lane):
+                token = _holding_slot.set(True)
+                try:
+                    return await original_arun(url, config=config, **kwargs)
+                finally:
+                    _holding_slot.reset(token)
+
+        crawler.arun = arun
+
+    def snapshot(self):
+        """各通道目前的佇列深度與等待時間統計"""
+        lanes = {}
+        for name, lane in self.lanes.items():
+            waits = sorted(lane.recent_waits)
+            s = lane.stats
+            lanes[name] = dict(
+                s,
+                weight=lane.weight,
+                depth=len(lane.waiters),
+                avg_wait=s["total_wait"] / s["granted"] if s["granted"] else 0.0,
+                p95_wait=waits[int(len(waits) * 0.95)] if waits else 0.0,
+            )
+        return {"slots": self.slots, "in_use": self.in_use, "max_in_use": self.max_in_use, "lanes": lanes}
+
+    def print_report(self):
+        """顯示各通道的等待時間與放行次數"""
+        snapshot = self.snapshot()
+        print(f"\n🚦 優先排程（{self.slots} 個名額，最多同時 {snapshot['max_in_use']}）:")
+        for name, s in snapshot["lanes"].items():
+            promoted = f"，防餓死提前放行 {s['promoted']} 次" if s["promoted"] else ""
+            print(f"   🛣️ {name}（權重 {s['weight']}）: 放行 {s['granted']}，最大佇列 {s['max_depth']}，"
+                  f"等待 平均 {s['avg_wait']:.2f}s / p95 {s['p95_wait']:.2f}s / 最長 {s['max_wait']:.2f}s{promoted}")
@@ -0,0 +1,201 @@
+"""
+依主機的重試與斷路器
+
+暫時性錯誤（逾時、連線中斷、429/5xx）以帶抖動的指數退避重試；
+同一主機連續失敗達門檻時斷路器開啟，之後的請求直接失敗，
+冷卻時間過後以半開狀態放行一個探測請求，成功才恢復。
+"""
+
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from adaptive_concurrency import BACKOFF_STATUSES, host_key
+from crawl_metrics import record_crawl_result, record_error
+
+# 爬蟲錯誤訊息中代表暫時性失敗的關鍵字
+TRANSIENT_ERROR_MARKERS = [
+    "timeout",
+    "net::err_timed_out",
+    "net::err_connection",
+    "net::err_name_not_resolved",
+    "net::err_network_changed",
+    "net::err_empty_response",
+]
+
+
+class TransientError(Exception):
+    """可重試的暫時性錯誤（例如 HTTP 503）"""
+
+
+class CircuitOpenError(Exception):
+    """主機斷路器開啟中，請求被直接拒絕"""
+
+
+TRANSIENT_EXCEPTIONS = (
+    asyncio.TimeoutError,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    TransientError,
+)
+
+
+def is_transient_crawl_result(result):
+    """判斷 CrawlResult 的失敗是否屬於暫時性錯誤"""
+    if getattr(result, 'success', True):
+        return False
+    if getattr(result, 'status_code', None) in BACKOFF_STATUSES:
+        return True
+    message = (getattr(result, 'error_message', '') or '').lower()
+    return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+
+class CircuitBreaker:
+    """單一主機的斷路器：closed → open → half_open → closed"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def allow(self):
+        """是否放行下一個請求：拒絕時回傳 False，否則回傳 request，取得探測名額時回傳 probe"""
+        if self.state == "closed":
+            return "request"
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return "probe"
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        """記錄失敗，回傳這次是否讓斷路器開啟"""
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            was_open = self.state == "open"
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            return not was_open
+        return False
+
+    def release(self, permit):
+        """請求以非暫時性錯誤結束時，若它持有探測名額就釋放，不改變狀態"""
+        if permit == "probe":
+            self.probe_in_flight = False
+
+
+class HostResilience:
+    """結合重試策略與各主機斷路器的呼叫包裝"""
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=10.0,
+                 failure_threshold=3, reset_timeout=30.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self.stats = {}
+
+    def _host(self, key):
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self.stats[key] = {
+                "attempts": 0,
+                "successes": 0,
+                "retries": 0,
+                "transient_failures": 0,
+                "fast_failures": 0,
+                "breaker_opened": 0,
+            }
+        return self.breakers[key], self.stats[key]
+
+    def backoff_delay(self, attempt):
+        """帶完整抖動的指數退避時間"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def _on_failure(self, breaker, stats):
+        stats["transient_failures"] += 1
+        if breaker.record_failure():
+            stats["breaker_opened"] += 1
+
+    async def call(self, url, operation, is_transient=None):
+        """執行 operation()，暫時性錯誤時重試；斷路器開啟時拋出 CircuitOpenError"""
+        key = host_key(url)
+        breaker, stats = self._host(key)
+
+        for attempt in range(1, self.max_attempts + 1):
+            permit = breaker.allow()
+            if not permit:
+                stats["fast_failures"] += 1
+                raise CircuitOpenError(f"{key} 斷路器開啟中，略過 {url}")
+
+            stats["attempts"] += 1
+            try:
+                result = await operation()
+            except TRANSIENT_EXCEPTIONS:
+                self._on_failure(breaker, stats)
+                if attempt == self.max_attempts:
+                    raise
+            except BaseException:
+                # 包含 CancelledError：半開狀態的探測被取消時也要歸還名額，否則主機會一直被直接拒絕；
+                # 其他請求被取消時不能動到正在進行的探測
+                breaker.release(permit)
+                raise
+            else:
+                if is_transient is not None and is_transient(result):
+                    self._on_failure(breaker, stats)
+                    if attempt == self.max_attempts:
+                        return result
+                else:
+                    breaker.record_success()
+                    stats["successes"] += 1
+                    return result
+
+            stats["retries"] += 1
+            await asyncio.sleep(self.backoff_delay(attempt))
+
+    def snapshot(self):
+        """各主機的重試與斷路器統計"""
+        return {
+            key: dict(stats, breaker_state=self.breakers[key].state)
+            for key, stats in self.stats.items()
+        }
+
+    def print_report(self):
+        """顯示重試與斷路器統計"""
+        print(f"\n🛡️ 重試與斷路器統計:")
+        for key, stats in self.stats.items():
+            state = self.breakers[key].state
+            print(f"   🌐 {key}: 斷路器 {state}，嘗試 {stats['attempts']}，成功 {stats['successes']}，"
+                  f"重試 {stats['retries']}，快速失敗 {stats['fast_failures']}，開啟 {stats['breaker_opened']} 次")
+
+
+async def crawl_with_resilience(crawler, url, resilience, config=None, run=None):
+    """以重試與斷路器保護單頁爬取（run 可替換成 run(crawler, url, config) 形式的爬取函數）"""
+    if run is None:
+        async def run(crawler, url, config):
+            return await crawler.arun(url=url, config=config)
+
+    start = time.perf_counter()
+    try:
+        result = await resilience.call(url, lambda: run(crawler, url, config), is_transient=is_transient_crawl_result)
+    except Exception as e:
+        record_error(e)
+        raise
+    record_crawl_result(result, time.perf_counter() - start)
+    return result
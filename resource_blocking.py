@@ -0,0 +1,178 @@
+"""
+請求層級的資源封鎖設定檔
+
+在瀏覽器送出請求之前就中止不需要的圖片、字型、媒體與廣告/分析腳本，
+取代「先載入再用 excluded_selector 隱藏」的做法，減少頁面載入時間與頻寬。
+"""
+
+import weakref
+from urllib.parse import urlparse
+
+from hook_utils import add_hook
+
+# 常見廣告與分析服務的網域（子網域也會一併比對）
+AD_TRACKER_DOMAINS = [
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googletagmanager.com",
+    "googletagservices.com",
+    "google-analytics.com",
+    "adservice.google.com",
+    "connect.facebook.net",
+    "scorecardresearch.com",
+    "hotjar.com",
+    "criteo.com",
+    "criteo.net",
+    "taboola.com",
+    "outbrain.com",
+    "amazon-adsystem.com",
+    "adnxs.com",
+    "pubmatic.com",
+    "rubiconproject.com",
+    "clarity.ms",
+]
+
+# 各資源類型被封鎖時的預估節省位元組（中止的請求無法得知實際大小）
+ESTIMATED_BYTES_BY_TYPE = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 30_000,
+    "script": 25_000,
+    "stylesheet": 15_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+DEFAULT_ESTIMATED_BYTES = 10_000
+
+# 具名封鎖設定檔
+BLOCKING_PROFILES = {
+    # 只需要文字內容（markdown、元資料）時使用
+    "text-only": {
+        "resource_types": {"image", "media", "font"},
+        "block_trackers": True,
+        "block_third_party": False,
+    },
+    # 保留版面與腳本，只擋圖片與影音
+    "no-media": {
+        "resource_types": {"image", "media"},
+        "block_trackers": False,
+        "block_third_party": False,
+    },
+    # 只允許與頁面同網站的請求
+    "no-third-party": {
+        "resource_types": set(),
+        "block_trackers": True,
+        "block_third_party": True,
+    },
+}
+
+# 註冊網域為三段的第二層網域（例如 cna.com.tw、moda.gov.tw）
+_SECOND_LEVEL_LABELS = {"com", "net", "org", "gov", "edu", "co", "ac", "idv"}
+
+
+def registrable_domain(host):
+    """取得主機名稱的註冊網域，用來判斷是否為第三方請求"""
+    labels = (host or "").lower().strip(".").split(".")
+    if len(labels) >= 3 and labels[-2] in _SECOND_LEVEL_LABELS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def is_tracker_host(host):
+    """判斷主機是否屬於廣告或分析服務"""
+    host = (host or "").lower()
+    return any(host == domain or host.endswith("." + domain) for domain in AD_TRACKER_DOMAINS)
+
+
+class ResourceBlocker:
+    """依設定檔在網路層中止請求，並統計每頁節省的請求數與位元組"""
+
+    def __init__(self, profile="text-only"):
+        if profile not in BLOCKING_PROFILES:
+            raise ValueError(f"未知的封鎖設定檔: {profile}（可用: {', '.join(BLOCKING_PROFILES)}）")
+        self.profile = profile
+        self.rules = BLOCKING_PROFILES[profile]
+        self.page_stats = {}
+        # 以頁面物件為鍵，頁面關閉後自動移除
+        self._page_urls = weakref.WeakKeyDictionary()
+        self._routed_pages = weakref.WeakSet()
+
+    def attach(self, crawler):
+        """把封鎖規則掛到爬蟲的每個新頁面上"""
+        add_hook(crawler, "on_page_context_created", self._on_page_context_created)
+        add_hook(crawler, "before_goto", self._before_goto)
+
+    async def _on_page_context_created(self, page, context=None, **kwargs):
+        # session_id 或分頁池重複使用同一個頁面時，每次爬取都會再觸發這個 hook；
+        # 路由只註冊一次，否則處理函數會疊加、統計重複計算
+        if page in self._routed_pages:
+            return page
+        self._routed_pages.add(page)
+
+        async def handle_route(route):
+            await self._handle_route(page, route)
+
+        await page.route("**/*", handle_route)
+        return page
+
+    async def _before_goto(self, page, context=None, url=None, **kwargs):
+        self._page_urls[page] = url
+        self.page_stats.setdefault(url, {
+            "blocked_requests": 0,
+            "allowed_requests": 0,
+            "estimated_bytes_saved": 0,
+            "blocked_by_type": {},
+        })
+        return page
+
+    def should_block(self, page_url, request_url, resource_type, is_main_document=False):
+        """依設定檔判斷請求是否該被中止"""
+        if is_main_document:
+            return False
+
+        request_host = urlparse(request_url).hostname or ""
+        if not request_host:
+            # data:、blob: 等非網路請求不處理
+            return False
+
+        if resource_type in self.rules["resource_types"]:
+            return True
+        if self.rules["block_trackers"] and is_tracker_host(request_host):
+            return True
+        if self.rules["block_third_party"] and page_url:
+            page_host = urlparse(page_url).hostname or ""
+            return registrable_domain(request_host) != registrable_domain(page_host)
+        return False
+
+    async def _handle_route(self, page, route):
+        request = route.request
+        page_url = self._page_urls.get(page)
+        is_main_document = request.resource_type == "document" and request.frame == page.main_frame
+
+        stats = self.page_stats.get(page_url)
+        if self.should_block(page_url, request.url, request.resource_type, is_main_document):
+            if stats is not None:
+                stats["blocked_requests"] += 1
+                stats["estimated_bytes_saved"] += ESTIMATED_BYTES_BY_TYPE.get(
+                    request.resource_type, DEFAULT_ESTIMATED_BYTES
+                )
+                by_type = stats["blocked_by_type"]
+                by_type[request.resource_type] = by_type.get(request.resource_type, 0) + 1
+            await route.abort("blockedbyclient")
+        else:
+            if stats is not None:
+                stats["allowed_requests"] += 1
+            # 交給 context 層級的其他路由規則繼續處理
+            await route.fallback()
+
+    def print_report(self):
+        """顯示每頁的封鎖統計"""
+        print(f"\n🚫 資源封鎖統計（設定檔: {self.profile}）:")
+        for url, stats in self.page_stats.items():
+            saved_kb = stats["estimated_bytes_saved"] / 1024
+            print(f"   🔗 {url}")
+            print(f"       封鎖請求: {stats['blocked_requests']} 個 / 放行: {stats['allowed_requests']} 個")
+            print(f"       預估節省: {saved_kb:.1f} KB")
+            if stats["blocked_by_type"]:
+                detail = ", ".join(f"{k}={v}" for k, v in sorted(stats["blocked_by_type"].items()))
+                print(f"       類型: {detail}")
@@ -0,0 +1,131 @@
+"""
+爬取結果串流匯出
+
+每頁完成就把 CrawlResult 的投影寫成一行 JSON，附加到 gzip 壓縮的 JSONL 檔，
+檔案超過大小上限時自動輪替，大量爬取時結果不需要全部留在記憶體中。
+"""
+
+import glob
+import gzip
+import json
+import os
+from datetime import datetime
+
+
+def project_result(result, include_markdown=False, preview_length=1000):
+    """把 CrawlResult 轉成適合匯出的精簡字典"""
+    markdown = str(result.markdown or "")
+    links = result.links or {}
+    media = result.media or {}
+
+    record = {
+        'url': result.url,
+        'success': bool(getattr(result, 'success', True)),
+        'status_code': getattr(result, 'status_code', None),
+        'title': (result.metadata or {}).get('title', ''),
+        'content_length': len(markdown),
+        'images_count': len(media.get('images', [])),
+        'internal_links_count': len(links.get('internal', [])),
+        'external_links_count': len(links.get('external', [])),
+        'content_preview': markdown[:preview_length],
+        'crawled_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    if include_markdown:
+        record['markdown'] = markdown
+    return record
+
+
+class ResultExporter:
+    """附加寫入、依大小輪替的壓縮 JSONL 匯出器"""
+
+    def __init__(self, output_dir, prefix, max_bytes=64 * 1024 * 1024, compress=True, flush_every=50):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.flush_every = flush_every
+        self.records_written = 0
+        self.files_written = []
+        self._file = None
+        self._raw_file = None
+        self._pending = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # 可以和 AsyncWebCrawler 寫在同一個 async with 中
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open_new_file(self):
+        self.close()
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        extension = "jsonl.gz" if self.compress else "jsonl"
+        part = len(self.files_written) + 1
+        path = os.path.join(self.output_dir, f"{self.prefix}_{timestamp}_part{part:03d}.{extension}")
+
+        # 以附加模式開啟，中斷後重跑也不會覆蓋已寫入的資料
+        self._raw_file = open(path, 'ab')
+        if self.compress:
+            self._file = gzip.GzipFile(fileobj=self._raw_file, mode='ab')
+        else:
+            self._file = self._raw_file
+        self.files_written.append(path)
+
+    def write(self, record):
+        """寫入一筆記錄，必要時輪替檔案"""
+        if self._file is None or self._raw_file.tell() >= self.max_bytes:
+            self._open_new_file()
+
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._file.write(line.encode('utf-8'))
+        self.records_written += 1
+        self._pending += 1
+
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def write_result(self, result, **projection_options):
+        """投影 CrawlResult 後寫入"""
+        self.write(project_result(result, **projection_options))
+
+    def flush(self):
+        """把緩衝資料寫到磁碟（壓縮檔仍可被讀到最後一次 flush 為止）"""
+        if self._file is not None:
+            self._file.flush()
+            if self._file is not self._raw_file:
+                self._raw_file.flush()
+        self._pending = 0
+
+    def close(self):
+        """關閉目前的檔案"""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            if self._file is not self._raw_file:
+                self._raw_file.close()
+        self._file = None
+        self._raw_file = None
+
+    def print_summary(self):
+        """顯示匯出統計"""
+        print(f"\n💾 結果匯出: {self.records_written} 筆，{len(self.files_written)} 個檔案")
+        for path in self.files_written:
+            print(f"   📄 {os.path.relpath(path)}")
+
+
+def iter_records(pattern):
+    """逐筆讀取匯出檔（支援 glob），不需一次載入全部資料"""
+    for path in sorted(glob.glob(pattern)):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
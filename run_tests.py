@@ -7,6 +7,9 @@ import os
 import sys
 import subprocess
 
+# python run_tests.py --profile：以 crawl_profiler.py 執行選擇的測試
+PROFILE = "--profile" in sys.argv
+
 def run_script(script_name):
     """執行指定的腳本"""
     try:
@@ -15,7 +18,10 @@ def run_script(script_name):
         os.chdir(script_dir)
         
         # 啟動虛擬環境並執行腳本
-        cmd = f"source .venv/bin/activate && python {script_name}"
+        if PROFILE:
+            cmd = f"source .venv/bin/activate && python crawl_profiler.py {script_name}"
+        else:
+            cmd = f"source .venv/bin/activate && python {script_name}"
         subprocess.run(cmd, shell=True, check=True)
         
     except subprocess.CalledProcessError as e:
@@ -28,6 +34,8 @@ def show_menu():
     print("=" * 60)
     print("🕷️  Crawl4AI 測試選單")
     print("=" * 60)
+    if PROFILE:
+        print("🔬 效能分析模式：結果寫入 profiles/")
     print()
     print("請選擇要執行的測試:")
     print("1. 基本功能測試 (basic_test.py)")
@@ -37,6 +45,8 @@ def show_menu():
     print("5. 電競新聞測試 (esports_test.py)")
     print("6. 查看專案說明 (README.md)")
     print("7. 安裝後檢查 (crawl4ai-doctor)")
+    print("8. 離線壓力測試 (load_test.py)")
+    print("9. 啟動/停止常駐瀏覽器 (browser_daemon.py)")
     print("0. 結束程式")
     print()
 
@@ -46,7 +56,7 @@ def main():
         show_menu()
         
         try:
-            choice = input("請輸入選項 (0-7): ").strip()
+            choice = input("請輸入選項 (0-9): ").strip()
             
             if choice == "0":
                 print("👋 再見！")
@@ -83,6 +93,14 @@ def main():
                     subprocess.run(cmd, shell=True, check=True)
                 except subprocess.CalledProcessError as e:
                     print(f"❌ 執行檢查時發生錯誤: {e}")
+            elif choice == "8":
+                print("🏋️ 執行離線壓力測試...")
+                run_script("load_test.py")
+            elif choice == "9":
+                # 之後從選單執行的腳本會直接連到常駐瀏覽器
+                command = "stop" if os.path.exists("browser_daemon.json") else "start --detach"
+                print(f"🧭 常駐瀏覽器: {command}...")
+                run_script(f"browser_daemon.py {command}")
             else:
                 print("❌ 無效的選項，請重新選擇")
             
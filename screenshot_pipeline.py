@@ -0,0 +1,174 @@
+"""
+不佔用事件迴圈的截圖處理
+
+Crawl4AI 的整頁截圖會把長頁面分段截取、在事件迴圈上用 PIL 拼接成 BMP 再做 base64 編碼，
+測試腳本拿到結果後又在事件迴圈上解碼、以阻塞的 open() 寫出很大的 PNG。
+ScreenshotPipeline 取代截圖步驟：只截視窗範圍或高度有上限的整頁（單次截取、不拼接），
+轉成 WebP/JPEG 與 base64 編碼都在執行緒池中進行；存檔時的解碼與寫入同樣交給執行緒池。
+"""
+
+import asyncio
+import base64
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+# 格式名稱 → (PIL 格式, 副檔名)
+FORMATS = {
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+}
+
+MODES = ("viewport", "full")
+
+
+def encode_screenshot(raw, image_format="webp", quality=80):
+    """把瀏覽器輸出的截圖轉成指定格式（在執行緒池中執行）"""
+    from PIL import Image
+
+    pil_format = FORMATS[image_format][0]
+    with Image.open(BytesIO(raw)) as img:
+        if pil_format != "PNG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        output = BytesIO()
+        if pil_format == "PNG":
+            img.save(output, format=pil_format, optimize=True)
+        else:
+            # method=4 在 WebP 的壓縮率與速度之間取平衡（6 最小但慢很多）
+            img.save(output, format=pil_format, quality=quality, method=4)
+        return output.getvalue()
+
+
+def screenshot_extension(data):
+    """依檔頭判斷截圖的副檔名"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    if data[:3] == b"\xff\xd8\xff":
+        return ".jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return ".png"
+    if data[:2] == b"BM":
+        return ".bmp"
+    return ".bin"
+
+
+def _decode_and_write(screenshot, path_stem):
+    data = base64.b64decode(screenshot) if isinstance(screenshot, str) else screenshot
+    path = path_stem + screenshot_extension(data)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path, len(data)
+
+
+class ScreenshotPipeline:
+    """截圖在瀏覽器端截取、在執行緒池中轉檔與編碼"""
+
+    def __init__(self, mode="full", max_height=8000, image_format="webp", quality=80, max_workers=2):
+        if mode not in MODES:
+            raise ValueError(f"未知的截圖模式: {mode}（可用: {', '.join(MODES)}）")
+        if image_format not in FORMATS:
+            raise ValueError(f"未知的截圖格式: {image_format}（可用: {', '.join(FORMATS)}）")
+        self.mode = mode
+        # 整頁截圖的最大高度（像素），超過的部分不截取
+        self.max_height = max_height
+        self.image_format = image_format
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="screenshot")
+        self.stats = {
+            "captures": 0,
+            "capped": 0,
+            "failed": 0,
+            "raw_bytes": 0,
+            "encoded_bytes": 0,
+            "capture_seconds": 0.0,
+            "encode_seconds": 0.0,
+            "saved": 0,
+            "saved_bytes": 0,
+        }
+
+    def attach(self, crawler):
+        """取代 crawler_strategy.take_screenshot（需在 instrument、CrawlDeadline 之前呼叫）"""
+        strategy = crawler.crawler_strategy
+        original = strategy.take_screenshot
+
+        async def take_screenshot(page, **kwargs):
+            try:
+                return await self.capture(page)
+            except Exception as e:
+                # 截圖失敗時交回 Crawl4AI 原本的處理（會產生錯誤圖片）
+                self.stats["failed"] += 1
+                print(f"⚠️ 截圖失敗，改用預設方式: {str(e)}")
+                return await original(page, **kwargs)
+
+        strategy.take_screenshot = take_screenshot
+
+    async def capture(self, page):
+        """截取頁面並回傳 base64 字串（與 Crawl4AI 的 result.screenshot 相同）"""
+        start = time.perf_counter()
+        full_page = self.mode == "full"
+        clip = None
+        if full_page:
+            height = await page.evaluate(
+                "Math.max(document.documentElement.scrollHeight, document.body ? document.body.scrollHeight : 0)"
+            )
+            if height > self.max_height:
+                width = (page.viewport_size or {}).get("width") or await page.evaluate(
+                    "document.documentElement.clientWidth"
+                )
+                clip = {"x": 0, "y": 0, "width": width, "height": self.max_height}
+                self.stats["capped"] += 1
+
+        # JPEG 可直接由瀏覽器輸出；WebP 與 PNG 先取得無損的 PNG 再轉檔
+        if self.image_format == "jpeg":
+            raw = await page.screenshot(full_page=full_page, clip=clip, type="jpeg", quality=self.quality)
+        else:
+            raw = await page.screenshot(full_page=full_page, clip=clip, type="png")
+        self.stats["capture_seconds"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        encoded, size = await asyncio.get_running_loop().run_in_executor(self._executor, self._encode, raw)
+        self.stats["encode_seconds"] += time.perf_counter() - start
+        self.stats["captures"] += 1
+        self.stats["raw_bytes"] += len(raw)
+        self.stats["encoded_bytes"] += size
+        return encoded
+
+    def _encode(self, raw):
+        data = raw if self.image_format == "jpeg" else encode_screenshot(raw, self.image_format, self.quality)
+        return base64.b64encode(data).decode("ascii"), len(data)
+
+    async def save(self, result, path_stem):
+        """把 result.screenshot 解碼寫到 path_stem + 副檔名，回傳檔案路徑（沒有截圖時回傳 None）"""
+        screenshot = getattr(result, "screenshot", None)
+        if not screenshot:
+            return None
+        directory = os.path.dirname(path_stem)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        path, size = await asyncio.get_running_loop().run_in_executor(
+            self._executor, _decode_and_write, screenshot, path_stem
+        )
+        self.stats["saved"] += 1
+        self.stats["saved_bytes"] += size
+        return path
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def snapshot(self):
+        """截圖數量、大小與耗時統計"""
+        return dict(self.stats)
+
+    def print_report(self):
+        """顯示截圖大小與在瀏覽器、執行緒池中花費的時間"""
+        s = self.stats
+        if not s["captures"]:
+            return
+        capped = f"，{s['capped']} 張超過 {self.max_height}px 已截斷" if s["capped"] else ""
+        print(f"\n📸 截圖（{self.mode}，{self.image_format} 品質 {self.quality}）: {s['captures']} 張{capped}")
+        print(f"   大小 {s['raw_bytes'] / 1024:.0f} KB → {s['encoded_bytes'] / 1024:.0f} KB，"
+              f"截取 {s['capture_seconds']:.2f}s，執行緒池編碼 {s['encode_seconds']:.2f}s")
+        if s["failed"]:
+            print(f"   ⚠️ 失敗改用預設方式 {s['failed']} 次")
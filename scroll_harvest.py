@@ -0,0 +1,199 @@
+"""
+漸進式捲動收集延遲載入的圖片
+
+頁面載入後以 IntersectionObserver 監看所有 <img>（包含之後才加入 DOM 的），
+每捲動一個視窗高度就取出這段期間進入畫面並載入完成的圖片；
+連續幾次捲動都沒有新圖片、或超過步數/時間預算就停止。
+每批圖片會立刻交給 on_images 回呼函數，下載可以在捲動結束前就開始。
+搭配增量重爬時，爬過的頁面延到指紋比對之後才捲動，未變更的頁面不捲動也不下載。
+"""
+
+import asyncio
+import time
+import weakref
+
+from hook_utils import add_hook
+
+# 在頁面中安裝觀察器（重複安裝不會重設已收集的資料）
+_INSTALL_JS = """
+(rootMargin) => {
+    if (window.__crawlHarvest) return;
+    const seen = new Set();
+    const queue = [];
+
+    const collect = (img) => {
+        // 與 Crawl4AI 的 media 及擷取腳本一樣以 src 為準，預先下載的圖片才對得上（srcset 的實際來源另外記錄）
+        const src = img.src || img.currentSrc || '';
+        if (!src || src.startsWith('data:') || seen.has(src)) return;
+        // 尚未換成真正圖片的佔位圖（1x1）先不收集，等 load 事件
+        if (!img.complete || img.naturalWidth <= 1) return;
+        seen.add(src);
+        queue.push({
+            src: src,
+            current_src: img.currentSrc || '',
+            alt: img.alt || '',
+            width: img.naturalWidth || img.width || null,
+            height: img.naturalHeight || img.height || null,
+            loading: img.loading || '',
+        });
+    };
+
+    const observer = new IntersectionObserver((entries) => {
+        for (const entry of entries) {
+            if (!entry.isIntersecting) continue;
+            const img = entry.target;
+            collect(img);
+            // 延遲載入的腳本可能之後才替換 src，載入完成時再收集一次
+            img.addEventListener('load', () => collect(img));
+            observer.unobserve(img);
+        }
+    }, { rootMargin: rootMargin });
+
+    const watch = (root) => {
+        if (root.tagName === 'IMG') observer.observe(root);
+        if (root.querySelectorAll) root.querySelectorAll('img').forEach((img) => observer.observe(img));
+    };
+    watch(document);
+    new MutationObserver((mutations) => {
+        for (const mutation of mutations) mutation.addedNodes.forEach(watch);
+    }).observe(document.documentElement, { childList: true, subtree: true });
+
+    window.__crawlHarvest = { seen: seen, queue: queue };
+}
+"""
+
+_DRAIN_JS = "() => window.__crawlHarvest ? window.__crawlHarvest.queue.splice(0) : []"
+
+_SCROLL_JS = """
+(ratio) => {
+    window.scrollBy(0, Math.floor(window.innerHeight * ratio));
+    return {
+        bottom: window.scrollY + window.innerHeight >= document.documentElement.scrollHeight - 2,
+    };
+}
+"""
+
+
+class ScrollHarvester:
+    """以視窗高度為步距捲動頁面並逐批回報新出現的圖片"""
+
+    def __init__(self, step_ratio=0.9, step_delay=0.3, idle_rounds=5, max_steps=60,
+                 max_seconds=30.0, root_margin="0px 0px 200px 0px", on_images=None, incremental=None):
+        self.step_ratio = step_ratio
+        self.step_delay = step_delay
+        # 連續幾步沒有新圖片就停止
+        self.idle_rounds = idle_rounds
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.root_margin = root_margin
+        # on_images(batch) 可以是一般函數或 async 函數
+        self.on_images = on_images
+        # IncrementalCrawler：有紀錄的頁面等指紋比對確認有變更後才捲動
+        self.incremental = incremental
+        self.images = []
+        self.page_stats = {}
+        self._deferred = weakref.WeakKeyDictionary()
+
+    def attach(self, crawler):
+        """頁面載入後、js_code 與 wait_for 之前捲動收集（需在 IncrementalCrawler.attach 之後呼叫）"""
+        add_hook(crawler, "after_goto", self._after_goto)
+        if self.incremental is not None:
+            add_hook(crawler, "before_return_html", self._before_return_html)
+
+    async def _after_goto(self, page, context=None, url=None, **kwargs):
+        if self.incremental is not None and self.incremental.has_record(url):
+            self._deferred[page] = url
+            return page
+        await self._harvest_quietly(page, url)
+        return page
+
+    async def _before_return_html(self, page=None, html=None, **kwargs):
+        url = self._deferred.pop(page, None)
+        if url is None:
+            return page
+        if self.incremental.page_unchanged(url):
+            self.page_stats[url] = {"images": 0, "steps": 0, "seconds": 0.0, "stop_reason": "unchanged"}
+            return page
+        # 取得 HTML 之後才捲動，新找到的圖片只在 images 中（不在 result.media）
+        await self._harvest_quietly(page, url)
+        return page
+
+    async def _harvest_quietly(self, page, url):
+        # 捲動只是盡力而為：失敗時錯誤記在 page_stats，頁面照常繼續爬取
+        try:
+            await self.harvest(page, url)
+        except Exception:
+            pass
+
+    async def iter_batches(self, page, state=None):
+        """逐步捲動並產生每一步新出現的圖片清單（state 會記錄步數與停止原因）"""
+        state = state if state is not None else {}
+        state.update(steps=0, stop_reason="max_steps")
+        await page.evaluate(_INSTALL_JS, self.root_margin)
+        started = time.monotonic()
+        idle = 0
+
+        for step in range(1, self.max_steps + 1):
+            if time.monotonic() - started > self.max_seconds:
+                state["stop_reason"] = "time_budget"
+                break
+            position = await page.evaluate(_SCROLL_JS, self.step_ratio)
+            await asyncio.sleep(self.step_delay)
+            batch = await page.evaluate(_DRAIN_JS)
+            state["steps"] = step
+            if batch:
+                idle = 0
+                yield batch
+            else:
+                idle += 1
+            # 到底後再等一步確認沒有新內容（無限捲動的頁面會繼續長高）
+            if position["bottom"] and idle >= 2:
+                state["stop_reason"] = "bottom"
+                break
+            if idle >= self.idle_rounds:
+                state["stop_reason"] = "no_new_images"
+                break
+
+        # 捲回頂端，讓之後的截圖與 HTML 與一般載入時一致
+        await page.evaluate("() => window.scrollTo(0, 0)")
+        batch = await page.evaluate(_DRAIN_JS)
+        if batch:
+            yield batch
+
+    async def harvest(self, page, url=None):
+        """捲動整頁並把每批圖片交給 on_images，回傳收集到的圖片"""
+        started = time.monotonic()
+        state = {"steps": 0, "stop_reason": "error"}
+        found = []
+        try:
+            async for batch in self.iter_batches(page, state):
+                found.extend(batch)
+                if self.on_images is not None:
+                    result = self.on_images(batch)
+                    if asyncio.iscoroutine(result):
+                        await result
+        except Exception as e:
+            state.update(stop_reason="error", error=str(e))
+            raise
+        finally:
+            # 中途失敗時也保留已經收集到的圖片
+            self.images.extend(found)
+            self.page_stats[url] = {
+                "images": len(found),
+                "steps": state["steps"],
+                "seconds": round(time.monotonic() - started, 2),
+                "stop_reason": state["stop_reason"],
+            }
+            if "error" in state:
+                self.page_stats[url]["error"] = state["error"]
+        return found
+
+    def print_report(self):
+        """顯示每頁的捲動收集統計"""
+        print(f"\n🖱️ 捲動收集圖片:")
+        for url, stats in self.page_stats.items():
+            print(f"   🔗 {url}")
+            print(f"       圖片 {stats['images']} 張，捲動 {stats['steps']} 步，"
+                  f"{stats['seconds']}s（停止原因: {stats['stop_reason']}）")
+            if "error" in stats:
+                print(f"       ⚠️ 錯誤: {stats['error']}")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+爬取結果的本機全文搜尋（BM25）
+
+以 SQLite 儲存倒排索引：每收到一個 CrawlResult 就更新該頁的詞項，
+不需要重建整個索引。中文（含繁體）以連續漢字的二字詞切分，英數字以單字切分，
+查詢時只讀取查詢詞項的 posting，以 BM25 計分取前 k 筆。
+
+用法：
+    python search_index.py "颱風 停班停課" -k 10
+"""
+
+import argparse
+import heapq
+import math
+import re
+import sqlite3
+import time
+from collections import Counter
+
+# 漢字、日文假名與韓文字母視為 CJK，其餘以英數字切分
+_CJK_RUN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+')
+_WORD = re.compile(r'[0-9a-z]+(?:[._\'-][0-9a-z]+)*')
+_MARKDOWN_LINK = re.compile(r'\]\([^)]*\)')
+
+
+def tokenize(text):
+    """CJK 連續字元切成二字詞（單字詞保留原字），英數字轉小寫後以單字切分"""
+    text = _MARKDOWN_LINK.sub('] ', (text or '').lower())
+    tokens = []
+    position = 0
+    for match in _CJK_RUN.finditer(text):
+        tokens.extend(_WORD.findall(text, position, match.start()))
+        run = match.group()
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        position = match.end()
+    tokens.extend(_WORD.findall(text, position))
+    return tokens
+
+
+class SearchIndex:
+    """可增量更新、存在磁碟上的 BM25 倒排索引"""
+
+    def __init__(self, path="search_index.sqlite", k1=1.5, b=0.75, commit_every=100):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.commit_every = commit_every
+        self._pending = 0
+        # 文件長度常駐記憶體（10 萬篇約數 MB），查詢時不必再 join docs
+        self._lengths = None
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                title TEXT,
+                length INTEGER NOT NULL,
+                preview TEXT
+            );
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_by_doc ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats (key, value) VALUES ('doc_count', 0), ('total_length', 0);
+        """)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _stat(self, key):
+        return self.conn.execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()[0]
+
+    def _add_stat(self, key, delta):
+        self.conn.execute("UPDATE stats SET value = value + ? WHERE key = ?", (delta, key))
+
+    def _remove(self, url):
+        """移除舊版本文件的 posting 與統計"""
+        row = self.conn.execute("SELECT id, length FROM docs WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return
+        doc_id, length = row
+        if self._lengths is not None:
+            self._lengths.pop(doc_id, None)
+        terms = [t for (t,) in self.conn.execute("SELECT term FROM postings WHERE doc_id = ?", (doc_id,))]
+        self.conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(t,) for t in terms])
+        self.conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        self.conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+        self._add_stat("doc_count", -1)
+        self._add_stat("total_length", -length)
+
+    def add(self, url, text, title=""):
+        """新增或更新一篇文件（同一 URL 會取代舊內容）"""
+        counts = Counter(tokenize(f"{title}\n{text}"))
+        self._remove(url)
+        length = sum(counts.values())
+        cursor = self.conn.execute(
+            "INSERT INTO docs (url, title, length, preview) VALUES (?, ?, ?, ?)",
+            (url, title, length, (text or "")[:200]),
+        )
+        doc_id = cursor.lastrowid
+        if self._lengths is not None:
+            self._lengths[doc_id] = length
+        self.conn.executemany(
+            "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+            [(term, doc_id, tf) for term, tf in counts.items()],
+        )
+        self.conn.executemany(
+            "INSERT INTO terms (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+            [(term,) for term in counts],
+        )
+        self._add_stat("doc_count", 1)
+        self._add_stat("total_length", length)
+
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+        return doc_id
+
+    def add_result(self, result):
+        """加入一個 CrawlResult（失敗或沒有內容的結果會略過）"""
+        if not getattr(result, "success", False):
+            return None
+        markdown = str(getattr(result, "markdown", "") or "")
+        if not markdown.strip():
+            return None
+        title = (getattr(result, "metadata", None) or {}).get("title", "") or ""
+        return self.add(result.url, markdown, title)
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def search(self, query, k=10):
+        """以 BM25 計分回傳前 k 筆 {'url', 'title', 'score', 'preview'}"""
+        self.commit()
+        doc_count = self._stat("doc_count")
+        if doc_count == 0:
+            return []
+        average_length = self._stat("total_length") / doc_count
+        if self._lengths is None:
+            self._lengths = dict(self.conn.execute("SELECT id, length FROM docs"))
+        lengths = self._lengths
+
+        scores = {}
+        for term, query_tf in Counter(tokenize(query)).items():
+            row = self.conn.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+            if row is None or row[0] <= 0:
+                continue
+            df = row[0]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            postings = self.conn.execute("SELECT doc_id, tf FROM postings WHERE term = ?", (term,))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + query_tf * idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        results = []
+        for doc_id, score in top:
+            url, title, preview = self.conn.execute(
+                "SELECT url, title, preview FROM docs WHERE id = ?", (doc_id,)
+            ).fetchone()
+            results.append({"url": url, "title": title, "score": round(score, 4), "preview": preview})
+        return results
+
+    def __len__(self):
+        return self._stat("doc_count")
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def print_summary(self):
+        """顯示索引大小"""
+        terms = self.conn.execute("SELECT COUNT(*) FROM terms WHERE df > 0").fetchone()[0]
+        print(f"\n🔎 搜尋索引: {len(self)} 篇文件，{terms} 個詞項（{self.path}）")
+
+
+def main():
+    """命令列查詢"""
+    parser = argparse.ArgumentParser(description="查詢爬取結果的 BM25 索引")
+    parser.add_argument("query", help="查詢字串")
+    parser.add_argument("-k", type=int, default=10, help="回傳筆數")
+    parser.add_argument("--index", default="search_index.sqlite", help="索引檔案")
+    args = parser.parse_args()
+
+    with SearchIndex(args.index) as index:
+        start = time.perf_counter()
+        results = index.search(args.query, args.k)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"🔎 「{args.query}」找到 {len(results)} 筆（{elapsed:.1f} ms，共 {len(index)} 篇）")
+        for i, hit in enumerate(results, 1):
+            print(f"   {i}. [{hit['score']:.2f}] {hit['title'] or '(無標題)'}")
+            print(f"      {hit['url']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+精簡的爬取結果
+
+CrawlResult 會同時保留 html、cleaned_html、markdown、截圖與 media，
+大量爬取時每個結果都佔用數 MB，但多數腳本只讀標題、markdown 長度與連結數。
+ResultSlimmer 讓呼叫端宣告需要的欄位：宣告的欄位留在記憶體，
+指定溢出的大型欄位寫到暫存檔並以 mmap 延遲讀取，其餘欄位直接丟棄。
+"""
+
+import json
+import mmap
+import os
+import shutil
+import tempfile
+
+# 一定保留的小欄位
+ALWAYS_KEPT = ("url", "success", "status_code", "error_message", "redirected_url")
+
+DEFAULT_FIELDS = ("metadata", "markdown", "links")
+DEFAULT_SPILL = ("html", "cleaned_html", "screenshot")
+
+
+def _field_value(result, field):
+    value = getattr(result, field, None)
+    if field == "markdown" and value is not None:
+        # MarkdownGenerationResult 只保留原始 markdown 文字
+        value = str(getattr(value, "raw_markdown", value) or "")
+    return value
+
+
+def _encode(value):
+    """把欄位值轉成 (位元組, 類型)"""
+    if isinstance(value, bytes):
+        return value, "bytes"
+    if isinstance(value, str):
+        return value.encode("utf-8"), "text"
+    return json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"), "json"
+
+
+class SpilledField:
+    """寫在暫存檔中的欄位，讀取時才載入"""
+
+    def __init__(self, path, size, kind):
+        self.path = path
+        self.size = size
+        self.kind = kind
+
+    def __len__(self):
+        return self.size
+
+    def mmap(self):
+        """以唯讀 mmap 開啟，可切片讀取而不載入整個檔案"""
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self):
+        """載入完整內容（文字、位元組或 JSON 物件）"""
+        if self.size == 0:
+            data = b""
+        else:
+            with self.mmap() as mapped:
+                data = mapped[:]
+        if self.kind == "bytes":
+            return data
+        text = data.decode("utf-8")
+        return json.loads(text) if self.kind == "json" else text
+
+    def __str__(self):
+        return str(self.read())
+
+    def __repr__(self):
+        return f"SpilledField({self.path!r}, {self.size} bytes)"
+
+
+class SlimResult:
+    """只保留宣告欄位的爬取結果"""
+
+    def __init__(self, values, spilled):
+        self._values = values
+        self._spilled = spilled
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self._values:
+            return self._values[name]
+        if name in self._spilled:
+            return self._spilled[name]
+        raise AttributeError(f"欄位 {name} 未宣告保留，請加入 ResultSlimmer 的 fields 或 spill")
+
+    @property
+    def fields(self):
+        return list(self._values) + list(self._spilled)
+
+    def load(self, name):
+        """讀取欄位；溢出到磁碟的欄位會在這時才載入"""
+        value = getattr(self, name)
+        return value.read() if isinstance(value, SpilledField) else value
+
+
+class ResultSlimmer:
+    """依宣告的欄位精簡 CrawlResult，大型欄位溢出到暫存資料夾"""
+
+    def __init__(self, fields=DEFAULT_FIELDS, spill=DEFAULT_SPILL, spill_dir=None):
+        self.fields = tuple(fields)
+        self.spill = tuple(f for f in spill if f not in self.fields)
+        self._spill_dir = spill_dir
+        self._created_dir = False
+        self._count = 0
+        self.stats = {"results": 0, "kept_bytes": 0, "spilled_bytes": 0, "dropped_bytes": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # 可以和 AsyncWebCrawler 寫在同一個 async with 中
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def spill_dir(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="crawl_spill_")
+            self._created_dir = True
+        os.makedirs(self._spill_dir, exist_ok=True)
+        return self._spill_dir
+
+    def _write_spill(self, field, value):
+        data, kind = _encode(value)
+        path = os.path.join(self.spill_dir, f"{self._count:06d}_{field}.bin")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.stats["spilled_bytes"] += len(data)
+        return SpilledField(path, len(data), kind)
+
+    def slim(self, result):
+        """把 CrawlResult 轉成 SlimResult；原本的結果物件之後就可以被回收"""
+        if isinstance(result, (SlimResult, BaseException)):
+            return result
+        self._count += 1
+        self.stats["results"] += 1
+
+        values = {field: getattr(result, field, None) for field in ALWAYS_KEPT}
+        for field in self.fields:
+            value = _field_value(result, field)
+            values[field] = value
+            if isinstance(value, (str, bytes)):
+                self.stats["kept_bytes"] += len(value)
+
+        spilled = {}
+        for field in self.spill:
+            value = _field_value(result, field)
+            # 失敗的爬取也要有宣告的欄位：沒有值時記為 None，空字串寫成空的暫存檔
+            spilled[field] = None if value is None else self._write_spill(field, value)
+
+        for field in ("html", "cleaned_html", "fit_html", "screenshot", "pdf", "mhtml"):
+            if field not in self.fields and field not in self.spill:
+                value = getattr(result, field, None)
+                if isinstance(value, (str, bytes)):
+                    self.stats["dropped_bytes"] += len(value)
+
+        return SlimResult(values, spilled)
+
+    def close(self):
+        """刪除自動建立的暫存資料夾"""
+        if self._created_dir and self._spill_dir and os.path.isdir(self._spill_dir):
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+        self._spill_dir = None if self._created_dir else self._spill_dir
+        self._created_dir = False
+
+    def print_report(self):
+        """顯示記憶體中保留、溢出到磁碟與丟棄的資料量"""
+        s = self.stats
+        print(f"\n🪶 精簡結果: {s['results']} 筆，記憶體保留 {s['kept_bytes'] / 1024:.1f} KB，"
+              f"溢出到磁碟 {s['spilled_bytes'] / 1024:.1f} KB，丟棄 {s['dropped_bytes'] / 1024:.1f} KB")
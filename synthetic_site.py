@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+壓力測試用的合成網站
+
+產生指定規模的本機靜態網站：N 個頁面、互相連結的連結圖（每頁連到下一頁與幾個熱門頁面）、
+可設定數量與大小的圖片（含近似重複的縮小版本與追蹤像素）、延遲載入的圖片，
+以及 Big5/UTF-8 與不同編碼宣告方式（標頭、meta、沒有宣告、標錯）的頁面。
+SyntheticSiteServer 以 aiohttp 提供這個網站，可注入延遲、錯誤率與不回應的請求，
+讓批次爬取、深度爬取與圖片下載在離線環境中以數千頁的規模測試。
+
+用法：
+    python synthetic_site.py generate --pages 2000
+    python synthetic_site.py serve --latency 20-200 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import time
+
+from aiohttp import web
+
+DEFAULT_ROOT = "synthetic_site"
+
+_WORDS = ["電競", "戰隊", "選手", "冠軍", "季後賽", "英雄聯盟", "特戰英豪", "賽事", "轉播", "台北",
+          "颱風", "停班停課", "行政院", "公告", "補助", "申請", "說明會", "科技", "半導體", "晶片",
+          "看板", "推文", "批踢踢", "實業坊", "碁", "裏", "恒", "銹", "政府資料開放", "新聞"]
+
+# Big5 頁面隨機使用其中一種編碼宣告方式
+_BIG5_DECLARATIONS = ["meta", "header", "none", "mislabelled"]
+
+_LAZY_LOADER_JS = """
+<script>
+document.addEventListener('DOMContentLoaded', () => {
+    const observer = new IntersectionObserver((entries) => {
+        for (const entry of entries) {
+            if (!entry.isIntersecting) continue;
+            const img = entry.target;
+            img.src = img.dataset.src;
+            img.classList.remove('lazy');
+            observer.unobserve(img);
+        }
+    }, { rootMargin: '100px' });
+    document.querySelectorAll('img.lazy').forEach((img) => observer.observe(img));
+});
+</script>
+"""
+
+_PLACEHOLDER_GIF = "data:image/gif;base64,R0lGODlhAQABAAAAACH5BAEKAAEALAAAAAABAAEAAAICTAEAOw=="
+
+_CONTENT_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".gif": "image/gif",
+                  ".xml": "application/xml", ".json": "application/json"}
+
+
+def _text(rng, words):
+    return "".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _generate_images(rng, folder, count, size_kb, duplicate_ratio):
+    """以雜訊圖產生 JPEG，部分圖片為其他圖片的縮小版本（測試近似重複過濾）"""
+    from PIL import Image
+
+    images = []
+    for i in range(count):
+        if images and rng.random() < duplicate_ratio:
+            original = rng.choice([img for img in images if not img["duplicate_of"]])
+            with Image.open(os.path.join(folder, original["name"])) as source:
+                image = source.resize((source.width // 2, source.height // 2))
+            duplicate_of = original["name"]
+        else:
+            # 雜訊 JPEG 約每像素 0.5 位元組，依目標大小決定尺寸
+            target = rng.randint(*size_kb) * 1024
+            width = max(16, int((target * 2 * 4 / 3) ** 0.5))
+            height = max(16, width * 3 // 4)
+            image = Image.effect_noise((width, height), rng.randint(20, 80)).convert("RGB")
+            duplicate_of = None
+        name = f"img_{i:05d}.jpg"
+        image.save(os.path.join(folder, name), "JPEG", quality=80)
+        images.append({"name": name, "width": image.width, "height": image.height,
+                       "bytes": os.path.getsize(os.path.join(folder, name)), "duplicate_of": duplicate_of})
+
+    # 1x1 追蹤像素，探測時應該被略過
+    pixel = Image.new("RGB", (1, 1))
+    buffer = io.BytesIO()
+    pixel.save(buffer, "GIF")
+    with open(os.path.join(folder, "pixel.gif"), "wb") as f:
+        f.write(buffer.getvalue())
+    return images
+
+
+def _page_html(page, rng, pages):
+    meta = ""
+    if page["declare"] == "meta":
+        meta = f'<meta charset="{"big5" if page["encoding"] == "big5" else "utf-8"}">'
+    images = "\n".join(
+        f'<figure><img class="lazy" src="{_PLACEHOLDER_GIF}" data-src="/images/{name}" alt="{_text(rng, 2)}"></figure>'
+        if lazy else f'<figure><img src="/images/{name}" alt="{_text(rng, 2)}"></figure>'
+        for name, lazy in page["images"]
+    )
+    if page["tracking_pixel"]:
+        images += '\n<img src="/images/pixel.gif" width="1" height="1" alt="">'
+    links = "\n".join(f'<li><a href="/pages/{target}.html">{pages[target]["title"]}</a></li>'
+                      for target in page["links"])
+    paragraphs = "\n".join(f"<p>{_text(rng, rng.randint(40, 120))}</p>" for _ in range(rng.randint(3, 12)))
+    return f"""<!DOCTYPE html>
+<html lang="zh-Hant">
+<head>{meta}<title>{page['title']}</title></head>
+<body>
+<header><nav><a href="/">首頁</a></nav></header>
+<article>
+<h1>{page['title']}</h1>
+{paragraphs}
+{images}
+</article>
+<ul class="related">
+{links}
+</ul>
+{_LAZY_LOADER_JS if any(lazy for _, lazy in page['images']) else ''}
+</body>
+</html>
+"""
+
+
+def generate_site(root=DEFAULT_ROOT, pages=1000, links_per_page=8, images=300, images_per_page=6,
+                  image_kb=(5, 80), lazy_ratio=0.5, big5_ratio=0.2, duplicate_ratio=0.1,
+                  tracking_ratio=0.2, seed=0):
+    """產生合成網站並回傳 manifest（同時寫到 root/manifest.json）"""
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    # 重新產生時清掉舊的頁面與圖片，避免留下上一次較大規模的檔案
+    for folder in ("pages", "images"):
+        shutil.rmtree(os.path.join(root, folder), ignore_errors=True)
+        os.makedirs(os.path.join(root, folder))
+
+    image_list = _generate_images(rng, os.path.join(root, "images"), images, image_kb, duplicate_ratio)
+
+    page_list = []
+    for i in range(pages):
+        big5 = rng.random() < big5_ratio
+        page_list.append({
+            "path": f"/pages/{i}.html",
+            "title": f"第 {i} 頁 {_text(rng, 3)}",
+            "encoding": "big5" if big5 else "utf-8",
+            "declare": rng.choice(_BIG5_DECLARATIONS) if big5 else rng.choice(["header", "meta"]),
+        })
+
+    for i, page in enumerate(page_list):
+        # 連到下一頁確保全部可達，其餘連結偏向編號小的熱門頁面
+        targets = {(i + 1) % pages}
+        while len(targets) < min(links_per_page, pages - 1):
+            target = int(pages * rng.random() ** 2)
+            if target != i:
+                targets.add(target)
+        page["links"] = sorted(targets)
+        page["images"] = [(rng.choice(image_list)["name"], rng.random() < lazy_ratio)
+                          for _ in range(rng.randint(0, images_per_page * 2))]
+        page["tracking_pixel"] = rng.random() < tracking_ratio
+
+    for i, page in enumerate(page_list):
+        html = _page_html(page, rng, page_list)
+        with open(os.path.join(root, "pages", f"{i}.html"), "wb") as f:
+            f.write(html.encode("cp950" if page["encoding"] == "big5" else "utf-8"))
+
+    index_links = "\n".join(f'<li><a href="{p["path"]}">{p["title"]}</a></li>' for p in page_list[:50])
+    with open(os.path.join(root, "index.html"), "w", encoding="utf-8") as f:
+        f.write(f'<!DOCTYPE html><html lang="zh-Hant"><head><meta charset="utf-8"><title>合成網站</title></head>'
+                f'<body><h1>合成網站（{pages} 頁）</h1><ul>{index_links}</ul></body></html>')
+
+    manifest = {"pages": page_list, "images": image_list, "seed": seed}
+    with open(os.path.join(root, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    total_mb = sum(img["bytes"] for img in image_list) / 1024 / 1024
+    print(f"🏗️ 合成網站: {pages} 頁、{len(image_list)} 張圖片（{total_mb:.1f} MB），"
+          f"Big5 {sum(p['encoding'] == 'big5' for p in page_list)} 頁，"
+          f"耗時 {time.perf_counter() - started:.1f}s → {root}/")
+    return manifest
+
+
+def load_manifest(root=DEFAULT_ROOT):
+    """讀取 generate_site 寫出的 manifest"""
+    with open(os.path.join(root, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class SyntheticSiteServer:
+    """提供合成網站的本機伺服器，可注入延遲、錯誤與不回應的請求"""
+
+    def __init__(self, root=DEFAULT_ROOT, host="127.0.0.1", port=0, latency_ms=(0, 0),
+                 error_rate=0.0, hang_rate=0.0, hang_seconds=30.0, seed=None):
+        self.root = root
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        # 以 503 回應的比例
+        self.error_rate = error_rate
+        # 延遲 hang_seconds 秒才回應的比例（測試逾時處理）
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self._rng = random.Random(seed)
+        self._files = {}
+        self._page_headers = {}
+        self._runner = None
+        self.stats = {"requests": 0, "pages": 0, "images": 0, "errors": 0, "hangs": 0,
+                      "not_found": 0, "bytes_sent": 0}
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def _load(self):
+        # 所有檔案預先讀進記憶體，伺服器本身不成為瓶頸
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(folder, name)
+                url_path = "/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    self._files[url_path] = f.read()
+        self._files["/"] = self._files.get("/index.html", b"")
+        for page in load_manifest(self.root)["pages"]:
+            charset = {"header": page["encoding"], "mislabelled": "utf-8"}.get(page["declare"])
+            self._page_headers[page["path"]] = f"text/html; charset={charset}" if charset else "text/html"
+
+    def _content_type(self, path):
+        if path in self._page_headers:
+            return self._page_headers[path]
+        if path.endswith(".html") or path == "/":
+            return "text/html; charset=utf-8"
+        return _CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+
+    async def _handle(self, request):
+        self.stats["requests"] += 1
+        path = request.path
+        low, high = self.latency_ms
+        if high > 0:
+            await asyncio.sleep(self._rng.uniform(low, high) / 1000)
+
+        roll = self._rng.random()
+        if roll < self.hang_rate:
+            self.stats["hangs"] += 1
+            await asyncio.sleep(self.hang_seconds)
+        elif roll < self.hang_rate + self.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=503, headers={"Retry-After": "1"}, text="injected error")
+
+        body = self._files.get(path)
+        if body is None:
+            self.stats["not_found"] += 1
+            return web.Response(status=404, text="not found")
+        if path.startswith("/pages/"):
+            self.stats["pages"] += 1
+        elif path.startswith("/images/"):
+            self.stats["images"] += 1
+        self.stats["bytes_sent"] += len(body)
+        return web.Response(body=body, headers={"Content-Type": self._content_type(path)})
+
+    async def start(self):
+        self._load()
+        app = web.Application()
+        app.router.add_route("GET", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 時取得實際綁定的連接埠
+        self.port = site._server.sockets[0].getsockname()[1]
+        print(f"🌐 合成網站伺服器: {self.base_url}（{len(self._files)} 個檔案）")
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def page_urls(self, limit=None):
+        """所有頁面的完整 URL"""
+        pages = load_manifest(self.root)["pages"][:limit]
+        return [self.base_url + page["path"] for page in pages]
+
+    def image_list(self, limit=None):
+        """所有頁面引用的圖片（download_images_batch 使用的格式，去除重複 URL）"""
+        seen = {}
+        for page in load_manifest(self.root)["pages"]:
+            for name, _ in page["images"]:
+                seen.setdefault(name, {"src": f"{self.base_url}/images/{name}", "alt": name})
+            if page["tracking_pixel"]:
+                seen.setdefault("pixel.gif", {"src": f"{self.base_url}/images/pixel.gif", "alt": "pixel"})
+        return list(seen.values())[:limit]
+
+    def print_report(self):
+        """顯示伺服器收到的請求與注入的錯誤"""
+        s = self.stats
+        print(f"\n🌐 合成網站伺服器: 請求 {s['requests']}（頁面 {s['pages']}、圖片 {s['images']}），"
+              f"注入錯誤 {s['errors']}、不回應 {s['hangs']}、404 {s['not_found']}，"
+              f"傳送 {s['bytes_sent'] / 1024 / 1024:.1f} MB")
+
+
+def parse_range(value):
+    """把 "20-200" 或 "50" 轉成 (下限, 上限)"""
+    low, _, high = value.partition("-")
+    return float(low), float(high or low)
+
+
+async def _serve(options):
+    server = SyntheticSiteServer(options.root, port=options.port, latency_ms=parse_range(options.latency),
+                                 error_rate=options.error_rate, hang_rate=options.hang_rate)
+    async with server:
+        try:
+            await asyncio.Event().wait()
+        finally:
+            server.print_report()
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description="壓力測試用的合成網站")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="產生網站")
+    generate.add_argument("--root", default=DEFAULT_ROOT)
+    generate.add_argument("--pages", type=int, default=1000)
+    generate.add_argument("--images", type=int, default=300)
+    generate.add_argument("--links-per-page", type=int, default=8)
+    generate.add_argument("--big5-ratio", type=float, default=0.2)
+    generate.add_argument("--lazy-ratio", type=float, default=0.5)
+    generate.add_argument("--seed", type=int, default=0)
+
+    serve = commands.add_parser("serve", help="啟動本機伺服器")
+    serve.add_argument("--root", default=DEFAULT_ROOT)
+    serve.add_argument("--port", type=int, default=8800)
+    serve.add_argument("--latency", default="0", help="每個請求的延遲毫秒數，例如 20-200")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="以 503 回應的比例")
+    serve.add_argument("--hang-rate", type=float, default=0.0, help="30 秒後才回應的比例")
+
+    options = parser.parse_args()
+    if options.command == "generate":
+        generate_site(options.root, pages=options.pages, images=options.images,
+                      links_per_page=options.links_per_page, big5_ratio=options.big5_ratio,
+                      lazy_ratio=options.lazy_ratio, seed=options.seed)
+    else:
+        try:
+            asyncio.run(_serve(options))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
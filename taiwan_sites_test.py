@@ -5,8 +5,59 @@
 
 import asyncio
 import json
+import sys
 from crawl4ai import AsyncWebCrawler
 from crawl4ai.extraction_strategy import JsonCssExtractionStrategy
+from resource_blocking import ResourceBlocker
+from result_export import ResultExporter
+from resilience import HostResilience, crawl_with_resilience
+from incremental_crawl import FingerprintStore, IncrementalCrawler, is_unchanged
+from crawl_metrics import PhaseTimer, enable_metrics_from_env
+from crawl_tracing import enable_tracing_from_env, instrument, write_trace
+from page_pool import PagePool
+from search_index import SearchIndex
+from near_duplicates import NearDuplicateDetector
+from charset_resolver import CharsetResolver
+from feed_discovery import DiscoveryState, FeedDiscovery
+from http_session import close_shared_sessions
+
+# 所有測試共用：同一主機連續逾時後直接略過，不再逐一等待完整逾時
+resilience = HostResilience()
+# PTT 與政府網站可能是 Big5 或標錯編碼，判斷結果依網域快取
+charsets = CharsetResolver()
+# --discover：從 sitemap/RSS 找出上次執行後的新文章直接爬取，不再渲染首頁
+DISCOVER = "--discover" in sys.argv
+discovery = FeedDiscovery(DiscoveryState(), max_urls=5) if DISCOVER else None
+
+async def crawl_targets(sites):
+    """產生要爬取的 (名稱, URL)：探索模式下邊解析 sitemap/RSS 邊產生新文章，找不到來源時退回首頁"""
+    for site in sites:
+        name, url = site[0], site[1]
+        if discovery is None:
+            yield name, url
+            continue
+        feeds = site[2] if len(site) > 2 else None
+        queue = asyncio.Queue()
+        producer = asyncio.create_task(discovery.fill_queue(url, queue, feeds))
+        found = 0
+        while (article_url := await queue.get()) is not None:
+            found += 1
+            yield f"{name} #{found}", article_url
+        try:
+            await producer
+        except Exception as e:
+            # 單一網站的探索錯誤不中斷其他網站
+            print(f"   ⚠️ {name} 探索失敗: {type(e).__name__}: {e}")
+        if not discovery.found_sources(url):
+            print(f"   🗺️ {name} 沒有可用的 sitemap/RSS，改爬首頁")
+            yield name, url
+        elif not found:
+            print(f"   🗺️ {name} 沒有新文章")
+
+def retry_later(url):
+    """探索模式下爬取失敗的文章，下次執行時重新產生"""
+    if discovery is not None:
+        discovery.retry_later(url)
 
 async def taiwan_news_test():
     """台灣新聞網站測試"""
@@ -18,11 +69,39 @@ async def taiwan_news_test():
         ("聯合新聞網", "https://udn.com"),
     ]
     
-    async with AsyncWebCrawler() as crawler:
-        for name, url in taiwan_news_sites:
+    # 只需要文字內容，圖片、字型與廣告腳本在送出前就中止
+    blocker = ResourceBlocker("text-only")
+    # 首頁內容與上次相同時，略過 markdown 產生與匯出，直接沿用上次結果
+    incremental = IncrementalCrawler(FingerprintStore())
+    # 每頁完成就加入本機全文索引，之後可用 python search_index.py 查詢
+    index = SearchIndex()
+    # 各家轉載同一則通訊社稿件時只匯出第一份
+    dedup = NearDuplicateDetector()
+    
+    async with AsyncWebCrawler() as crawler, ResultExporter("exports", "taiwan_news") as exporter:
+        blocker.attach(crawler)
+        incremental.attach(crawler)
+        PhaseTimer().attach(crawler)
+        instrument(crawler)
+        # 依序爬取只需要一個預熱好的分頁，每個網站不必再開新分頁
+        pool = PagePool(size=1)
+        pool.attach(crawler)
+        await pool.warm()
+        async for name, url in crawl_targets(taiwan_news_sites):
             try:
                 print(f"📰 正在爬取 {name}: {url}")
-                result = await crawler.arun(url=url)
+                result = await crawl_with_resilience(crawler, url, resilience, run=incremental.arun)
+                if not result.success:
+                    retry_later(url)
+                if is_unchanged(result):
+                    print(f"   ♻️ {name} 內容未變更，沿用上次結果")
+                elif dedup.check_result(result):
+                    print(f"   🪞 {name} 與 {result.metadata['near_duplicate_of']} 內容近似"
+                          f"（{result.metadata['near_duplicate_similarity']:.0%}），略過匯出")
+                else:
+                    # 每頁完成就寫出，不在記憶體中累積結果
+                    exporter.write_result(result, include_markdown=True)
+                    index.add_result(result)
                 
                 print(f"   ✅ {name} 爬取成功")
                 print(f"   📄 標題: {result.metadata.get('title', 'N/A')}")
@@ -36,17 +115,29 @@ async def taiwan_news_test():
                 print()
                 
             except Exception as e:
+                retry_later(url)
                 print(f"   ❌ {name} 爬取失敗: {str(e)}")
                 print()
+    
+    blocker.print_report()
+    pool.print_report()
+    exporter.print_summary()
+    incremental.print_report()
+    incremental.store.close()
+    dedup.print_report()
+    index.print_summary()
+    index.close()
 
 async def ptt_test():
     """PTT 網站測試"""
     print("💬 開始 PTT 網站測試...")
     
     async with AsyncWebCrawler() as crawler:
+        instrument(crawler)
+        charsets.attach(crawler)
         try:
             print("📍 正在爬取 PTT 首頁...")
-            result = await crawler.arun(url="https://www.ptt.cc/bbs/index.html")
+            result = await crawl_with_resilience(crawler, "https://www.ptt.cc/bbs/index.html", resilience)
             
             print(f"✅ PTT 爬取成功")
             print(f"📄 標題: {result.metadata.get('title', 'N/A')}")
@@ -70,10 +161,15 @@ async def government_site_test():
     ]
     
     async with AsyncWebCrawler() as crawler:
+        instrument(crawler)
+        charsets.attach(crawler)
+        pool = PagePool(size=1)
+        pool.attach(crawler)
+        await pool.warm()
         for name, url in gov_sites:
             try:
                 print(f"🏛️ 正在爬取 {name}: {url}")
-                result = await crawler.arun(url=url)
+                result = await crawl_with_resilience(crawler, url, resilience)
                 
                 print(f"   ✅ {name} 爬取成功")
                 print(f"   📄 標題: {result.metadata.get('title', 'N/A')}")
@@ -94,10 +190,14 @@ async def ecommerce_test():
     ]
     
     async with AsyncWebCrawler() as crawler:
+        instrument(crawler)
+        pool = PagePool(size=1)
+        pool.attach(crawler)
+        await pool.warm()
         for name, url in ecommerce_sites:
             try:
                 print(f"🛒 正在爬取 {name}: {url}")
-                result = await crawler.arun(url=url)
+                result = await crawl_with_resilience(crawler, url, resilience)
                 
                 print(f"   ✅ {name} 爬取成功")
                 print(f"   📄 標題: {result.metadata.get('title', 'N/A')}")
@@ -112,16 +212,25 @@ async def tech_blog_test():
     """科技部落格測試"""
     print("💻 開始科技部落格測試...")
     
+    # 第三欄是探索模式使用的 RSS 來源
     tech_blogs = [
-        ("iThome", "https://www.ithome.com.tw"),
-        ("科技新報", "https://technews.tw"),
+        ("iThome", "https://www.ithome.com.tw", ["https://www.ithome.com.tw/rss"]),
+        ("科技新報", "https://technews.tw", ["https://technews.tw/feed/"]),
     ]
+    index = SearchIndex()
     
     async with AsyncWebCrawler() as crawler:
-        for name, url in tech_blogs:
+        instrument(crawler)
+        pool = PagePool(size=1)
+        pool.attach(crawler)
+        await pool.warm()
+        async for name, url in crawl_targets(tech_blogs):
             try:
                 print(f"💻 正在爬取 {name}: {url}")
-                result = await crawler.arun(url=url)
+                result = await crawl_with_resilience(crawler, url, resilience)
+                if not result.success:
+                    retry_later(url)
+                index.add_result(result)
                 
                 print(f"   ✅ {name} 爬取成功")
                 print(f"   📄 標題: {result.metadata.get('title', 'N/A')}")
@@ -129,8 +238,12 @@ async def tech_blog_test():
                 print()
                 
             except Exception as e:
+                retry_later(url)
                 print(f"   ❌ {name} 爬取失敗: {str(e)}")
                 print()
+    
+    index.print_summary()
+    index.close()
 
 async def main():
     """主函數"""
@@ -138,6 +251,11 @@ async def main():
     print("🇹🇼 台灣網站爬取測試程式")
     print("=" * 60)
     
+    # 設定 CRAWL_METRICS_PORT 時提供 Prometheus 指標端點
+    enable_metrics_from_env()
+    # 設定 CRAWL_TRACE_FILE 時記錄每次爬取的 span 並寫成追蹤檔
+    enable_tracing_from_env()
+    
     try:
         await taiwan_news_test()
         await ptt_test()
@@ -145,6 +263,11 @@ async def main():
         await ecommerce_test()
         await tech_blog_test()
         
+        resilience.print_report()
+        charsets.print_report()
+        if discovery is not None:
+            discovery.print_report()
+        
         print("=" * 60)
         print("🎉 所有台灣網站測試完成！")
         print("=" * 60)
@@ -153,6 +276,11 @@ async def main():
         print(f"❌ 測試過程中發生錯誤: {str(e)}")
         import traceback
         traceback.print_exc()
+    finally:
+        write_trace()
+        if discovery is not None:
+            discovery.state.close()
+        await close_shared_sessions()
 
 if __name__ == "__main__":
     asyncio.run(main())